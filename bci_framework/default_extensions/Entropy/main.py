@@ -1,12 +1,11 @@
 from bci_framework.extensions.visualizations import EEGStream, Widgets
 from bci_framework.extensions.data_analysis import loop_consumer
+from bci_framework.extensions.data_analysis.spectral import band_masks
 from bci_framework.extensions import properties as prop
 
 import numpy as np
 import logging
 
-from scipy.fftpack import rfft, rfftfreq
-
 from cycler import cycler
 import matplotlib 
 
@@ -71,23 +70,23 @@ class Stream(EEGStream, Widgets):
         
         # logging.warning(f'{self.buffer_eeg.shape}, {eeg.shape}')
         
-        # SE      
-        EEG_ = np.abs(rfft(eeg, axis=1))  
-        W = rfftfreq(EEG_.shape[1], 1/prop.SAMPLE_RATE)
-        EEG = EEG_[:,abs(W-0.8).argmin():abs(W-32).argmin()]  # [.8 Hz, 32 Hz]
+        # The masks of the bands are cached for the window length
+        EEG_ = np.abs(np.fft.rfft(eeg, axis=1))
+        masks = band_masks(eeg.shape[1], prop.SAMPLE_RATE, [(0.8, 32), (0.8, 47)]).astype(bool)
+        N = len(EEG_)
+
+        # SE  [.8 Hz, 32 Hz]
+        EEG = EEG_[:, masks[0]]
         p = EEG / EEG.sum(axis=1)[:,None]
         E = np.sum(p * np.log(1/p), axis=1)
-        N = len(EEG[:,abs(W-0.8).argmin():abs(W-47).argmin()])
 
         # logging.warning(f'{E}')
         
         SE = E / np.log(N) 
         
         
-        # RE
-        # EEG = np.abs(rfft(eeg, axis=1))
-        W = rfftfreq(EEG_.shape[1], 1/prop.SAMPLE_RATE)
-        EEG = EEG_[:,abs(W-0.8).argmin():abs(W-47).argmin()]  # [.8 Hz, 47 Hz]
+        # RE  [.8 Hz, 47 Hz]
+        EEG = EEG_[:, masks[1]]
         p = EEG / EEG.sum(axis=1)[:,None]
         E = np.sum(p * np.log(1/p), axis=1)
         # N = len(EEG[abs(W2-0.8).argmin():abs(W2-47).argmin()])
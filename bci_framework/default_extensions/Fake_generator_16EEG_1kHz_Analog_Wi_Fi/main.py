@@ -1,8 +1,8 @@
 from bci_framework.extensions.data_analysis import DataAnalysis, loop_consumer
 import logging
-import pickle
 from kafka import KafkaProducer
 from bci_framework.extensions import properties as prop
+from bci_framework.extensions.serializers import serializer
 import time
 import numpy as np
 from datetime import datetime, timedelta
@@ -37,8 +37,7 @@ class Analysis(DataAnalysis):
         
         self.kafka_producer = KafkaProducer(
                 bootstrap_servers=[f'{prop.HOST}:9092'],
-                compression_type='gzip',
-                value_serializer=pickle.dumps,
+                value_serializer=serializer('gzip'),
             )
         
         self.producer()
@@ -12,9 +12,9 @@ email: ide@utp.edu.co
 
 """
 # Import the necessary libraries 
+from functools import lru_cache
 import numpy as np
 import scipy.spatial as sp_spatial
-from scipy.linalg import fractional_matrix_power
 from scipy import signal
 from scipy import interpolate
 from joblib import Parallel,delayed
@@ -23,6 +23,31 @@ from joblib import Parallel,delayed
 # Kernel-based Renyi transfer entropy 
 # =============================================================================
 
+def delayEmbedding(x,tau,dim):
+    """
+    Time-delay embedding of x, the columns hold x(t), x(t-tau), ..., x(t-(dim-1)*tau)
+    
+    Parameters
+    ----------
+    x: ndarray of shape (samples,)
+        Input time series 
+    tau: int
+        Embedding delay 
+    dim: int
+        Embedding dimension 
+
+    Returns
+    -------
+    x_emb: ndarray of shape (samples-(tau*(dim-1)),dim)
+        Time embedded time series 
+    """
+    T = np.size(x)
+    L = T -(dim-1)*tau
+    firstP = T - L
+    ind = firstP + np.arange(L).reshape(-1,1) - tau*np.arange(dim)
+    x_emb = np.asarray(x,dtype=float).flatten()[ind]
+    return x_emb
+
 def embeddingX(x,tau,dim,u):
     """
     Time-delay embbeding of the source time series x
@@ -43,14 +68,7 @@ def embeddingX(x,tau,dim,u):
     X_emb: ndarray of shape (samples-(tau*(dim-1))-u,dim)
         Time embedded source time series 
     """
-    T = np.size(x)
-    L = T -(dim-1)*tau
-    firstP = T - L
-    X_emb = np.zeros((L,dim))
-    for i in range(L):
-      for j in range(dim):
-        X_emb[i,j] = x[i+firstP-(j*tau)]
-    
+    X_emb = delayEmbedding(x,tau,dim)
     X_emb = X_emb[0:-u,:]
     return X_emb
 
@@ -79,11 +97,7 @@ def embeddingY(y,tau,dim,u):
     T = np.size(y)
     L = T -(dim-1)*tau
     firstP = T - L
-    Y_emb = np.zeros((L,dim))
-    
-    for i in range(L):
-      for j in range(dim):
-        Y_emb[i,j] = y[i+firstP-(j*tau)]
+    Y_emb = delayEmbedding(y,tau,dim)
     
     y_t = y[firstP+u::] 
     y_t = y_t.reshape(y_t.shape[0],1)
@@ -106,20 +120,25 @@ def GaussianKernel(X,sig_scale=1.0):
     K: ndarray of shape (samples,samples)
         Gaussian kernel matrix
     """
-    utri_ind =  np.triu_indices(X.shape[0], 1)
-    dist = sp_spatial.distance.cdist(X,X,'euclidean')
-    sigma = sig_scale*np.median(dist[utri_ind])
-    K = np.exp(-1*(dist**2)/(2*sigma**2))
+    # Condensed distances, each pair is computed only once 
+    dist = sp_spatial.distance.pdist(X,'euclidean')
+    sigma = sig_scale*np.median(dist)
+    K = sp_spatial.distance.squareform(np.exp(-1*(dist**2)/(2*sigma**2)))
+    np.fill_diagonal(K,1)
     return K
 
 def kernelRenyiEntropy(K_lst,alpha):
     """
     Compute Renyi's entropy from kernel matrices 
     
+    The trace of the power of the normalized kernel is computed from its 
+    eigenvalues (the kernel is symmetric positive semidefinite), and for 
+    alpha = 2 from the sum of its squared entries 
+    
     Parameters
     ----------
     K_lst: list
-        List holding kernel matrices [ndarrays of shape (channels,channels)]
+        List holding kernel matrices [ndarrays of shape (samples,samples)]
     alpha: int or float
         Order of Renyi's entropy
         
@@ -128,17 +147,17 @@ def kernelRenyiEntropy(K_lst,alpha):
     h: float
         Kernel-based Renyi's transfer entropy, TE(x->y)
     """
-    if len(K_lst) == 1:
-      K = K_lst[0]
-    elif len(K_lst) == 2:
-      K = K_lst[0]*K_lst[1]
-    else:
-      K = K_lst[0]*K_lst[1]*K_lst[2]     
+    K = K_lst[0]
+    for K_aux in K_lst[1:]:
+        K = K*K_aux
     K = K/np.trace(K) 
-    if alpha%1==0:
-        h = np.real((1/(1-alpha))*np.log2(np.trace(np.linalg.matrix_power(K,alpha))))
+    if alpha == 2:
+        # trace(K @ K) for a symmetric K
+        h = -np.log2(np.sum(K**2))
     else:
-        h = np.real((1/(1-alpha))*np.log2(np.trace(fractional_matrix_power(K,alpha))))
+        # trace(K^alpha), the negative eigenvalues are rounding errors 
+        eig = np.clip(np.linalg.eigvalsh(K),0,None)
+        h = (1/(1-alpha))*np.log2(np.sum(eig**alpha))
     return h
 
 def kernelTransferEntropy(x,y,dim,tau,u,alpha,sig_scale=1.0): 
@@ -219,67 +238,103 @@ def kernelTransferEntropy_PAC_Ch(X,ch_pair,Dim,Tau,U,alpha,freq_ph,freq_amp,time
         entropy
     """
     
-    X = X[[ch_pair[0],ch_pair[1]],:]
-    tau = Tau[ch_pair[1]]
-    dim = Dim[ch_pair[1]]
-    u = U[ch_pair[1]]
+    fs = 1000/np.mean(np.diff(time.flatten())) # ms to Hz
+    TE_pac = kernelTransferEntropy_PAC(X,[ch_pair],Dim,Tau,U,alpha,freq_ph,freq_amp,fs,sig_scale)[0]
+    return TE_pac
+
+def kernelTransferEntropy_PAC(X,ch_pair_lst,Dim,Tau,U,alpha,freq_ph,freq_amp,fs,sig_scale=1.0):
+    """
+    Compute directed phase-amplitude interactions through kernel-based Renyi's phase transfer
+    entropy for multiple channel pairs 
+    
+    The wavelet decompositions of all the channels are computed at once, the kernels of the 
+    target embeddings are shared by all the sources of each target, and the kernels of the 
+    source embeddings by all the amplitude frequencies and targets with the same embedding 
+    parameters. Only the source kernels of the current phase frequency are kept
     
+    Parameters
+    ----------
+    X: ndarray of shape (channels,samples)
+        Input time series (number of channels x number of samples)
+    ch_pair_lst: list 
+        Channel pairs of interest [source,target]
+    Dim: ndarray of shape (channels,)
+        Embedding dimension for each channel
+    Tau: ndarray of shape (channels,)
+        Embedding delay for each channel
+    U: ndarray of shape (channels,)
+        Interaction times for each channel pair and direction of interaction
+    alpha: int or float
+        Order of Renyi's entropy
+    freq_ph: ndarray of shape (frequencies_ph,)
+        Frequencies of interest for phase extraction, in Hz
+    freq_amp: ndarray of shape (frequencies_amp,)
+        Frequencies of interest for amplitude extraction, in Hz
+    fs: float
+        Sampling frequency
+    sig_scale: float
+        Parameter to scale the kernel's bandwidth  
+
+    Returns
+    -------
+    TE_pac: ndarray of shape (pairs,frequencies_ph,frequencies_amp) 
+        Directed PAC estimated through kernel-based Renyi's phase transfer
+        entropy for each channel pair 
+    """
     num_freq_ph = np.size(freq_ph)
     num_freq_amp = np.size(freq_amp)
-    TE_pac = np.zeros((num_freq_ph,num_freq_amp))
+    TE_pac = np.zeros((len(ch_pair_lst),num_freq_ph,num_freq_amp))
     
-    src = X[0,:]
-    src = src.reshape((1,len(src)))
-    trg = X[1,:]
-    trg = trg.reshape((1,len(trg)))
+    src_ch = sorted(set(int(ch[0]) for ch in ch_pair_lst))
+    trg_ch = sorted(set(int(ch[1]) for ch in ch_pair_lst))
 
-    # Wavelet decomposition 
-    src_ph = Wavelet_Trial_Dec(src,time,freq_ph,component='phase')[0,:,:]
-    src_ph = src_ph.T
-    trg_amp = Wavelet_Trial_Dec(trg,time,freq_amp,component='amp')[0,:,:]
-    trg_amp = trg_amp.T
-    
-    trg_amp_ph_lst = []
-    for kk in range(num_freq_amp):
-        trg_amp_aux = trg_amp[kk,:].reshape((1,len(trg_amp[kk,:])))
-        if (trg.shape[1] % 2) == 0:
-            time = time.flatten()
-            trg_amp_ph_lst.append(np.transpose(Wavelet_Trial_Dec(trg_amp_aux,time[:-1],freq_ph,component='phase')[0,:,:]))
-        else:
-            trg_amp_ph_lst.append(np.transpose(Wavelet_Trial_Dec(trg_amp_aux,time,freq_ph,component='phase')[0,:,:]))
-    
-    for j in range(num_freq_amp):
-        # Embedding parameters 
-        tau = int(tau)
-        dim = int(dim)  
+    # Wavelet decomposition, all the channels and frequencies at once
+    src_ph = wavelet_bank(fs,X.shape[1],freq_ph).decompose(X[src_ch,:],component='phase')
+    trg_amp = wavelet_bank(fs,X.shape[1],freq_amp).decompose(X[trg_ch,:],component='amp')
+    
+    # Phase of the amplitude envelopes, of shape (targets,frequencies_amp,samples,frequencies_ph)
+    trg_amp = trg_amp.transpose(0,2,1).reshape(len(trg_ch)*num_freq_amp,-1)
+    trg_amp_ph = wavelet_bank(fs,trg_amp.shape[1],freq_ph).decompose(trg_amp,component='phase')
+    trg_amp_ph = trg_amp_ph.reshape(len(trg_ch),num_freq_amp,-1,num_freq_ph)
+    
+    # Targets with the same embedding parameters share the source kernels
+    groups = {}
+    for t,trg in enumerate(trg_ch):
+        # Embedding parameters and delay time 
+        groups.setdefault((int(Tau[trg]),int(Dim[trg]),int(U[trg])),[]).append(t)
+    
+    for (tau,dim,u),trg_idx in groups.items():
         for i in range(num_freq_ph):
-            # Delay time 
-            u = int(u)
-        
-            # Target channel  
-            y = trg_amp_ph_lst[j][i,:]
-            # Source channel 
-            x = src_ph[i,:]
-            
-            # Time embeddings for y 
-            Y_emb, y_t = embeddingY(y,tau,dim,u)
-            # Kernels for y's time embeddings 
-            K_Y_emb = GaussianKernel(Y_emb,sig_scale)
-            K_y_t = GaussianKernel(y_t,sig_scale)   
-            # Entropies 
-            h3 = kernelRenyiEntropy([K_Y_emb,K_y_t],alpha)
-            h4 = kernelRenyiEntropy([K_Y_emb],alpha)
-    
-            # Time embedding for x 
-            X_emb = embeddingX(x,tau,dim,u)
-            # Kernels for x's time embedding
-            K_X_emb = GaussianKernel(X_emb,sig_scale)
-            # Entropies 
-            h1 = kernelRenyiEntropy([K_X_emb,K_Y_emb],alpha)
-            h2 = kernelRenyiEntropy([K_X_emb,K_Y_emb,K_y_t],alpha)
-           
-            # Transfer entropy
-            TE_pac[i,j] =  h1 - h2 + h3 - h4
+            # Kernels for x's time embeddings (source channels), only needed for this phase frequency 
+            K_X_lst = {}
+            for t in trg_idx:
+                pairs = [(p,src_ch.index(int(ch[0]))) for p,ch in enumerate(ch_pair_lst) if int(ch[1]) == trg_ch[t]]
+                for j in range(num_freq_amp):
+                    # Target channel  
+                    y = trg_amp_ph[t,j,:,i]
+                    
+                    # Time embeddings for y 
+                    Y_emb, y_t = embeddingY(y,tau,dim,u)
+                    # Kernels for y's time embeddings 
+                    K_Y_emb = GaussianKernel(Y_emb,sig_scale)
+                    K_y_t = GaussianKernel(y_t,sig_scale)   
+                    # Entropies 
+                    h3 = kernelRenyiEntropy([K_Y_emb,K_y_t],alpha)
+                    h4 = kernelRenyiEntropy([K_Y_emb],alpha)
+                    
+                    for p,s in pairs:
+                        # Kernel for x's time embedding (source channel), computed once per source 
+                        if s not in K_X_lst:
+                            X_emb = embeddingX(src_ph[s,:,i],tau,dim,u)
+                            K_X_lst[s] = GaussianKernel(X_emb,sig_scale)
+                        K_X_emb = K_X_lst[s]
+                        # Entropies 
+                        K_XY = K_X_emb*K_Y_emb
+                        h1 = kernelRenyiEntropy([K_XY],alpha)
+                        h2 = kernelRenyiEntropy([K_XY,K_y_t],alpha)
+                        
+                        # Transfer entropy
+                        TE_pac[p,i,j] =  h1 - h2 + h3 - h4
             
     return TE_pac
 
@@ -360,12 +415,7 @@ def cao_criterion(x,d_max,tau):
         T = np.size(x)
         L = T-(d*tau)
         if L>0:
-            FirstP = T-L
-            x_emb = np.zeros((L,d+1))
-            for ii in range(0,L):
-                for jj in range(0,d+1): 
-                    x_emb[ii,jj] = x[ii+FirstP-(jj*tau)]
-            x_emb_lst.append(x_emb)
+            x_emb_lst.append(delayEmbedding(x,tau,d+1))
     
     d_aux = len(x_emb_lst)
     E = np.zeros(d_aux-1)
@@ -515,7 +565,7 @@ def CFD_Ch(X,ch_pair,freq_ph,freq_amp,time,fs):
     trg = trg.reshape((1,len(trg)))
     
     # Wavelet decomposition 
-    trg_amp = Wavelet_Trial_Dec(trg,time,freq_amp,component='amp')[0,:,:]
+    trg_amp = wavelet_bank(fs,trg.shape[1],freq_amp).decompose(trg,component='amp')[0,:,:]
     trg_amp = trg_amp.T
 
     # CFD
@@ -534,8 +584,8 @@ def Morlet_Wavelet(data,time,freq):
     
     Parameters
     ----------
-    data: ndarray of shape (samples,)
-        Input signal 
+    data: ndarray of shape (samples,) or (signals,samples)
+        Input signal, or signals decomposed at once 
     time: ndarray of shape (samples,)
         Time vector (must be sampled at the sampling frequency of data, 
         best practice is to have time=0 at the center of the wavelet)
@@ -546,65 +596,31 @@ def Morlet_Wavelet(data,time,freq):
     -------
     dataW: dict of keys {'amp','filt','phase','f'}
         Dictionary containing the Morlet wavelet decomposition of data
-        'amp': ndarray of shape (frequencies,num_samples) holding the amplitude envelopes at each freq
-        'filt': ndarray of shape (frequencies,num_samples) holding the filtered signals at each freq
-        'phase': ndarray of shape (frequencies,num_samples) holding the phase time series at each freq
+        'amp': ndarray of shape ([signals,]frequencies,num_samples) holding the amplitude envelopes at each freq
+        'filt': ndarray of shape ([signals,]frequencies,num_samples) holding the filtered signals at each freq
+        'phase': ndarray of shape ([signals,]frequencies,num_samples) holding the phase time series at each freq
         'f': ndarray of shape (frequencies,) holding the evaluated frequencies in Hz
         (If samples is odd, num_samples = samples, otherwise num_samples = samples-1)
     """
-    # =============================================================================
-    # Create the Morlet wavelets
-    # =============================================================================
-    num_freq = len(freq); 
-    cmw = np.zeros([data.shape[0],num_freq],dtype = 'complex_')
-    
-    # Number of cycles in the wavelets 
-    range_cycles = [3,10]
-    max_freq = 60 
-    freq_vec = np.arange(1,max_freq+1)
-    nCycles_aux = np.logspace(np.log10(range_cycles[0]),np.log10(range_cycles[-1]),len(freq_vec))
-    nCycles = np.array([nCycles_aux[np.argmin(np.abs(freq_vec - freq[i]))] 
-                        for i in range(num_freq)])
-    
-    for ii in range(num_freq): 
-        # create complex sine wave
-        sine_wave = np.exp(1j*2*np.pi*freq[ii]*time)
-        
-        # create Gaussian window
-        s = nCycles[ii]/(2*np.pi*freq[ii]) #this is the standard deviation of the gaussian
-        gaus_win  = np.exp((-time**2)/(2*s**2))
-        
-        # now create Morlet wavelet
-        cmw[:,ii] = sine_wave*gaus_win
-        
-    # =============================================================================
-    # Convolution 
-    # =============================================================================
-    
     # Define convolution parameters 
-    nData = len(data)
-    nKern = cmw.shape[0]
+    nData = data.shape[-1]
+    nKern = len(time)
     nConv = nData + nKern - 1
-    half_wav = int(np.floor(cmw.shape[0]/2)+1)
+    half_wav = int(np.floor(nKern/2)+1)
     
-    # FFTs
+    # FFT of wavelets
+    cmwX = Morlet_Kernels(time,freq,nConv)
     
-    # FFT of wavelet, and amplitude-normalize in the frequency domain
-    cmwX = np.fft.fft(cmw,nConv,axis=0)
-    cmwX = cmwX/np.max(cmwX,axis=0)
-        
-    # FFT of data
-    dataX = np.fft.fft(data,nConv)
-    dataX = np.repeat(dataX.reshape([-1,1]),num_freq,axis=1)
+    # FFT of data, all the signals at once 
+    dataX = np.fft.fft(data,nConv,axis=-1)
     
-    # Convolution...
-    data_wav = np.fft.ifft(dataX*cmwX,axis=0)
+    # Convolution... (signals x frequencies x nConv)
+    data_wav = np.fft.ifft(dataX[...,np.newaxis,:]*cmwX.T,axis=-1)
     
     # Cut 1/2 of the length of the wavelet from the beginning and from the end
-    data_wav = data_wav[half_wav-2:-half_wav,:]
+    data_wav = data_wav[...,half_wav-2:-half_wav]
     
     # Extract filtered data, amplitude and phase 
-    data_wav = data_wav.T
     dataW = {}
     dataW['filt'] = np.real(data_wav)
     dataW['amp'] = np.abs(data_wav)
@@ -613,9 +629,55 @@ def Morlet_Wavelet(data,time,freq):
     
     return dataW
 
+def Morlet_Kernels(time,freq,nConv):
+    """
+    FFTs of the Morlet wavelets, amplitude-normalized in the frequency domain 
+    
+    Parameters
+    ----------
+    time: ndarray of shape (samples,)
+        Time vector in seconds, with time=0 at the center of the wavelet
+    freq: ndarray of shape (frequencies,)
+        Frequencies to evaluate in Hz
+    nConv: int
+        Length of the FFTs (length of the convolution)
+        
+    Returns
+    -------
+    cmwX: ndarray of shape (nConv,frequencies)
+        FFTs of the wavelets 
+    """
+    num_freq = len(freq); 
+    
+    # Number of cycles in the wavelets 
+    range_cycles = [3,10]
+    max_freq = 60 
+    freq_vec = np.arange(1,max_freq+1)
+    nCycles_aux = np.logspace(np.log10(range_cycles[0]),np.log10(range_cycles[-1]),len(freq_vec))
+    nCycles = np.array([nCycles_aux[np.argmin(np.abs(freq_vec - freq[i]))] 
+                        for i in range(num_freq)])
+    
+    # create complex sine waves (samples x frequencies)
+    f = np.asarray(freq,dtype=float).reshape(1,-1)
+    t = np.asarray(time,dtype=float).reshape(-1,1)
+    sine_wave = np.exp(1j*2*np.pi*f*t)
+    
+    # create Gaussian windows
+    s = nCycles/(2*np.pi*f) #this is the standard deviation of the gaussian
+    gaus_win  = np.exp((-t**2)/(2*s**2))
+    
+    # now create Morlet wavelets
+    cmw = sine_wave*gaus_win
+    
+    # FFT of wavelet, and amplitude-normalize in the frequency domain
+    cmwX = np.fft.fft(cmw,nConv,axis=0)
+    cmwX = cmwX/np.max(cmwX,axis=0)
+    return cmwX
+
 def Wavelet_Trial_Dec(data,time,freq,component ='phase'):
     """
-    Morlet wavelet decomposition for multiple channels 
+    Morlet wavelet decomposition for multiple channels (the wavelets are created in 
+    each call, see WaveletBank to reuse them)
     
     Parameters
     ----------
@@ -645,28 +707,151 @@ def Wavelet_Trial_Dec(data,time,freq,component ='phase'):
     t = t - t[0]
     t = t-(t[-1]/2) # best practice is to have time=0 at the center of the wavelet
 
-    if (data.shape[1] % 2) == 0:
-        wav_dec = np.zeros([data.shape[0],data.shape[1]-1,len(freq)])
-    else:
-        wav_dec = np.zeros([data.shape[0],data.shape[1],len(freq)])
+    # Data detrending
+    data = data - np.mean(data,axis=1,keepdims=True)
+    
+    # Data decomposition, all the channels at once 
+    dataW = Morlet_Wavelet(data,t,freq)
+    wav_dec = np.swapaxes(dataW[component],1,2)
+    
+    return wav_dec
 
-    for ch in range(data.shape[0]):
-       
+class WaveletBank:
+    """
+    Morlet wavelet decomposition with precomputed wavelets 
+    
+    The FFTs of the wavelets are computed once for a sampling frequency, number of 
+    samples and set of frequencies, and a whole block of channels is decomposed with 
+    a single FFT convolution (use wavelet_bank to get the cached banks)
+    
+    Parameters
+    ----------
+    fs: float
+        Sampling frequency
+    n_samples: int
+        Number of samples of the signals (and of the wavelets)
+    freq: ndarray of shape (frequencies,)
+        Frequencies to evaluate in Hz
+    """
+    components = {'filt':np.real,'amp':np.abs,'phase':np.angle}
+    
+    def __init__(self,fs,n_samples,freq):
+        self.fs = fs
+        self.n_samples = int(n_samples)
+        self.freq = np.asarray(freq,dtype=float).reshape(-1)
+        
+        # Time vector, time=0 at the center of the wavelet 
+        t = np.arange(self.n_samples)/fs
+        t = t-(t[-1]/2)
+        
+        # Convolution parameters 
+        self.nConv = 2*self.n_samples - 1
+        self.half_wav = int(np.floor(self.n_samples/2)+1)
+        
+        # FFTs of the wavelets (frequencies x nConv), shared by the callers 
+        self.cmwX = np.ascontiguousarray(Morlet_Kernels(t,self.freq,self.nConv).T)
+        self.cmwX.setflags(write=False)
+        
+    def transform(self,data):
+        """
+        Complex wavelet coefficients 
+        
+        Parameters
+        ----------
+        data: ndarray of shape (channels,samples)
+            Input signals (number of channels x number of samples)
+        
+        Returns
+        -------
+        data_wav: ndarray of shape (channels,frequencies,num_samples)
+            Wavelet coefficients (If samples is odd, num_samples = samples, 
+            otherwise num_samples = samples-1)
+        """
         # Data detrending
-        ch_data = data[ch,:]
-        ch_data = ch_data - np.mean(ch_data)
+        data = data - np.mean(data,axis=-1,keepdims=True)
         
-        # Data decomposition 
-        dataW = Morlet_Wavelet(ch_data,t,freq)
-        wav_dec[ch,:,:] = dataW[component].T
-    
-    return wav_dec
+        # Convolution, all the channels and frequencies at once 
+        dataX = np.fft.fft(data,self.nConv,axis=-1)
+        data_wav = np.fft.ifft(dataX[...,np.newaxis,:]*self.cmwX,axis=-1)
+        
+        # Cut 1/2 of the length of the wavelet from the beginning and from the end
+        return data_wav[...,self.half_wav-2:-self.half_wav]
+        
+    def decompose(self,data,component='phase'):
+        """
+        Morlet wavelet decomposition for multiple channels (see Wavelet_Trial_Dec)
+        
+        Parameters
+        ----------
+        data: ndarray of shape (channels,samples)
+            Input signals (number of channels x number of samples)
+        component: {'filt','amp','phase'} or None
+            Component of interest, or None for all of them 
+        
+        Returns
+        -------
+        wav_dec: ndarray of shape (channels,num_samples,frequencies) or dict 
+            Wavelet decomposition of data at the bank frequencies, or a dictionary 
+            of keys {'filt','amp','phase'} holding them when component is None
+        """
+        data_wav = np.swapaxes(self.transform(data),-1,-2)
+        if component is None:
+            return {key:fn(data_wav) for key,fn in self.components.items()}
+        return self.components[component](data_wav)
+
+@lru_cache(maxsize=32)
+def _wavelet_bank(fs,n_samples,freq):
+    return WaveletBank(fs,n_samples,freq)
+
+def wavelet_bank(fs,n_samples,freq):
+    """
+    WaveletBank for (fs,n_samples,freq), created once per process 
+    """
+    freq = tuple(np.asarray(freq,dtype=float).reshape(-1))
+    return _wavelet_bank(float(fs),int(n_samples),freq)
             
 # =============================================================================
 # Connectivity-based Neurofeedback Functions 
 # =============================================================================
 
-def neurofeedback_CFD(data,ch_labels,fs): 
+def parallel_Ch(fn,data,items,*args,pool=None):
+    """
+    Evaluate fn(data,item,*args) for each item (e.g., channel or channel pair)
+    
+    Parameters
+    ----------
+    fn: function
+        Module level function to evaluate 
+    data: ndarray of shape (channels,samples)
+        Input time series (number of channels x number of samples)
+    items: list
+        Values that change between evaluations
+    pool: WorkerPool, optional
+        Persistent pool with the data shared in memory, if None a new 
+        joblib pool is used
+    
+    Returns
+    -------
+    results: list
+        fn outputs, in the order of items 
+    """
+    if pool is None:
+        return Parallel(n_jobs=-1,verbose=0)(delayed(fn)(data,item,*args) for item in items)
+    return pool.map(fn,data,items,*args)
+
+def autocorr_decay_time_Ch(X,ch,maxlag):
+    """
+    Autocorrelation decay time of the channel ch of X (see autocorr_decay_time)
+    """
+    return autocorr_decay_time(X[ch,:],maxlag)
+
+def cao_criterion_Ch(X,ch,d_max,Tau):
+    """
+    Cao's criterion of the channel ch of X (see cao_criterion)
+    """
+    return cao_criterion(X[ch,:],d_max,Tau[ch])
+
+def neurofeedback_CFD(data,ch_labels,fs,pool=None): 
     """
     Compute the average CFD (Frontal/pre-frontal theta to parietal/occipital alpha) 
     for a 1 second long EEG trial (epoch).   
@@ -679,6 +864,8 @@ def neurofeedback_CFD(data,ch_labels,fs):
         EEG channel labels 
     fs: float
         Sampling frequency (Hz)
+    pool: WorkerPool, optional
+        Persistent pool for the channel pairs (see parallel_Ch)
     
     Returns
     -------
@@ -714,8 +901,8 @@ def neurofeedback_CFD(data,ch_labels,fs):
     ch_pair_lst = [[ch[0],ch[1]] for ch in ch_lst_aux if ch[0]!=ch[1]]
     
     # Compute the CFD
-    CFD_cfi_aux = Parallel(n_jobs=-1,verbose=0)(delayed(CFD_Ch) 
-                                    (data,ch_pair,freq_ph,freq_amp,t_vec,fs) for ch_pair in ch_pair_lst)
+    CFD_cfi_aux = parallel_Ch(CFD_Ch,data,ch_pair_lst,freq_ph,freq_amp,t_vec,fs,
+                              pool=pool)
     CFD_matrix = np.zeros((num_ch,num_ch,num_freq_ph*num_freq_amp))
     for ii,ch_pair in enumerate(ch_pair_lst):
         CFD_matrix[ch_pair[0],ch_pair[1],:] = CFD_cfi_aux[ii].flatten() 
@@ -724,7 +911,7 @@ def neurofeedback_CFD(data,ch_labels,fs):
     return CFD_mean
 
 
-def neurofeedback_kTE_PAC(data,ch_labels,fs): 
+def neurofeedback_kTE_PAC(data,ch_labels,fs,pool=None): 
     """
     Compute the average PAC through kTE (Frontal/pre-frontal theta to parietal/occipital alpha) 
     for a 1 second long EEG trial (epoch).   
@@ -737,6 +924,8 @@ def neurofeedback_kTE_PAC(data,ch_labels,fs):
         EEG channel labels 
     fs: float
         Sampling frequency (Hz)
+    pool: WorkerPool, optional
+        Persistent pool for the channels and channel pairs (see parallel_Ch)
     
     Returns
     -------
@@ -754,9 +943,6 @@ def neurofeedback_kTE_PAC(data,ch_labels,fs):
     num_freq_ph = len(freq_ph)
     num_freq_amp = len(freq_amp)
     
-    # Time vector
-    t_vec = 1000*np.arange(0,1,1/fs)    
-    
     # Channel combination list
     num_ch = len(ch_labels)             # Number of channels 
     # source_ch_labels = ['Fp1','Fp2','F7','F3','Fz','F4','F8']
@@ -783,26 +969,28 @@ def neurofeedback_kTE_PAC(data,ch_labels,fs):
     
     # Embedding time (autocorrelation decay time)
     maxlag = (50//n)
-    Tau_aux = Parallel(n_jobs=-1,verbose=0)(delayed(autocorr_decay_time)
-                                            (data[ch,:],maxlag) for ch in target_ch)
+    Tau_aux = parallel_Ch(autocorr_decay_time_Ch,data,target_ch,maxlag,pool=pool)
     Tau = np.zeros(num_ch)
     Tau[target_ch] = Tau_aux
     # Tau = 20*np.ones(num_ch)
     
     # Embedding dimension (obtained using the cao criterion) 
     d_max = (10//n)
-    Dim_aux = Parallel(n_jobs=-1,verbose=0)(delayed(cao_criterion)
-                                            (data[ch,:],d_max,Tau[ch]) for ch in target_ch)
+    Dim_aux = parallel_Ch(cao_criterion_Ch,data,target_ch,d_max,Tau,pool=pool)
     Dim = np.zeros(num_ch)
     Dim[target_ch] = Dim_aux
     # Dim = 3*np.ones(num_ch)
     
-    # Compute PAC kTE  
-    kTE_cfi_aux = Parallel(n_jobs=-1,verbose=0)(delayed(kernelTransferEntropy_PAC_Ch) 
-                                (data,ch_pair,Dim,Tau,u_trial,alpha,freq_ph,freq_amp,t_vec) for ch_pair in ch_pair_lst)
+    # Compute PAC kTE, the pairs of each target channel are computed together 
+    # to share the target's kernels 
+    trg_pair_lst = [[ch for ch in ch_pair_lst if ch[1]==trg] for trg in target_ch]
+    trg_pair_lst = [pairs for pairs in trg_pair_lst if pairs]
+    kTE_cfi_aux = parallel_Ch(kernelTransferEntropy_PAC,data,trg_pair_lst,Dim,Tau,
+                              u_trial,alpha,freq_ph,freq_amp,fs,pool=pool)
     kTE_matrix = np.zeros((num_ch,num_ch,num_freq_ph*num_freq_amp))
-    for ii,ch_pair in enumerate(ch_pair_lst):
-        kTE_matrix[ch_pair[0],ch_pair[1],:] = kTE_cfi_aux[ii].flatten() 
+    for pairs,kTE_pairs in zip(trg_pair_lst,kTE_cfi_aux):
+        for ii,ch_pair in enumerate(pairs):
+            kTE_matrix[ch_pair[0],ch_pair[1],:] = kTE_pairs[ii].flatten() 
     kTE_mean = np.mean(kTE_matrix,axis=2)
     
     return kTE_mean
@@ -829,9 +1017,6 @@ def neurofeedback_AlphaFz(data,ch_labels,fs):
     # Frequency values to test
     freq = [8,10,12] # frequency of wavelet (amplitude), in Hz 
     
-    # Time vector
-    t_vec = 1000*np.arange(0,1,1/fs)    
-    
     # Channel combination list
     target_ch_labels = ['Fz']
     try:
@@ -840,7 +1025,7 @@ def neurofeedback_AlphaFz(data,ch_labels,fs):
         print("Error! Required channel not found...")
         
     # Compute amplitude
-    sig_amp = Wavelet_Trial_Dec(data[target_ch,:],t_vec,freq,component ='amp')
+    sig_amp = wavelet_bank(fs,data.shape[1],freq).decompose(data[target_ch,:],component ='amp')
     mean_power = np.mean(sig_amp**2)
     
     return mean_power
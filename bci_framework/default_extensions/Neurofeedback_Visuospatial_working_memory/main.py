@@ -13,6 +13,7 @@ from openbci_stream.utils import autokill_process
 autokill_process('VisuospatialWorkingMemory')
 
 from bci_framework.extensions.data_analysis import DataAnalysis, Feedback, loop_consumer
+from bci_framework.extensions.data_analysis.worker_pool import WorkerPool, LatestWindow
 from bci_framework.extensions import properties as prop
 
 import NeuroFeedbackFunctions as nff
@@ -23,10 +24,11 @@ class NeuroFeedback:
     """"""
 
     # ----------------------------------------------------------------------
-    def __init__(self, baseline_count: int, ch_labels: list[str], fsample: int):
+    def __init__(self, baseline_count: int, ch_labels: list[str], fsample: int, pool: Optional[WorkerPool] = None):
         """"""
         self.ch_labels = ch_labels
         self.fsample = fsample
+        self.pool = pool
         self.historical = []
         self.baseline_count = baseline_count
 
@@ -73,14 +75,14 @@ class NeuroFeedback:
 ########################################################################
 class NeuroFeedbackkTE_PAC(NeuroFeedback):
     """"""
-    calcule = lambda cls, *args: nff.neurofeedback_kTE_PAC(*args)
+    calcule = lambda cls, *args: nff.neurofeedback_kTE_PAC(*args, pool=cls.pool)
     compare = lambda cls, *args: nff.compare_connectivity_kTE(*args)
 
 
 ########################################################################
 class NeuroFeedbackCFD(NeuroFeedback):
     """"""
-    calcule = lambda cls, *args: nff.neurofeedback_CFD(*args)
+    calcule = lambda cls, *args: nff.neurofeedback_CFD(*args, pool=cls.pool)
     compare = lambda cls, *args: nff.compare_connectivity_CFD(*args)
 
 
@@ -105,6 +107,10 @@ class VWMGenerator(DataAnalysis):
 
         self.configuration = {}
 
+        # Workers started once, and only the newest window is computed
+        self.pool = WorkerPool()
+        self.scheduler = LatestWindow(self.process_window)
+
         # Buffer
         self.create_buffer(10, aux_shape=3, fill=0)
         self.stream()
@@ -133,7 +139,7 @@ class VWMGenerator(DataAnalysis):
         match self.configuration['function']:
             case 'KTE':
                 logging.warning('Using KTE')
-                NeuroFeedbackClass = NeuroFeedbackKTE
+                NeuroFeedbackClass = NeuroFeedbackkTE_PAC
             case 'CFD':
                 logging.warning('Using CFD')
                 NeuroFeedbackClass = NeuroFeedbackCFD
@@ -144,7 +150,8 @@ class VWMGenerator(DataAnalysis):
         self.neurofeedback = NeuroFeedbackClass(
             baseline_count=self.configuration['baseline_packages'],
             ch_labels=self.configuration['channels'],
-            fsample=self.configuration['sample_rate']
+            fsample=self.configuration['sample_rate'],
+            pool=self.pool,
         )
 
         self.set_package_size(configuration.get('sliding_data', 1000))
@@ -167,6 +174,15 @@ class VWMGenerator(DataAnalysis):
 
         window = self.buffer_eeg[:, -int(prop.SAMPLE_RATE *
                                          self.configuration['window_analysis']):]
+        self.scheduler.submit(window)
+
+    # ----------------------------------------------------------------------
+    def process_window(self, window: np.ndarray) -> None:
+        """Calculate the connectivity of a window and write the feedback.
+
+        Runs in the thread of the scheduler, the windows that arrive while
+        this one is calculated are dropped, except the last one.
+        """
         self.neurofeedback.add(window)
 
         if not self.neurofeedback.baseline:
@@ -13,8 +13,6 @@ yencardonaal@unal.edu.co
 """
 
 import numpy as np
-from scipy.signal import butter, filtfilt
-from scipy import signal
 
 # import matplotlib.pyplot as plt
 import logging
@@ -26,6 +24,10 @@ from bci_framework.extensions.data_analysis import (
     loop_consumer,
 )
 
+from bci_framework.extensions.data_analysis.spectral import (
+    band_power,
+    welch,
+)
 from bci_framework.extensions import properties as prop
 
 import numpy.typing as npt
@@ -94,19 +96,8 @@ class NFB_powerbands:
         Returns
         -------
         powerband
-            Alpha, Beta and Theta PSD
+            Mean PSD of each band, for each target channel
         """
-        rhyt = list(self.bands.keys())
-
-        feats = []
-        nyq = 0.5 * self.fs
-        for k in self.bands:
-            band = np.array(self.bands[k][0])
-            b, a = butter(
-                5, band / nyq, btype='band'
-            )  # fast enough to generate parameters each time
-            feats.append(filtfilt(b, a, data, axis=-1))
-
         try:
             target_ch = [
                 self.ch_labels.index(ch) for ch in self.target_ch_labels
@@ -115,35 +106,28 @@ class NFB_powerbands:
             logging.error("Error! Required channel not found...")
             sys.exit()
 
-        PSD = {}
+        data = data[target_ch, :]
 
         match self.method:
 
             case 'fourier':
-                # Compute and plot the power spectral density (PSD) using Fourier Transform
-                freqs = np.fft.rfftfreq(self.fs, 1 / self.fs)
-                for r, feat in enumerate(feats):
-                    psdr = abs(
-                        np.fft.rfft(
-                            feat[target_ch, :].flatten(),
-                            n=self.fs,
-                            axis=-1,
-                        )
-                    )
-                    PSD[rhyt[r]] = psdr
+                # Compute the spectrum using Fourier Transform
+                n = data.shape[-1]
+                psd = abs(np.fft.rfft(data, axis=-1))
 
             case 'welch':
-                # Compute and plot the power spectral density (PSD) using Welch's method
-                for r, feat in enumerate(feats):
-                    freqs, psdr = signal.welch(
-                        feat[target_ch, :].flatten(),
-                        self.fs,
-                        nperseg=self.fs,
-                        scaling='spectrum',
-                    )
-                    PSD[rhyt[r]] = psdr
-
-        return PSD
+                # Compute the power spectral density (PSD) using Welch's method
+                # Segments of 1 s, or the whole window if it is shorter
+                n = min(self.fs, data.shape[-1])
+                freqs, psd = welch(
+                    data, self.fs, nperseg=n, scaling='spectrum'
+                )
+
+        # All the bands of all the channels at once, with cached masks
+        bands = [self.bands[k][0] for k in self.bands]
+        power = band_power(psd, n, self.fs, bands, reduce='mean')
+
+        return {k: power[:, i] for i, k in enumerate(self.bands)}
 
     # ----------------------------------------------------------------------
     def compare(
@@ -9,6 +9,10 @@ from bci_framework.extensions.data_analysis import (
     loop_consumer,
     fake_loop_consumer,
 )
+from bci_framework.extensions.data_analysis.envelope import (
+    envelope,
+    interleave,
+)
 from bci_framework.extensions import properties as prop
 
 import numpy as np
@@ -43,6 +47,7 @@ class RawEEG(EEGStream, Widgets):
         self.axis.grid(True)
         self.axis.set_ylim(0, len(prop.CHANNELS) + 1)
         self.axis.set_yticklabels(prop.CHANNELS.values())
+        self.enable_blit(self.lines)
 
         self.create_buffer(BUFFER, resampling=DATAWIDTH, fill=0)
 
@@ -61,8 +66,23 @@ class RawEEG(EEGStream, Widgets):
         if data.shape[1] != 100:
             logging.warning(f'Shape: {data.shape[1]}')
 
-        eeg = self.buffer_eeg[:, -window_time * prop.SAMPLE_RATE :]
-        t = np.linspace(-window_time, 0, eeg.shape[1])
+        # Only the min/max envelope of each point is drawn
+        width = self.time.size
+        offset = 0
+        if (substract == 'Cz') and ('Cz' in prop.CHANNELS.values()):
+            eeg = self.buffer_eeg_window(window_time)
+            index = list(prop.CHANNELS.values()).index('Cz')
+            minimum, maximum = envelope(eeg - eeg[index - 1], width)
+        else:
+            minimum, maximum = self.buffer_eeg_envelope(width, window_time)
+            if substract == 'channel mean':
+                eeg = self.buffer_eeg_window(window_time)
+                offset = np.mean(eeg, axis=1)[:, np.newaxis]
+            elif substract == 'global mean':
+                offset = np.mean(self.buffer_eeg_window(window_time))
+
+        eeg = interleave(minimum - offset, maximum - offset)
+        t = np.repeat(np.linspace(-window_time, 0, minimum.shape[1]), 2)
         self.axis.set_xlim(-window_time, 0)
 
         for i, line in enumerate(self.lines):
@@ -71,15 +91,7 @@ class RawEEG(EEGStream, Widgets):
                 line.set_data([], [])
                 continue
 
-            if substract == 'none':
-                line.set_data(t, (eeg[i]) + scale * i)
-            elif substract == 'channel mean':
-                line.set_data(t, (eeg[i] - np.mean(eeg[i])) + scale * i)
-            elif substract == 'global mean':
-                line.set_data(t, (eeg[i] - np.mean(eeg)) + scale * i)
-            elif (substract == 'Cz') and ('Cz' in prop.CHANNELS.values()):
-                index = list(prop.CHANNELS.values()).index('Cz')
-                line.set_data(t, (eeg[i] - eeg[index - 1]) + scale * i)
+            line.set_data(t, eeg[i] + scale * i)
 
         self.feed()
 
@@ -7,9 +7,8 @@ Raw EEG
 from bci_framework.extensions.visualizations import EEGStream, Widgets, interact
 from bci_framework.extensions.data_analysis import loop_consumer, fake_loop_consumer
 from bci_framework.extensions import properties as prop
+from bci_framework.extensions.data_analysis.spectral import frequencies
 import numpy as np
-from scipy.fftpack import fft, fftfreq, fftshift
-from scipy.signal import welch
 
 from gcpds.filters import frequency as flt
 import logging
@@ -32,9 +31,9 @@ class RawEEG(EEGStream, Widgets):
         self.create_buffer(BUFFER, fill=0)
 
         window = BUFFER * prop.SAMPLE_RATE
-        self.W = fftshift(fftfreq(window, 1 / prop.SAMPLE_RATE))
+        self.W = frequencies(window, prop.SAMPLE_RATE)
 
-        a = np.empty(window)
+        a = np.empty(self.W.size)
         a.fill(0)
         self.lines = [self.axis.plot(self.W, a.copy(), '-',)[0]
                       for i in range(len(prop.CHANNELS))]
@@ -45,30 +44,35 @@ class RawEEG(EEGStream, Widgets):
         self.axis.set_ylabel('Amplitude')
         self.axis.grid(True)
 
+        self.fills = []
+        self.enable_blit(self.lines)
+        # One frame every three packages, of 100 ms
+        self.set_frame_rate(10 / 3)
+
         self.stream()
 
     # ----------------------------------------------------------------------
     @loop_consumer('eeg')
-    def stream(self, frame):
-
-        if frame % 3:
-            return
+    def stream(self):
 
         channels = self.widget_value['Channels']
 
         logging.warning(str(channels))
 
-        eeg = self.buffer_eeg
         # self.axis.collections.clear()
-        self.axis.clear()
+        for fill in self.fills:
+            fill.remove()
+        self.fills = []
 
         if self.mode == 'Fourier':
-            EEG = fftshift(np.abs(fft(eeg, axis=1)))
-            self.W = fftshift(fftfreq(EEG.shape[1], 1 / prop.SAMPLE_RATE))
+            eeg = self.buffer_eeg
+            EEG = np.abs(np.fft.rfft(eeg, axis=1))
+            self.W = frequencies(eeg.shape[1], prop.SAMPLE_RATE)
 
         elif self.mode == 'Welch':
-            EEG, self.W = welch(eeg, prop.SAMPLE_RATE, window='flattop',
-                                nperseg=100, scaling='spectrum', axis=-1)
+            # Only the segments completed since the last frame are new
+            self.W, EEG = self.buffer_eeg_welch(
+                100, window='flattop', scaling='spectrum')
 
         EEG = EEG / EEG.max()
         for i, line in enumerate(self.lines):
@@ -79,14 +83,13 @@ class RawEEG(EEGStream, Widgets):
 
             if self.mode == 'Fourier':
                 line.set_data(self.W, EEG[i])
-                self.axis.fill_between(
-                    self.W, EEG[i], 0, facecolor=f'C{i}', alpha=0.1)
+                self.fills.append(self.axis.fill_between(
+                    self.W, EEG[i], 0, facecolor=f'C{i}', alpha=0.1,
+                    animated=True))
 
             elif self.mode == 'Welch':
                 line.set_data(self.W, EEG[i])
 
-        self.axis.set_xlim(0, 100)
-
         self.feed()
 
     # ----------------------------------------------------------------------
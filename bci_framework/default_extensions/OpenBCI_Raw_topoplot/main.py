@@ -21,20 +21,21 @@ class Stream(EEGStream):
 
         self.axis = self.add_subplot(1, 1, 1)
         self.info = self.get_mne_info()
+        # One frame every five packages, of 100 ms
+        self.set_frame_rate(2)
 
         self.stream()
 
     # ----------------------------------------------------------------------
     @loop_consumer('eeg')
-    def stream(self, data, frame):
+    def stream(self, data):
         """"""
-        if (frame % 5) == 0:
-            eeg = data
-            self.axis.clear()
-            mne.viz.plot_topomap(eeg.mean(axis=1) - eeg.mean(), 
-                self.info, axes=self.axis, show=False, outlines='skirt', cmap='cool')
+        eeg = data
+        self.axis.clear()
+        mne.viz.plot_topomap(eeg.mean(axis=1) - eeg.mean(), 
+            self.info, axes=self.axis, show=False, outlines='skirt', cmap='cool')
 
-            self.feed()
+        self.feed()
 
 
 if __name__ == '__main__':
@@ -5,4 +5,5 @@ Data Analysis
 """
 
 from .data_analysis import DataAnalysis, Feedback
+from .ring_buffer import RingBuffer
 from .utils import loop_consumer, fake_loop_consumer, thread_this, subprocess_this, marker_slicing
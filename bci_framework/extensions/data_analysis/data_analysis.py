@@ -1,13 +1,19 @@
-import pickle
 import logging
 import json
-from typing import Optional
+from typing import Optional, Tuple
 
 import numpy as np
 from kafka import KafkaProducer
-from openbci_stream.utils import interpolate_datetime
 
 from bci_framework.extensions import properties as prop
+from bci_framework.extensions.serializers import serialize
+from .ring_buffer import RingBuffer, TimestampInterpolator
+from .resampling import Decimator, decimate
+from .envelope import EnvelopePyramid, envelope
+from .frame_governor import FrameGovernor
+from .spectral import StreamingWelch, welch
+from .shared_stream import attach_buffer
+from .pipeline import TransformersPipeline
 
 # from .utils import loop_consumer, fake_loop_consumer, thread_this, subprocess_this, marker_slice
 
@@ -91,6 +97,8 @@ class Feedback:
 class DataAnalysis:
     """"""
 
+    streaming_transformers = True
+
     # ----------------------------------------------------------------------
     def __init__(self, enable_produser=False):
         """"""
@@ -102,6 +110,7 @@ class DataAnalysis:
         self.transformers_aux_ = {}
         self._feedback = False
         self._package_size = None
+        self._governor = None
 
     # ----------------------------------------------------------------------
     def _enable_commands(self):
@@ -109,8 +118,7 @@ class DataAnalysis:
         try:
             self.kafka_producer = KafkaProducer(
                 bootstrap_servers=[f'{prop.HOST}:9092'],
-                compression_type='gzip',
-                value_serializer=pickle.dumps,
+                value_serializer=serialize,
             )
         except:
             logging.error('Commands: Kafka not available!')
@@ -182,6 +190,7 @@ class DataAnalysis:
         eeg: np.ndarray = None,
         aux: np.ndarray = None,
         timestamp: float = None,
+        sample_ids: np.ndarray = None,
     ) -> None:
         """Uppdate the buffers.
 
@@ -191,38 +200,25 @@ class DataAnalysis:
             The new EEG array
         aux
             The new AUX array
+        timestamp
+            Time of the last sample.
+        sample_ids
+            Ids of the samples, used to count the lost samples in the
+            timestamps.
         """
 
-        if not eeg is None:
-
-            c = eeg.shape[1]
-
-            self.buffer_eeg_ = np.roll(self.buffer_eeg_, -c, axis=1)
-            self.buffer_eeg_[:, -c:] = eeg
-
-            self.buffer_timestamp_ = np.roll(
-                self.buffer_timestamp_, -c, axis=0
+        # Shared buffers are written by the stream hub
+        if not eeg is None and isinstance(self._ring_eeg, RingBuffer):
+            self._ring_eeg.write(eeg)
+            self._ring_timestamp.write(
+                self._timestamp_eeg(eeg.shape[1], timestamp, sample_ids)
             )
-            self.buffer_timestamp_[-c:] = np.zeros(eeg.shape[1])
-            self.buffer_timestamp_[-1] = timestamp
-
-            if hasattr(self, 'buffer_eeg_split'):
-                self.buffer_eeg_split = np.roll(self.buffer_eeg_split, -c)
-
-        if not aux is None:
-
-            d = aux.shape[1]
-            self.buffer_aux_ = np.roll(self.buffer_aux_, -d, axis=1)
-            self.buffer_aux_[:, -d:] = aux
 
-            self.buffer_aux_timestamp_ = np.roll(
-                self.buffer_aux_timestamp_, -d, axis=0
+        if not aux is None and isinstance(self._ring_aux, RingBuffer):
+            self._ring_aux.write(aux)
+            self._ring_aux_timestamp.write(
+                self._timestamp_aux(aux.shape[1], timestamp, sample_ids)
             )
-            self.buffer_aux_timestamp_[-d:] = np.zeros(aux.shape[1])
-            self.buffer_aux_timestamp_[-1] = timestamp
-
-            if hasattr(self, 'buffer_aux_split'):
-                self.buffer_aux_split = np.roll(self.buffer_aux_split, -d)
 
     # ----------------------------------------------------------------------
     def _get_factor_near_to(self, x: int, n: Optional[int] = 1000) -> int:
@@ -250,21 +246,36 @@ class DataAnalysis:
 
     # ----------------------------------------------------------------------
     def _create_resampled_buffer(
-        self, x: int, resampling: Optional[int] = 1000
-    ) -> np.ndarray:
-        """"""
-        f = self._get_factor_near_to(x, resampling)
-        self.buffer_eeg_split = np.zeros(int(x))
-        index = np.linspace(0, x, f + 1).astype(int)[:-1]
-        self.buffer_eeg_split[index] = 1
+        self, resampling: Optional[int] = 1000
+    ) -> None:
+        """Decimators for the `*_resampled` buffers.
 
-        if prop.CONNECTION == 'wifi' and prop.DAISY:
-            x = x * 2
+        The width is the integer factor of the buffer length nearest to
+        `resampling`, the same used by the visualizations.
+        """
+
+        def decimators(*rings):
+            width = self._get_factor_near_to(rings[0].length, resampling)
+            return [
+                Decimator(ring, ring.length // width, width) for ring in rings
+            ]
+
+        (
+            self._decimator_eeg,
+            self._decimator_timestamp,
+        ) = decimators(self._ring_eeg, self._ring_timestamp)
+        (
+            self._decimator_aux,
+            self._decimator_aux_timestamp,
+        ) = decimators(self._ring_aux, self._ring_aux_timestamp)
+        self._decimator_filtered = Decimator(
+            self._pipeline_eeg.filtered,
+            self._decimator_eeg.factor,
+            self._decimator_eeg.width,
+        )
 
-        f = self._get_factor_near_to(x, resampling)
-        self.buffer_aux_split = np.zeros(x)
-        index = np.linspace(0, x, f + 1).astype(int)[:-1]
-        self.buffer_aux_split[index] = 1
+        self._envelope_eeg = EnvelopePyramid(self._ring_eeg)
+        self._envelope_filtered = EnvelopePyramid(self._pipeline_eeg.filtered)
 
     # ----------------------------------------------------------------------
     def create_buffer(
@@ -274,6 +285,7 @@ class DataAnalysis:
         fill: Optional[int] = 0,
         resampling: Optional[int] = 1000,
         # aux_mode: Optional[Literal['accel', 'analog', 'digital']] = None,
+        shared: Optional[bool] = False,
     ):
         """Create a buffer with fixed time length.
 
@@ -289,16 +301,28 @@ class DataAnalysis:
         fill
             Initialize buffet with this value.
         resampling
-            The resampling size.
+            Approximated width of the resampled buffers, the `*_resampled`
+            properties are decimated with an anti-aliasing filter.
+        shared
+            Use the rings of the stream hub as buffers, if it is running,
+            instead of write every package in a local buffer. Only available
+            with `fill=0`, since the hub does not know the fill value.
         """
 
         chs = len(prop.CHANNELS)
         time = int(prop.SAMPLE_RATE * seconds)
 
-        self._create_resampled_buffer(abs(time), resampling=resampling)
+        self._timestamp_eeg = TimestampInterpolator(prop.SAMPLE_RATE)
 
-        self.buffer_eeg_ = np.empty((chs, time))
-        self.buffer_timestamp_ = np.zeros(time)
+        shared = shared and not fill
+        if shared and (buffers := attach_buffer('eeg', chs, time)):
+            self._ring_eeg, self._ring_timestamp = buffers
+        else:
+            self._ring_eeg = RingBuffer(chs, time, fill=fill)
+            self._ring_timestamp = RingBuffer(None, time)
+        self._pipeline_eeg = TransformersPipeline(
+            self._ring_eeg, streaming=self.streaming_transformers
+        )
 
         aux_mode = prop.BOARDMODE
         aux_mode = aux_mode.lower()
@@ -315,15 +339,20 @@ class DataAnalysis:
             aux_shape = 3
 
         if prop.CONNECTION == 'wifi' and prop.DAISY:
-            self.buffer_aux_ = np.empty((aux_shape, time * 2))
-            self.buffer_aux_timestamp_ = np.zeros(time * 2)
+            time = time * 2
+            self._timestamp_aux = TimestampInterpolator(prop.SAMPLE_RATE * 2)
         else:
-            self.buffer_aux_ = np.empty((aux_shape, time))
-            self.buffer_aux_timestamp_ = np.zeros(time)
+            self._timestamp_aux = TimestampInterpolator(prop.SAMPLE_RATE)
 
-        self.buffer_eeg_.fill(fill)
-        self.buffer_aux_.fill(fill)
-        # self.buffer_aux_timestamp_ = np.zeros(time)
+        if shared and (buffers := attach_buffer('aux', aux_shape, time)):
+            self._ring_aux, self._ring_aux_timestamp = buffers
+        else:
+            self._ring_aux = RingBuffer(aux_shape, time, fill=fill)
+            self._ring_aux_timestamp = RingBuffer(None, time)
+
+        self._create_resampled_buffer(resampling)
+        # Streaming Welch estimators of `buffer_eeg_welch`
+        self._welch = {}
 
     # ----------------------------------------------------------------------
     def set_transformers(self, transformers):
@@ -363,15 +392,53 @@ class DataAnalysis:
         """"""
         self.transformers_aux_ = []
 
+    # ----------------------------------------------------------------------
+    @property
+    def buffer_eeg_(self) -> np.ndarray:
+        """Raw EEG buffer, a view of shape (`channels, time`)."""
+        return self._ring_eeg.view()
+
+    # ----------------------------------------------------------------------
+    @property
+    def buffer_aux_(self) -> np.ndarray:
+        """Raw AUX buffer, a view of shape (`aux, time`)."""
+        return self._ring_aux.view()
+
+    # ----------------------------------------------------------------------
+    @property
+    def buffer_timestamp_(self) -> np.ndarray:
+        """EEG timestamps, a view of shape (`time`)."""
+        return self._ring_timestamp.view()
+
+    # ----------------------------------------------------------------------
+    @property
+    def buffer_aux_timestamp_(self) -> np.ndarray:
+        """AUX timestamps, a view of shape (`time`)."""
+        return self._ring_aux_timestamp.view()
+
     # ----------------------------------------------------------------------
     @property
     def buffer_eeg(self):
         """"""
-        eeg = self.buffer_eeg_.copy()
-        for tr in self.transformers_.copy():
-            kwargs = self.transformers_[tr][1]
-            eeg = self.transformers_[tr][0](eeg, **kwargs)
-        return eeg
+        return self._pipeline_eeg.window(self.transformers_)
+
+    # ----------------------------------------------------------------------
+    def buffer_eeg_window(self, seconds: Optional[float] = None) -> np.ndarray:
+        """The last seconds of the EEG buffer with the transformers applied.
+
+        Only the requested window is copied, and the filters only process the
+        samples that arrived since the previous call.
+
+        Parameters
+        ----------
+        seconds
+            Size of the window, by default the whole buffer.
+        """
+        if seconds is None:
+            return self._pipeline_eeg.window(self.transformers_)
+        return self._pipeline_eeg.window(
+            self.transformers_, int(prop.SAMPLE_RATE * seconds)
+        )
 
     # ----------------------------------------------------------------------
     @property
@@ -385,48 +452,196 @@ class DataAnalysis:
     # ----------------------------------------------------------------------
     @property
     def buffer_eeg_resampled(self):
-        """"""
-        return self.buffer_eeg[:, np.argwhere(self.buffer_eeg_split == 1)][
-            :, :, 0
-        ]
+        """EEG buffer with the transformers, decimated.
+
+        If all the transformers are streaming filters only the new samples
+        are decimated, otherwise the whole window is decimated.
+        """
+        source = self._pipeline_eeg.stream(self.transformers_)
+        if source is self._ring_eeg:
+            return self._decimator_eeg.view().copy()
+        if source is not None:
+            return self._decimator_filtered.view().copy()
+
+        return decimate(
+            self.buffer_eeg,
+            self._decimator_eeg.factor,
+            self._decimator_eeg.width,
+            self._decimator_eeg.taps,
+        )
 
     # ----------------------------------------------------------------------
     @property
     def buffer_aux_resampled(self):
-        """"""
-        return self.buffer_aux[:, np.argwhere(self.buffer_aux_split == 1)][
-            :, :, 0
-        ]
+        """AUX buffer with the transformers, decimated."""
+        if not self.transformers_aux_:
+            return self._decimator_aux.view().copy()
+
+        return decimate(
+            self.buffer_aux,
+            self._decimator_aux.factor,
+            self._decimator_aux.width,
+            self._decimator_aux.taps,
+        )
+
+    # ----------------------------------------------------------------------
+    def buffer_eeg_envelope(
+        self, width: int, seconds: Optional[float] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Min/max envelope of the EEG buffer with the transformers.
+
+        The minimum and the maximum of the samples under each pixel, drawn
+        with `interleave` they look the same as the whole buffer. If all the
+        transformers are streaming filters the envelope is taken from a
+        pyramid updated with the new samples only.
+
+        Parameters
+        ----------
+        width
+            Number of pixels.
+        seconds
+            Size of the window, by default the whole buffer.
+
+        Returns
+        -------
+        minimum, maximum
+            Arrays of shape (`channels, width`).
+        """
+        source = self._pipeline_eeg.stream(self.transformers_)
+        if source is None:
+            return envelope(self.buffer_eeg_window(seconds), width)
+
+        if source is self._ring_eeg:
+            pyramid = self._envelope_eeg
+        else:
+            pyramid = self._envelope_filtered
+
+        if seconds is None:
+            return pyramid.last(source.length, width)
+        return pyramid.last(int(prop.SAMPLE_RATE * seconds), width)
+
+    # ----------------------------------------------------------------------
+    def buffer_eeg_welch(
+        self,
+        nperseg: int,
+        seconds: Optional[float] = None,
+        noverlap: Optional[int] = None,
+        window: Optional[str] = 'hann',
+        scaling: Optional[str] = 'density',
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Welch estimate of the EEG buffer with the transformers.
+
+        If all the transformers are streaming filters the periodograms of
+        the segments are kept between calls and only the new segments are
+        transformed, see `StreamingWelch`, otherwise the whole window is
+        estimated.
+
+        Parameters
+        ----------
+        nperseg
+            Length of each segment.
+        seconds
+            Size of the window, by default the whole buffer.
+        noverlap
+            Samples shared by consecutive segments, by default
+            `nperseg // 2`.
+        window
+            Name of the window for `scipy.signal.get_window`.
+        scaling
+            `density` or `spectrum`.
+
+        Returns
+        -------
+        freqs, psd
+            The frequency axis and an array of shape (`channels,
+            frequencies`).
+        """
+        source = self._pipeline_eeg.stream(self.transformers_)
+        if source is None:
+            return welch(
+                self.buffer_eeg_window(seconds),
+                prop.SAMPLE_RATE,
+                nperseg,
+                noverlap,
+                window,
+                scaling,
+            )
+
+        key = (id(source), nperseg, noverlap, window, scaling)
+        if key not in self._welch:
+            self._welch[key] = StreamingWelch(
+                source, prop.SAMPLE_RATE, nperseg, noverlap, window, scaling
+            )
+        estimator = self._welch[key]
+
+        if seconds is None:
+            return estimator.psd()
+        return estimator.psd(
+            estimator.segments(int(prop.SAMPLE_RATE * seconds))
+        )
 
     # ----------------------------------------------------------------------
     @property
     def buffer_timestamp_resampled(self):
-        """"""
-        t = self.buffer_timestamp
-        if t.shape[0]:
-            return t[np.argwhere(self.buffer_eeg_split == 1)][:, 0]
-        else:
-            return np.array([])
+        """Timestamps of `buffer_eeg_resampled`."""
+        return self._decimator_timestamp.view().copy()
+
+    # ----------------------------------------------------------------------
+    @property
+    def buffer_aux_timestamp_resampled(self):
+        """Timestamps of `buffer_aux_resampled`."""
+        return self._decimator_aux_timestamp.view().copy()
 
     # ----------------------------------------------------------------------
     @property
     def buffer_timestamp(self):
-        """"""
-        try:
-            return interpolate_datetime(self.buffer_timestamp_)
-        except:
-            return self.buffer_timestamp_
+        """Timestamp of each sample of the EEG buffer.
+
+        The timestamps are calculated when the packages arrive, this is a
+        view of the buffer, `0` for the samples not written yet.
+        """
+        return self._ring_timestamp.view()
 
     # ----------------------------------------------------------------------
     @property
     def buffer_aux_timestamp(self):
-        """"""
-        try:
-            return interpolate_datetime(self.buffer_aux_timestamp_)
-        except:
-            return self.buffer_aux_timestamp_
+        """Timestamp of each sample of the AUX buffer."""
+        return self._ring_aux_timestamp.view()
 
     # ----------------------------------------------------------------------
     def set_package_size(self, value):
         """"""
         self._package_size = value
+
+    # ----------------------------------------------------------------------
+    def set_frame_rate(
+        self, fps: Optional[float] = None, max_lag: Optional[float] = None
+    ) -> None:
+        """Limit the calls of `loop_consumer` for the `eeg` and `aux` data.
+
+        The buffers are updated with every package, but the decorated method
+        is called at most `fps` times per second, see `FrameGovernor`.
+
+        Parameters
+        ----------
+        fps
+            Maximum frames per second, `None` for no limit.
+        max_lag
+            Drop also the frames with data older than this, in milliseconds.
+        """
+        if self._governor is None:
+            self._governor = FrameGovernor(fps, max_lag)
+        else:
+            self._governor.set_frame_rate(fps, max_lag)
+
+    # ----------------------------------------------------------------------
+    @property
+    def frame_stats(self) -> dict:
+        """Measured frame rate, render time and dropped frames.
+
+        Available after `set_frame_rate`, visualizations measure all the
+        frames by default.
+        """
+        if self._governor is None:
+            return {}
+        return self._governor.stats
@@ -0,0 +1,348 @@
+"""
+========
+Envelope
+========
+
+Multi-resolution min/max envelopes to plot long EEG windows.
+
+A line with more points than pixels draws the same image as the minimum and
+the maximum of the samples under each pixel. `EnvelopePyramid` keeps the
+minimum and maximum of blocks of `factor ** level` samples, so the exact
+envelope of any range, at any width, is assembled with a few blocks per
+pixel instead of reading every sample of the range. The pyramid of a record
+is built once, the pyramid of a `RingBuffer` is updated with the new
+samples only.
+
+.. code-block:: python
+
+    pyramid = EnvelopePyramid(eeg)
+    minimum, maximum = pyramid.envelope(start, stop, width=800)
+    line.set_data(x, interleave(minimum, maximum)[0])
+"""
+
+from typing import Optional, Tuple, Union
+
+import numpy as np
+
+from .ring_buffer import RingBuffer
+
+FACTOR = 4
+
+
+# ----------------------------------------------------------------------
+def pixel_edges(start: int, stop: int, width: int) -> np.ndarray:
+    """The first sample of each pixel, and the end of the last one.
+
+    The width is reduced to the number of samples, so every pixel contains
+    at least one sample.
+    """
+    width = max(1, min(int(width), stop - start))
+    return start + (np.arange(width + 1) * (stop - start)) // width
+
+
+# ----------------------------------------------------------------------
+def envelope(x: np.ndarray, width: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Min/max envelope of a whole window, without a pyramid.
+
+    Parameters
+    ----------
+    x
+        Array of shape (`channels, time`) or (`time`).
+    width
+        Number of pixels.
+
+    Returns
+    -------
+    minimum, maximum
+        Arrays of shape (`channels, width`).
+    """
+    edges = pixel_edges(0, x.shape[-1], width)[:-1]
+    return (
+        np.minimum.reduceat(x, edges, axis=-1),
+        np.maximum.reduceat(x, edges, axis=-1),
+    )
+
+
+# ----------------------------------------------------------------------
+def interleave(minimum: np.ndarray, maximum: np.ndarray) -> np.ndarray:
+    """Alternate the minimum and maximum of each pixel.
+
+    A line with these values, and the positions repeated twice, draws the
+    envelope as a vertical stroke per pixel.
+    """
+    pairs = np.stack([minimum, maximum], axis=-1)
+    return pairs.reshape(minimum.shape[:-1] + (-1,))
+
+
+# ----------------------------------------------------------------------
+def _reduce(
+    x: np.ndarray, blocks: int, factor: int, ufunc: np.ufunc
+) -> np.ndarray:
+    """Reduce consecutive groups of `factor` samples.
+
+    The strided slices are faster than a reduction over a short last axis.
+    """
+    size = blocks * factor
+    out = x[..., 0:size:factor].copy()
+    for i in range(1, factor):
+        ufunc(out, x[..., i:size:factor], out=out)
+    return out
+
+
+# ----------------------------------------------------------------------
+def _tail(
+    ring: RingBuffer, samples: int, end: Optional[int] = None
+) -> np.ndarray:
+    """The last samples of a ring, padded if it does not retain them.
+
+    The padded samples are older than the source, so the blocks reduced
+    with them are never requested.
+    """
+    x = ring.view(samples, end)
+    missing = samples - x.shape[-1]
+    if missing > 0:
+        x = np.pad(x, [(0, 0)] * (x.ndim - 1) + [(missing, 0)], mode='edge')
+    return x
+
+
+########################################################################
+class EnvelopePyramid:
+    """Min/max pyramid of a record or a live buffer.
+
+    The level `k` contains the minimum and the maximum of consecutive blocks
+    of `factor ** k` samples, the level 0 is the source itself. For a
+    `RingBuffer` the levels are rings too, with the blocks of the last
+    `length` samples, and the positions are counted with the samples
+    written in the source.
+
+    Parameters
+    ----------
+    source
+        A record of shape (`channels, time`) or a `RingBuffer`.
+    factor
+        Number of blocks of a level reduced in a block of the next level.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(
+        self,
+        source: Union[np.ndarray, RingBuffer],
+        factor: Optional[int] = FACTOR,
+    ):
+        """"""
+        self.source = source
+        self.factor = int(factor)
+
+        if self.live:
+            self._reset(source.written)
+        else:
+            self._build()
+
+    # ----------------------------------------------------------------------
+    @property
+    def live(self) -> bool:
+        """If the source is a buffer that is still written."""
+        return not isinstance(self.source, np.ndarray)
+
+    # ----------------------------------------------------------------------
+    @property
+    def bounds(self) -> Tuple[int, int]:
+        """Positions of the first sample available and of the next one."""
+        if self.live:
+            return self._completed[0] - self.source.length, self._completed[0]
+        return 0, self._completed[0]
+
+    # ----------------------------------------------------------------------
+    def _build(self) -> None:
+        """Calculate all the levels of a record."""
+        x = self.source
+        self._levels = [(x, x)]
+        self._completed = [x.shape[-1]]
+
+        while self._completed[-1] >= 2 * self.factor:
+            minimum, maximum = self._levels[-1]
+            blocks = self._completed[-1] // self.factor
+            self._levels.append(
+                (
+                    _reduce(minimum, blocks, self.factor, np.minimum),
+                    _reduce(maximum, blocks, self.factor, np.maximum),
+                )
+            )
+            self._completed.append(blocks)
+
+    # ----------------------------------------------------------------------
+    def _reset(self, written: int) -> None:
+        """Start again the levels of a live buffer."""
+        ring = self.source
+        channels = ring.shape[0] if len(ring.shape) > 1 else None
+        first = written - ring.length
+
+        self._levels = [(ring, ring)]
+        self._completed = [written]
+
+        size = self.factor
+        while size * self.factor <= ring.length:
+            blocks = ring.length // size + 2
+            self._levels.append(
+                (RingBuffer(channels, blocks), RingBuffer(channels, blocks))
+            )
+            # The first block with all its samples in the source
+            self._completed.append(-(-first // size))
+            size *= self.factor
+
+    # ----------------------------------------------------------------------
+    def update(self) -> None:
+        """Reduce the samples written in the source since the last update."""
+        if not self.live:
+            return
+
+        # Read once, the source can be written by the stream hub meanwhile
+        ring = self.source
+        written = ring.written
+        pending = written - self._completed[0]
+        if not 0 <= pending <= ring.length:
+            self._reset(written)
+        self._completed[0] = written
+
+        for level in range(1, len(self._levels)):
+            stop = self._completed[level - 1] // self.factor
+            blocks = stop - self._completed[level]
+            if blocks <= 0:
+                continue
+
+            lower = self._completed[level - 1] - self._completed[level] * (
+                self.factor
+            )
+            minimum, maximum = self._levels[level - 1]
+            # The level 0 is the source, read until the samples counted
+            end = written if level == 1 else None
+            self._levels[level][0].write(
+                _reduce(
+                    _tail(minimum, lower, end), blocks, self.factor, np.minimum
+                )
+            )
+            self._levels[level][1].write(
+                _reduce(
+                    _tail(maximum, lower, end), blocks, self.factor, np.maximum
+                )
+            )
+            self._completed[level] = stop
+
+    # ----------------------------------------------------------------------
+    def _level(self, level: int) -> Tuple[np.ndarray, np.ndarray, int]:
+        """The blocks of a level and the index of the first one."""
+        minimum, maximum = self._levels[level]
+        if not self.live:
+            return minimum, maximum, 0
+        # The source is read until the samples counted in the last update
+        end = self._completed[0] if level == 0 else None
+        return (
+            minimum.view(end=end),
+            maximum.view(end=end),
+            self._completed[level] - minimum.length,
+        )
+
+    # ----------------------------------------------------------------------
+    def envelope(
+        self, start: int, stop: int, width: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Minimum and maximum of the samples under each pixel.
+
+        The biggest blocks smaller than a pixel are reduced first, and the
+        edges of the pixels that are not aligned with them are completed
+        with the lower levels, so the result is the same as reducing all
+        the samples of each pixel.
+
+        Parameters
+        ----------
+        start
+            Position of the first sample.
+        stop
+            Position after the last sample.
+        width
+            Number of pixels, reduced to the number of samples if the range
+            is shorter.
+
+        Returns
+        -------
+        minimum, maximum
+            Arrays of shape (`channels, width`).
+        """
+        self.update()
+        first, end = self.bounds
+        start = max(int(start), first)
+        stop = min(int(stop), end)
+        shape = self.source.shape[:-1]
+        if stop <= start:
+            return np.empty(shape + (0,)), np.empty(shape + (0,))
+
+        edges = pixel_edges(start, stop, width)
+        width = edges.size - 1
+        span = (stop - start) // width
+
+        top = 0
+        while top + 1 < len(self._levels) and self.factor ** (top + 1) <= span:
+            top += 1
+
+        minimum = np.full(shape + (width,), np.inf)
+        maximum = np.full(shape + (width,), -np.inf)
+
+        # Fragments of the pixels that are not reduced yet. A pixel is split
+        # at most once, the left fragments stay with the whole pixels and
+        # the right ones in their own group, so the pixels of a group are
+        # unique and the results can be assigned without `ufunc.at`.
+        pixels = np.arange(width)
+        whole = (pixels, edges[:-1], edges[1:])
+        rights = (pixels[:0], edges[:0], edges[:0])
+        # A fragment never covers more than two blocks of the next level
+        offsets = np.arange(2 * self.factor)
+
+        for level in range(top, -1, -1):
+            size = self.factor**level
+            level_min, level_max, first = self._level(level)
+
+            groups = []
+            for pixels, starts, stops in (whole, rights):
+                begin = np.maximum(-(-starts // size), first)
+                end = np.minimum(stops // size, self._completed[level])
+                full = begin < end
+
+                if full.any():
+                    index = begin[full, None] + offsets
+                    # Repeat the first block to pad the shorter fragments
+                    index = np.where(
+                        index < end[full, None], index, index[:, :1]
+                    )
+                    index -= first
+                    p = pixels[full]
+                    minimum[..., p] = np.minimum(
+                        minimum[..., p], level_min[..., index].min(axis=-1)
+                    )
+                    maximum[..., p] = np.maximum(
+                        maximum[..., p], level_max[..., index].max(axis=-1)
+                    )
+
+                left = full & (starts < begin * size)
+                right = full & (end * size < stops)
+                groups.append(
+                    (
+                        (pixels[~full], starts[~full], stops[~full]),
+                        (pixels[left], starts[left], begin[left] * size),
+                        (pixels[right], end[right] * size, stops[right]),
+                    )
+                )
+
+            (kept, left, right), right_groups = groups
+            whole = tuple(map(np.concatenate, zip(kept, left)))
+            rights = tuple(map(np.concatenate, zip(*right_groups, right)))
+
+        return minimum, maximum
+
+    # ----------------------------------------------------------------------
+    def last(
+        self, samples: int, width: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Envelope of the last samples of a live buffer."""
+        self.update()
+        end = self.bounds[1]
+        return self.envelope(end - samples, end, width)
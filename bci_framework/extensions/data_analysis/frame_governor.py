@@ -0,0 +1,137 @@
+"""
+==============
+Frame governor
+==============
+
+Decouple the rendering of the visualizations from the data ingestion.
+
+`loop_consumer` updates the buffers with every package, but with a governor
+the decorated method is called only when a new frame is due, so the time
+spent rendering does not depend on the package rate and a slow figure does
+not accumulate latency. The frames not rendered are counted as dropped, and
+the render time is measured, to size the deployments.
+
+.. code-block:: python
+
+    self.set_frame_rate(fps=10)
+    ...
+    print(self.frame_stats)
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+# Weight of the last frame in the averages
+SMOOTHING = 0.1
+
+
+########################################################################
+class FrameGovernor:
+    """Frame rate limit and frame statistics.
+
+    The interval between frames is counted from the start of the previous
+    one, so if the render is slower than the target frame rate the next
+    frame is rendered as soon as the previous one is finished.
+
+    Parameters
+    ----------
+    fps
+        Maximum frames per second, `None` to render all the frames.
+    max_lag
+        Frames with data older than this, in milliseconds, are dropped
+        too, `None` to disable.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(
+        self, fps: Optional[float] = None, max_lag: Optional[float] = None
+    ):
+        """"""
+        self.set_frame_rate(fps, max_lag)
+        self.reset()
+
+    # ----------------------------------------------------------------------
+    def set_frame_rate(
+        self, fps: Optional[float] = None, max_lag: Optional[float] = None
+    ) -> None:
+        """Change the limits, the statistics are kept."""
+        self.fps = fps
+        self.max_lag = max_lag
+        self.interval = 1 / fps if fps else 0
+
+    # ----------------------------------------------------------------------
+    def reset(self) -> None:
+        """Start again the statistics."""
+        self.rendered = 0
+        self.dropped = 0
+        self.render_time = 0
+        self.render_time_max = 0
+        self.frame_interval = 0
+        self._last = None
+
+    # ----------------------------------------------------------------------
+    def ready(
+        self, lag: Optional[float] = 0, merged: Optional[int] = 1
+    ) -> bool:
+        """If a new frame is due, otherwise it is counted as dropped.
+
+        Parameters
+        ----------
+        lag
+            Age in milliseconds of the data of the frame.
+        merged
+            Number of packages in the frame, all but one are counted as
+            dropped, like the stale frames merged by the threaded
+            `loop_consumer`.
+        """
+        self.dropped += max(merged - 1, 0)
+        stale = self.max_lag is not None and lag > self.max_lag
+        early = (
+            self._last is not None
+            and time.monotonic() - self._last < self.interval
+        )
+        if stale or early:
+            self.dropped += 1
+            return False
+        return True
+
+    # ----------------------------------------------------------------------
+    @contextmanager
+    def frame(self):
+        """Measure the render of a frame."""
+        start = time.monotonic()
+        if self._last is not None:
+            self.frame_interval = _average(
+                self.frame_interval, start - self._last, self.rendered - 1
+            )
+        self._last = start
+        try:
+            yield
+        finally:
+            elapsed = (time.monotonic() - start) * 1000
+            self.render_time = _average(
+                self.render_time, elapsed, self.rendered
+            )
+            self.render_time_max = max(self.render_time_max, elapsed)
+            self.rendered += 1
+
+    # ----------------------------------------------------------------------
+    @property
+    def stats(self) -> dict:
+        """Measured frame rate, render time in milliseconds and counters."""
+        return {
+            'fps': 1 / self.frame_interval if self.frame_interval else 0,
+            'render_time': self.render_time,
+            'render_time_max': self.render_time_max,
+            'rendered': self.rendered,
+            'dropped': self.dropped,
+        }
+
+
+# ----------------------------------------------------------------------
+def _average(average: float, value: float, count: int) -> float:
+    """Exponential moving average, starting with the first value."""
+    if not count:
+        return value
+    return average + SMOOTHING * (value - average)
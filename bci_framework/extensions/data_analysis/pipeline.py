@@ -0,0 +1,182 @@
+"""
+========
+Pipeline
+========
+
+Lazy transformers chain for the EEG buffer.
+
+Filters compiled as IIR (the ones from `gcpds.filters.frequency`) are applied
+as streaming filters, only over the samples that arrived since the last read
+and keeping the filter state between packages. Any other transformer is
+applied over the requested window and cached until a new package arrives.
+"""
+
+from typing import Optional, Callable, Dict, Tuple
+
+import numpy as np
+from scipy.signal import sosfilt, sosfilt_zi, tf2sos
+
+from .ring_buffer import RingBuffer
+
+Transformers = Dict[str, Tuple[Callable, dict]]
+
+
+########################################################################
+class TransformersPipeline:
+    """Filter the new samples of a `RingBuffer` on demand.
+
+    Streaming filters are causal, unlike the `filtfilt` used when the
+    transformers are called over a full array, so they introduce the phase
+    delay of the IIR filter. Set `streaming` to `False` to apply all the
+    transformers over the requested window instead.
+
+    Parameters
+    ----------
+    ring
+        The raw buffer.
+    streaming
+        Use stateful filters for the IIR transformers.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(self, ring: RingBuffer, streaming: Optional[bool] = True):
+        """"""
+        self.ring = ring
+        self.streaming = streaming
+        self.filtered = RingBuffer(ring.shape[0], ring.length)
+
+        self._signature = None
+        self._sos = []
+        self._zi = None
+        self._windowed = []
+        self._processed = 0
+        self._cache_key = None
+        self._cache = None
+
+    # ----------------------------------------------------------------------
+    @staticmethod
+    def _coefficients(fn: Callable, kwargs: dict) -> Optional[np.ndarray]:
+        """Second-order sections of a streamable filter, if any."""
+        if not (hasattr(fn, '_fit') and hasattr(fn, '_b')):
+            return None
+        if set(kwargs) - {'fs'}:
+            return None
+
+        if fs := kwargs.get('fs', None):
+            b, a = fn._fit(fs)
+        else:
+            b, a = fn._b, fn._a
+        return tf2sos(b, a)
+
+    # ----------------------------------------------------------------------
+    def _compile(self, transformers: Transformers, signature: tuple) -> None:
+        """Split the transformers into streaming and windowed stages."""
+        self._sos = []
+        self._windowed = []
+
+        for name in transformers:
+            fn, kwargs = transformers[name]
+            if self.streaming and not self._windowed:
+                if (sos := self._coefficients(fn, kwargs)) is not None:
+                    self._sos.append(sos)
+                    continue
+            self._windowed.append((fn, kwargs))
+
+        self._signature = signature
+        self._zi = None
+        self._cache_key = None
+
+    # ----------------------------------------------------------------------
+    def _process(self) -> None:
+        """Run the streaming filters over the pending samples."""
+        # Read once, the ring can be written by the stream hub meanwhile
+        written = self.ring.written
+        pending = written - self._processed
+        if not pending and self._zi is not None:
+            return
+
+        if self._zi is None or not 0 <= pending < self.ring.length:
+            x = self.ring.view(end=written)
+            self._zi = [
+                sosfilt_zi(sos)[:, None, :] * x[None, :, 0, None]
+                for sos in self._sos
+            ]
+        else:
+            x = self.ring.view(pending, written)
+
+        if not np.isfinite(x).all():
+            x = np.nan_to_num(x)
+
+        for i, sos in enumerate(self._sos):
+            x, self._zi[i] = sosfilt(sos, x, axis=-1, zi=self._zi[i])
+
+        self.filtered.write(x)
+        self._processed = written
+
+    # ----------------------------------------------------------------------
+    def _update(self, transformers: Transformers) -> None:
+        """Compile the transformers if changed and run the streaming ones."""
+        transformers = transformers.copy()
+        signature = tuple(
+            (name, id(transformers[name][0]), repr(transformers[name][1]))
+            for name in transformers
+        )
+        if signature != self._signature:
+            self._compile(transformers, signature)
+
+        if self._sos:
+            self._process()
+
+    # ----------------------------------------------------------------------
+    def stream(self, transformers: Transformers) -> Optional[RingBuffer]:
+        """The buffer with all the transformers applied, if all of them are
+        streaming filters.
+
+        Returns
+        -------
+        RingBuffer
+            The raw or the filtered buffer, `None` if some transformer must
+            be applied over the window.
+        """
+        self._update(transformers)
+        if self._windowed:
+            return None
+        return self.filtered if self._sos else self.ring
+
+    # ----------------------------------------------------------------------
+    def window(
+        self, transformers: Transformers, samples: Optional[int] = None
+    ) -> np.ndarray:
+        """Get the last `samples` of the buffer after the transformers.
+
+        Parameters
+        ----------
+        transformers
+            Dictionary with the transformers, the values are tuples of the
+            callable and its keyword arguments.
+        samples
+            Size of the window, by default the whole buffer.
+
+        Returns
+        -------
+        array
+            A new array of shape (`channels, samples`).
+        """
+        source = self.stream(transformers)
+        if source is not None:
+            return source.view(samples).copy()
+        source = self.filtered if self._sos else self.ring
+
+        written = self.ring.written
+        key = (written, samples)
+        if key != self._cache_key:
+            if source is self.ring:
+                eeg = source.view(samples, written).copy()
+            else:
+                eeg = source.view(samples).copy()
+            for fn, kwargs in self._windowed:
+                eeg = fn(eeg, **kwargs)
+            self._cache = eeg
+            self._cache_key = key
+
+        return self._cache.copy()
@@ -0,0 +1,192 @@
+"""
+==========
+Resampling
+==========
+
+Anti-aliased decimation of the buffers.
+
+The buffers are decimated by an integer factor with a linear phase FIR
+low-pass filter, and only the output samples are calculated, as in a
+polyphase decimator. `Decimator` keeps a decimated copy of a `RingBuffer`
+updated with only the samples written since the previous read, so a plot
+or a classifier can get a resampled window for the cost of the new
+samples.
+
+The output is delayed by the group delay of the filter, half of its length,
+the timestamps decimated with the same filter get the same delay, so they
+still match the data.
+"""
+
+from typing import Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import firwin
+
+from .ring_buffer import RingBuffer
+
+TAPS_PER_PHASE = 16
+
+
+# ----------------------------------------------------------------------
+def lowpass(factor: int, taps_per_phase: Optional[int] = TAPS_PER_PHASE):
+    """Anti-aliasing filter for a decimation factor.
+
+    The cutoff is at 80% of the new Nyquist frequency.
+    """
+    if factor <= 1:
+        return np.ones(1)
+    return firwin(taps_per_phase * factor + 1, 0.8 / factor)
+
+
+# ----------------------------------------------------------------------
+def _filter(
+    x: np.ndarray, taps: np.ndarray, first: int, factor: int, count: int
+) -> np.ndarray:
+    """Filter output for `count` samples, every `factor` samples.
+
+    The output `i` is calculated with the samples of `x` that end at the
+    position `first + i * factor`.
+    """
+    if not count:
+        return np.empty(x.shape[:-1] + (0,))
+    windows = sliding_window_view(x, taps.size, axis=-1)
+    start = first - taps.size + 1
+    stop = start + (count - 1) * factor + 1
+    windows = windows[..., start:stop:factor, :]
+    # The filter is symmetric, so there is no need to reverse it
+    return windows @ taps
+
+
+# ----------------------------------------------------------------------
+def decimate(
+    x: np.ndarray,
+    factor: int,
+    width: Optional[int] = None,
+    taps: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Decimate a window, aligned with its last sample.
+
+    Parameters
+    ----------
+    x
+        Array of shape (`channels, time`) or (`time`).
+    factor
+        Decimation factor.
+    width
+        Number of output samples, by default `time // factor`.
+    taps
+        The filter, by default the one of `lowpass`.
+
+    Returns
+    -------
+    array
+        Array of shape (`channels, width`).
+    """
+    factor = int(factor)
+    if taps is None:
+        taps = lowpass(factor)
+    if width is None:
+        width = x.shape[-1] // factor
+
+    padding = [(0, 0)] * (x.ndim - 1) + [(taps.size - 1, 0)]
+    x = np.pad(x, padding, mode='edge')
+    last = x.shape[-1] - 1
+    return _filter(x, taps, last - (width - 1) * factor, factor, width)
+
+
+########################################################################
+class Decimator:
+    """Decimated copy of a `RingBuffer`, updated incrementally.
+
+    The samples written in the source since the previous `update` are
+    filtered and decimated into a smaller `RingBuffer`, keeping the last
+    samples needed by the filter between updates. If the source is written
+    completely (or it is a new source), the decimated buffer is calculated
+    again from the whole source.
+
+    Parameters
+    ----------
+    ring
+        The source buffer.
+    factor
+        Decimation factor.
+    width
+        Length of the decimated buffer.
+    taps_per_phase
+        Size of the filter, relative to the factor.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(
+        self,
+        ring: RingBuffer,
+        factor: int,
+        width: int,
+        taps_per_phase: Optional[int] = TAPS_PER_PHASE,
+    ):
+        """"""
+        self.ring = ring
+        self.factor = int(factor)
+        self.width = int(width)
+        self.taps = lowpass(self.factor, taps_per_phase)
+
+        channels = ring.shape[0] if len(ring.shape) > 1 else None
+        self.output = RingBuffer(channels, self.width)
+
+        self._buffer = None
+        self._start = 0
+        self._processed = 0
+
+    # ----------------------------------------------------------------------
+    def _reset(self, written: int) -> None:
+        """Start again with the whole source."""
+        x = self.ring.view(end=written)
+        padding = [(0, 0)] * (x.ndim - 1) + [(self.taps.size - 1, 0)]
+        self._buffer = np.pad(x, padding, mode='edge')
+        self._processed = written
+        self._start = self._processed - self._buffer.shape[-1]
+
+    # ----------------------------------------------------------------------
+    def update(self) -> None:
+        """Decimate the samples written since the previous update."""
+        # Read once, the ring can be written by the stream hub meanwhile
+        written = self.ring.written
+        pending = written - self._processed
+        if self._buffer is None or not 0 <= pending < self.ring.length:
+            self._reset(written)
+        elif pending:
+            self._buffer = np.concatenate(
+                [self._buffer, self.ring.view(pending, written)], axis=-1
+            )
+            self._processed = written
+        else:
+            return
+
+        # The outputs are the positions `p` with `(p + 1) % factor == 0`,
+        # counted with the samples written in the source
+        first = self._start + self.taps.size - 1
+        first += (-(first + 1)) % self.factor
+        count = max(0, (self._processed - 1 - first) // self.factor + 1)
+
+        self.output.write(
+            _filter(
+                self._buffer,
+                self.taps,
+                first - self._start,
+                self.factor,
+                count,
+            )
+        )
+
+        # Keep only the samples needed for the next output
+        next_ = first + count * self.factor
+        keep = next_ - self.taps.size + 1 - self._start
+        self._buffer = self._buffer[..., keep:]
+        self._start += keep
+
+    # ----------------------------------------------------------------------
+    def view(self) -> np.ndarray:
+        """The decimated buffer, updated."""
+        self.update()
+        return self.output.view()
@@ -0,0 +1,459 @@
+"""
+===========
+Ring Buffer
+===========
+
+Preallocated circular buffers used to retain the last seconds of streamed
+data without reallocating memory on every package.
+"""
+
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+########################################################################
+class RingBuffer:
+    """Circular buffer with a write cursor and zero-copy windowed views.
+
+    The samples are stored twice, in a mirrored array of `2 * length`, so the
+    last `length` samples are always contiguous in memory and can be returned
+    as a view. Writing a package costs O(package) instead of the O(buffer) of
+    `np.roll`.
+
+    The returned views are updated in place by the next writes, use `copy()`
+    to keep a snapshot.
+
+    Parameters
+    ----------
+    channels
+        Number of rows, `None` for an 1D buffer.
+    length
+        Number of samples retained.
+    fill
+        Initialize buffer with this value.
+    dtype
+        Data type of the buffer.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(
+        self,
+        channels: Optional[int],
+        length: int,
+        fill: Optional[float] = 0,
+        dtype: Optional[type] = np.float64,
+    ):
+        """"""
+        self.length = int(length)
+        if channels is None:
+            self._data = np.empty(2 * self.length, dtype=dtype)
+        else:
+            self._data = np.empty((channels, 2 * self.length), dtype=dtype)
+        self._data.fill(fill)
+
+        self.cursor = 0
+        self.written = 0
+
+    # ----------------------------------------------------------------------
+    @property
+    def shape(self) -> tuple:
+        """The shape of the retained data."""
+        return self._data.shape[:-1] + (self.length,)
+
+    # ----------------------------------------------------------------------
+    def write(self, data: np.ndarray) -> None:
+        """Append new samples at the end of the buffer.
+
+        Parameters
+        ----------
+        data
+            Array of shape (`channels, time`), or (`time`) for 1D buffers.
+        """
+        n = data.shape[-1]
+        self.written += n
+
+        if n >= self.length:
+            # The cursor must follow `written` to keep the patterns aligned
+            self.cursor = self.written % self.length
+            data = np.roll(data[..., -self.length :], self.cursor, axis=-1)
+            self._data[..., : self.length] = data
+            self._data[..., self.length :] = data
+            return
+
+        start = self.cursor
+        end = start + n
+        if end <= self.length:
+            self._data[..., start:end] = data
+            self._data[..., start + self.length : end + self.length] = data
+        else:
+            k = self.length - start
+            self._data[..., start : self.length] = data[..., :k]
+            self._data[..., start + self.length :] = data[..., :k]
+            self._data[..., : n - k] = data[..., k:]
+            self._data[..., self.length : self.length + n - k] = data[..., k:]
+
+        self.cursor = end % self.length
+
+    # ----------------------------------------------------------------------
+    def view(
+        self, samples: Optional[int] = None, end: Optional[int] = None
+    ) -> np.ndarray:
+        """The last `samples` written, from the oldest to the newest.
+
+        Parameters
+        ----------
+        samples
+            Size of the window, by default the whole buffer.
+        end
+            Absolute position after the last sample of the window, counted
+            with `written`, by default the samples written so far. The
+            readers of a buffer written by other process read `written`
+            once and use it here, so the window does not move between the
+            reads.
+
+        Returns
+        -------
+        array
+            A view with shape (`channels, samples`).
+        """
+        if samples is None or samples > self.length:
+            samples = self.length
+        if end is None:
+            end = self.cursor + self.length
+        else:
+            end = end % self.length + self.length
+        return self._data[..., end - samples : end]
+
+    # ----------------------------------------------------------------------
+    def mirror(self, pattern: np.ndarray) -> np.ndarray:
+        """Align a static pattern with the current position of the buffer.
+
+        The result is equivalent to `np.roll(pattern, -written)` but without
+        any copy, so masks created for the buffer follow the stored samples.
+
+        Parameters
+        ----------
+        pattern
+            A pattern created with `tile_pattern`.
+        """
+        return pattern[..., self.cursor : self.cursor + self.length]
+
+    # ----------------------------------------------------------------------
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        """"""
+        if dtype is None:
+            return self.view()
+        return self.view().astype(dtype)
+
+    # ----------------------------------------------------------------------
+    def __getitem__(self, index) -> np.ndarray:
+        """"""
+        return self.view()[index]
+
+    # ----------------------------------------------------------------------
+    def __len__(self) -> int:
+        """"""
+        return self.length
+
+
+# ----------------------------------------------------------------------
+def tile_pattern(pattern: np.ndarray) -> np.ndarray:
+    """Duplicate a pattern to be used with `RingBuffer.mirror`."""
+    return np.concatenate([pattern, pattern], axis=-1)
+
+
+########################################################################
+class PackageAggregator:
+    """Join streamed packages into chunks of an exact size.
+
+    The packages are copied into a preallocated array, when enough samples
+    are available the complete chunks are returned and the remainder is
+    carried forward to the next one, so the cost is constant per sample
+    even if the package size is not a multiple of the streamed one.
+
+    Parameters
+    ----------
+    package_size
+        Number of samples of the chunks.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(self, package_size: int):
+        """"""
+        self.package_size = int(package_size)
+        self._data = None
+        self._size = 0
+
+    # ----------------------------------------------------------------------
+    def set_package_size(self, package_size: int) -> None:
+        """Change the size of the next chunks, pending samples are kept."""
+        self.package_size = int(package_size)
+
+    # ----------------------------------------------------------------------
+    def push(self, data: np.ndarray) -> list:
+        """Add a new package.
+
+        Parameters
+        ----------
+        data
+            Array of shape (`channels, time`).
+
+        Returns
+        -------
+        list
+            The chunks completed with this package, arrays of shape
+            (`channels, package_size`).
+        """
+        n = data.shape[-1]
+
+        if self._data is None or self._data.shape[:-1] != data.shape[:-1]:
+            self._size = 0
+            self._data = np.empty(
+                data.shape[:-1] + (2 * self.package_size + n,),
+                dtype=data.dtype,
+            )
+        elif self._data.shape[-1] < self._size + n:
+            data_ = np.empty(
+                data.shape[:-1] + (2 * self.package_size + n,),
+                dtype=self._data.dtype,
+            )
+            data_[..., : self._size] = self._data[..., : self._size]
+            self._data = data_
+
+        self._data[..., self._size : self._size + n] = data
+        self._size += n
+
+        chunks = []
+        start = 0
+        while self._size - start >= self.package_size:
+            chunks.append(
+                self._data[..., start : start + self.package_size].copy()
+            )
+            start += self.package_size
+
+        if start:
+            self._size -= start
+            self._data[..., : self._size] = self._data[
+                ..., start : start + self._size
+            ]
+
+        return chunks
+
+
+########################################################################
+class TimestampInterpolator:
+    """Timestamps for each sample of the streamed packages.
+
+    The `timestamp.binary` of a package is the time of its last sample, the
+    timestamps of the other samples are calculated once, when the package
+    arrives, following a clock that advances with the samples elapsed. The
+    elapsed samples are counted with the `sample_ids` (a cyclic counter
+    from 0 to 255), so the lost samples are also counted, or with the size
+    of the package if the ids are not available.
+
+    The difference between the clock and the package timestamp is corrected
+    gradually, a fraction on each package, so the jitter of the packages is
+    smoothed and the timestamps are always increasing. Differences greater
+    than `max_error` restart the clock.
+
+    Parameters
+    ----------
+    sample_rate
+        Samples per second.
+    correction
+        Fraction of the difference corrected on each package.
+    max_error
+        Difference in seconds to restart the clock.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(
+        self,
+        sample_rate: float,
+        correction: Optional[float] = 0.1,
+        max_error: Optional[float] = 1,
+    ):
+        """"""
+        self.sample_rate = sample_rate
+        self.correction = correction
+        self.max_error = max_error
+        self.last = None
+        self.last_id = None
+
+    # ----------------------------------------------------------------------
+    def _elapsed(self, n: int, sample_ids: Optional[np.ndarray]) -> np.ndarray:
+        """Samples elapsed since the previous package for each sample."""
+        if sample_ids is None:
+            self.last_id = None
+            return np.arange(1, n + 1, dtype=float)
+
+        ids = np.asarray(sample_ids)
+        if ids.ndim > 1:
+            ids = ids[0]  # the first board
+        if ids.size != n:
+            self.last_id = None
+            return np.arange(1, n + 1, dtype=float)
+
+        previous = ids[0] - 1 if self.last_id is None else self.last_id
+        steps = np.diff(ids, prepend=previous) % 256
+        steps[steps == 0] = 1  # repeated ids are not expected
+        self.last_id = ids[-1]
+        return np.cumsum(steps, dtype=float)
+
+    # ----------------------------------------------------------------------
+    def __call__(
+        self,
+        n: int,
+        timestamp: float,
+        sample_ids: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """Timestamps of a package.
+
+        Parameters
+        ----------
+        n
+            Samples in the package.
+        timestamp
+            Time of the last sample.
+        sample_ids
+            Ids of the samples, of shape (`time`) or (`boards, time`).
+
+        Returns
+        -------
+        array
+            Timestamps of shape (`time`).
+        """
+        elapsed = self._elapsed(n, sample_ids) / self.sample_rate
+
+        error = 0
+        if self.last is not None:
+            error = timestamp - (self.last + elapsed[-1])
+        if self.last is None or abs(error) > self.max_error:
+            self.last = timestamp - elapsed[-1]
+            error = 0
+
+        # Limited to keep the timestamps increasing
+        correction = np.clip(
+            self.correction * error, -elapsed[-1] / 2, elapsed[-1] / 2
+        )
+        timestamps = self.last + elapsed * (1 + correction / elapsed[-1])
+        self.last = timestamps[-1]
+        return timestamps
+
+
+########################################################################
+class TimestampIndex:
+    """Map timestamps to sample positions of a buffer.
+
+    The buffer must contain a timestamp for every sample, increasing, as
+    the ones created with `TimestampInterpolator`, so the positions are
+    found with a binary search over the buffer, without copies. The
+    positions are absolute, counted with `written` of the buffer.
+
+    Parameters
+    ----------
+    ring
+        The buffer with the timestamps, a `RingBuffer` or any object with
+        its interface.
+    sample_rate
+        Used to extrapolate out of the buffer.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(self, ring: RingBuffer, sample_rate: float):
+        """"""
+        self.ring = ring
+        self.sample_rate = sample_rate
+        self.written = 0
+
+    # ----------------------------------------------------------------------
+    def update(self) -> None:
+        """Set the samples available for the next searches.
+
+        The searches use only the samples written before this call, even
+        if the buffer is written in the meanwhile.
+        """
+        self.written = self.ring.written
+
+    # ----------------------------------------------------------------------
+    def _view(self) -> Tuple[np.ndarray, int]:
+        """The timestamps written and the position of the first one."""
+        written = self.written
+        samples = min(written, self.ring.length)
+        return self.ring.view(samples, written), written - samples
+
+    # ----------------------------------------------------------------------
+    def locate(self, timestamps: np.ndarray) -> np.ndarray:
+        """Absolute positions (not rounded) of a set of timestamps.
+
+        Timestamps outside the buffer are extrapolated with the sample rate,
+        `nan` is returned if there are no samples.
+        """
+        timestamps = np.asarray(timestamps, dtype=float)
+        view, first = self._view()
+        if not view.size:
+            return np.full(timestamps.shape, np.nan)
+
+        index = np.clip(view.searchsorted(timestamps), 1, view.size - 1)
+        if view.size == 1:
+            index = np.zeros(timestamps.shape, dtype=int)
+            delta = 1 / self.sample_rate
+        else:
+            delta = view[index] - view[index - 1]
+            index = index - 1
+
+        # Linear between the neighbours, extrapolated at the edges
+        delta = np.where(delta > 0, delta, 1 / self.sample_rate)
+        return first + index + (timestamps - view[index]) / delta
+
+    # ----------------------------------------------------------------------
+    def timestamp(self, positions: np.ndarray) -> np.ndarray:
+        """Timestamps of a set of absolute positions."""
+        positions = np.asarray(positions, dtype=float)
+        view, first = self._view()
+        if not view.size:
+            return np.full(positions.shape, np.nan)
+
+        index = np.clip(positions - first, 0, view.size - 1).astype(int)
+        return view[index] + (positions - first - index) / self.sample_rate
+
+
+# ----------------------------------------------------------------------
+def take_windows(
+    ring: RingBuffer,
+    starts: np.ndarray,
+    samples: int,
+    written: Optional[int] = None,
+) -> np.ndarray:
+    """Stack windows of a buffer.
+
+    Parameters
+    ----------
+    ring
+        The buffer.
+    starts
+        Absolute position of the first sample of each window, all the
+        windows must be retained in the buffer.
+    samples
+        Size of the windows.
+    written
+        The samples written when the positions were calculated, as in
+        `TimestampIndex.written`, by default the current `ring.written`.
+
+    Returns
+    -------
+    array
+        Array of shape (`windows, channels, samples`), or (`windows,
+        samples`) for 1D buffers.
+    """
+    if written is None:
+        written = ring.written
+    oldest = written - ring.length
+    index = (np.asarray(starts, dtype=int) - oldest)[:, None] + np.arange(
+        samples
+    )
+    windows = ring.view(end=written)[..., index]
+    if windows.ndim == 3:
+        return windows.transpose(1, 0, 2)
+    return windows
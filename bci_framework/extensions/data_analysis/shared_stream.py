@@ -0,0 +1,536 @@
+"""
+=============
+Shared Stream
+=============
+
+Fan-out of the live `eeg` and `aux` streams through shared memory.
+
+The stream hub (`kafka_scripts/stream_hub.py`) consumes Kafka once and
+writes every package into a `SharedRing`, one per topic, so the local
+extensions can attach to the rings instead of fetching and deserializing the
+same packages on their own consumers. The rings use the same mirrored layout
+of `RingBuffer`, the last samples are always contiguous in memory and can be
+read as views, without copies.
+
+Each package gets a sequence number, the readers keep the last sequence
+consumed and get all the packages written since then. A reader that falls
+behind more than the packages retained skips to the newest ones.
+
+>>> ring = SharedRing.attach('eeg')
+>>> for message in ring.messages():
+...     message.value['data']
+"""
+
+import time
+import logging
+from multiprocessing import shared_memory, resource_tracker
+from typing import Optional, List, Tuple, Iterator
+
+import numpy as np
+
+PREFIX = 'bcistream'
+VERSION = 1
+SLOTS = 256
+POLL_INTERVAL = 0.005
+
+# Header fields
+(
+    _VERSION,
+    _STATE,
+    _CHANNELS,
+    _LENGTH,
+    _SLOTS,
+    _SAMPLE_ROWS,
+    _SAMPLE_NDIM,
+    _WRITTEN,
+    _SEQUENCE,
+) = range(9)
+HEADER = 16
+
+# Package fields, followed by the `timestamp.binary` of each board
+_SEQ, _END, _SIZE, _KAFKA_TIMESTAMP, _BOARDS = range(5)
+MAX_BOARDS = 8
+PACKAGE = 5 + MAX_BOARDS
+
+
+# ----------------------------------------------------------------------
+def ring_name(topic: str) -> str:
+    """Name of the shared memory block for a topic."""
+    return f'{PREFIX}_{topic}'
+
+
+########################################################################
+class SharedMessage:
+    """A package read from a `SharedRing`, with the interface of the Kafka
+    messages used by `loop_consumer`.
+
+    The `data` is a view of the ring, valid until the ring wraps around.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(
+        self, topic: str, data: np.ndarray, context: dict, timestamp: float
+    ):
+        """"""
+        self.topic = topic
+        self.value = {'data': data, 'context': context}
+        self.timestamp = timestamp
+
+
+########################################################################
+class SharedRing:
+    """Mirrored ring buffer in a shared memory block.
+
+    Use `SharedRing.create` in the writer and `SharedRing.attach` in the
+    readers.
+
+    Parameters
+    ----------
+    shm
+        The shared memory block.
+    topic
+        The topic stored in the ring.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(self, shm: shared_memory.SharedMemory, topic: str):
+        """"""
+        self.shm = shm
+        self.topic = topic
+        self.owner = False
+
+        self.header = np.ndarray((HEADER,), dtype=np.int64, buffer=shm.buf)
+        self._map(
+            int(self.header[_CHANNELS]),
+            int(self.header[_LENGTH]),
+            int(self.header[_SLOTS]),
+            int(self.header[_SAMPLE_ROWS]),
+        )
+        self.sequence = int(self.header[_SEQUENCE])
+
+    # ----------------------------------------------------------------------
+    @staticmethod
+    def _layout(
+        channels: int, length: int, slots: int, sample_rows: int
+    ) -> List[Tuple[str, tuple]]:
+        """Shapes of the arrays stored after the header."""
+        return [
+            ('packages', (slots, PACKAGE)),
+            ('data', (channels, 2 * length)),
+            ('timestamp', (2 * length,)),
+            ('sample_ids', (sample_rows, 2 * length)),
+        ]
+
+    # ----------------------------------------------------------------------
+    @classmethod
+    def _size(
+        cls, channels: int, length: int, slots: int, sample_rows: int
+    ) -> int:
+        """"""
+        size = HEADER
+        for _, shape in cls._layout(channels, length, slots, sample_rows):
+            size += int(np.prod(shape))
+        return 8 * size
+
+    # ----------------------------------------------------------------------
+    def _map(
+        self, channels: int, length: int, slots: int, sample_rows: int
+    ) -> None:
+        """Create the arrays over the shared memory."""
+        self.channels = channels
+        self.length = length
+        self.slots = slots
+
+        offset = 8 * HEADER
+        for name, shape in self._layout(
+            channels, length, slots, sample_rows
+        ):
+            array = np.ndarray(
+                shape, dtype=np.float64, buffer=self.shm.buf, offset=offset
+            )
+            setattr(self, f'_{name}', array)
+            offset += array.nbytes
+
+    # ----------------------------------------------------------------------
+    @classmethod
+    def create(
+        cls,
+        topic: str,
+        channels: int,
+        length: int,
+        sample_rows: Optional[int] = 0,
+        sample_ndim: Optional[int] = 1,
+        slots: Optional[int] = SLOTS,
+    ) -> 'SharedRing':
+        """Create the ring for a topic, replacing any previous one.
+
+        Parameters
+        ----------
+        topic
+            The topic stored in the ring.
+        channels
+            Number of rows of the data.
+        length
+            Number of samples retained.
+        sample_rows
+            Number of rows of the `sample_ids`, `0` if not streamed.
+        sample_ndim
+            Dimensions of the `sample_ids` as they are streamed.
+        slots
+            Number of packages retained.
+        """
+        try:
+            # The readers attached to a previous ring must detach
+            stale = shared_memory.SharedMemory(ring_name(topic))
+            np.ndarray((HEADER,), dtype=np.int64, buffer=stale.buf)[
+                _STATE
+            ] = 0
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+
+        shm = shared_memory.SharedMemory(
+            ring_name(topic),
+            create=True,
+            size=cls._size(channels, length, slots, sample_rows),
+        )
+        header = np.ndarray((HEADER,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[_CHANNELS] = channels
+        header[_LENGTH] = length
+        header[_SLOTS] = slots
+        header[_SAMPLE_ROWS] = sample_rows
+        header[_SAMPLE_NDIM] = sample_ndim
+        header[_VERSION] = VERSION
+        header[_STATE] = 1
+
+        ring = cls(shm, topic)
+        ring.owner = True
+        return ring
+
+    # ----------------------------------------------------------------------
+    @classmethod
+    def attach(cls, topic: str) -> Optional['SharedRing']:
+        """Attach to the ring of a topic, `None` if there is no hub."""
+        try:
+            shm = shared_memory.SharedMemory(ring_name(topic))
+        except (FileNotFoundError, ValueError):
+            return None
+
+        # Only the hub can unlink the block
+        try:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+
+        header = np.ndarray((HEADER,), dtype=np.int64, buffer=shm.buf)
+        valid = header[_VERSION] == VERSION and header[_STATE]
+        del header
+        if not valid:
+            shm.close()
+            return None
+        return cls(shm, topic)
+
+    # ----------------------------------------------------------------------
+    @property
+    def alive(self) -> bool:
+        """The hub is still writing in this ring."""
+        return bool(self.header[_STATE])
+
+    # ----------------------------------------------------------------------
+    @property
+    def written(self) -> int:
+        """Total number of samples written."""
+        return int(self.header[_WRITTEN])
+
+    # ----------------------------------------------------------------------
+    def _write(self, array: np.ndarray, start: int, data: np.ndarray) -> None:
+        """Write samples in both halves of a mirrored array."""
+        n = data.shape[-1]
+        end = start + n
+        if end <= self.length:
+            array[..., start:end] = data
+            array[..., start + self.length : end + self.length] = data
+        else:
+            k = self.length - start
+            array[..., start : self.length] = data[..., :k]
+            array[..., start + self.length :] = data[..., :k]
+            array[..., : n - k] = data[..., k:]
+            array[..., self.length : self.length + n - k] = data[..., k:]
+
+    # ----------------------------------------------------------------------
+    def write(
+        self,
+        data: np.ndarray,
+        timestamps: np.ndarray,
+        binary: List[float],
+        kafka_timestamp: Optional[float] = 0,
+        sample_ids: Optional[np.ndarray] = None,
+    ) -> None:
+        """Append a package.
+
+        The samples are written before the sequence number, so a reader never
+        sees a package that is not completely written.
+
+        Parameters
+        ----------
+        data
+            Array of shape (`channels, time`).
+        timestamps
+            Timestamp of each sample, of shape (`time`).
+        binary
+            The `timestamp.binary` of each board.
+        kafka_timestamp
+            Timestamp of the Kafka message, in milliseconds.
+        sample_ids
+            The `sample_ids` of the package.
+        """
+        data = data[..., -self.length :]
+        n = data.shape[-1]
+        written = self.written
+        start = written % self.length
+        binary = list(binary)[:MAX_BOARDS]
+
+        self._write(self._data, start, data)
+        self._write(self._timestamp, start, timestamps[-n:])
+        if self._sample_ids.shape[0] and sample_ids is not None:
+            sample_ids = np.asarray(sample_ids).reshape(-1, n)
+            self._write(self._sample_ids, start, sample_ids[..., -n:])
+
+        sequence = int(self.header[_SEQUENCE]) + 1
+        package = self._packages[sequence % self.slots]
+        package[:_BOARDS] = [sequence, written + n, n, kafka_timestamp]
+        package[_BOARDS] = len(binary)
+        package[_BOARDS + 1 : _BOARDS + 1 + len(binary)] = binary
+        self.header[_WRITTEN] = written + n
+        self.header[_SEQUENCE] = sequence
+
+    # ----------------------------------------------------------------------
+    def view(self, samples: Optional[int] = None) -> np.ndarray:
+        """The last `samples` of the data, a view of the shared memory."""
+        return self._view(self._data, samples)
+
+    # ----------------------------------------------------------------------
+    def timestamp_view(self, samples: Optional[int] = None) -> np.ndarray:
+        """The timestamps of the last `samples`."""
+        return self._view(self._timestamp, samples)
+
+    # ----------------------------------------------------------------------
+    def _view(
+        self,
+        array: np.ndarray,
+        samples: Optional[int] = None,
+        end: Optional[int] = None,
+    ) -> np.ndarray:
+        """"""
+        if samples is None or samples > self.length:
+            samples = self.length
+        if end is None:
+            end = self.written
+        end = end % self.length + self.length
+        return array[..., end - samples : end]
+
+    # ----------------------------------------------------------------------
+    def packages(self) -> List[SharedMessage]:
+        """The packages written since the previous call.
+
+        If the reader is behind more than the packages retained, the oldest
+        ones are skipped.
+        """
+        sequence = int(self.header[_SEQUENCE])
+        if sequence <= self.sequence:
+            return []
+
+        first = max(self.sequence + 1, sequence - self.slots + 1)
+        messages = []
+        for seq in range(first, sequence + 1):
+            package = self._packages[seq % self.slots].copy()
+            if int(package[_SEQ]) != seq:
+                continue  # overwritten while reading
+            messages.append(self._message(package))
+
+        self.sequence = sequence
+        return messages
+
+    # ----------------------------------------------------------------------
+    def _message(self, package: np.ndarray) -> SharedMessage:
+        """"""
+        end, n = int(package[_END]), int(package[_SIZE])
+        boards = int(package[_BOARDS])
+        context = {
+            'timestamp.binary': package[_BOARDS + 1 : _BOARDS + 1 + boards],
+            'samples': [n],
+        }
+        if self._sample_ids.shape[0]:
+            sample_ids = self._view(self._sample_ids, n, end)
+            if self.header[_SAMPLE_NDIM] == 1:
+                sample_ids = sample_ids[0]
+            context['sample_ids'] = sample_ids
+
+        return SharedMessage(
+            self.topic,
+            self._view(self._data, n, end),
+            context,
+            package[_KAFKA_TIMESTAMP],
+        )
+
+    # ----------------------------------------------------------------------
+    def messages(self) -> Iterator[SharedMessage]:
+        """Iterate over the new packages while the hub is alive."""
+        while self.alive:
+            messages = self.packages()
+            if not messages:
+                time.sleep(POLL_INTERVAL)
+            yield from messages
+
+    # ----------------------------------------------------------------------
+    def close(self) -> None:
+        """Detach from the ring, the hub also removes it."""
+        if self.owner:
+            self.header[_STATE] = 0
+
+        for name in ['header', '_packages', '_data', '_timestamp']:
+            setattr(self, name, None)
+        self._sample_ids = None
+
+        try:
+            if self.owner:
+                self.shm.unlink()
+            self.shm.close()
+        except (BufferError, FileNotFoundError) as e:
+            logging.warning(f'Shared ring `{self.topic}`: {e}')
+
+
+########################################################################
+class SharedRingView:
+    """Read-only `RingBuffer` over a `SharedRing`.
+
+    Used by `DataAnalysis.create_buffer` to expose the hub data as the
+    buffers of the extension, `write` is not supported since the hub is
+    the only writer. If the hub creates the ring again, the view attach to
+    the new one and `written` continues increasing.
+
+    Parameters
+    ----------
+    ring
+        The attached ring.
+    length
+        Number of samples of the buffer, must not exceed the ring length.
+    timestamp
+        Expose the timestamps instead of the data.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(
+        self,
+        ring: SharedRing,
+        length: int,
+        timestamp: Optional[bool] = False,
+    ):
+        """"""
+        self.length = int(length)
+        self.timestamp = timestamp
+        self._base = 0
+        self._last_attach = 0
+        self._set_ring(ring)
+
+    # ----------------------------------------------------------------------
+    def _set_ring(self, ring: SharedRing) -> None:
+        """"""
+        self.ring = ring
+        self._array = ring._timestamp if self.timestamp else ring._data
+
+    # ----------------------------------------------------------------------
+    def _check(self) -> None:
+        """Attach to a new ring if the hub replaced the current one."""
+        if self.ring.alive or time.time() < self._last_attach + 1:
+            return
+        self._last_attach = time.time()
+
+        ring = SharedRing.attach(self.ring.topic)
+        if ring is None:
+            return
+        if ring.channels != self.ring.channels or ring.length < self.length:
+            ring.close()
+            return
+        self._base += self.ring.written
+        self._set_ring(ring)
+
+    # ----------------------------------------------------------------------
+    @property
+    def written(self) -> int:
+        """"""
+        self._check()
+        return self._base + self.ring.written
+
+    # ----------------------------------------------------------------------
+    @property
+    def cursor(self) -> int:
+        """"""
+        return self.written % self.length
+
+    # ----------------------------------------------------------------------
+    @property
+    def shape(self) -> tuple:
+        """"""
+        return self._array.shape[:-1] + (self.length,)
+
+    # ----------------------------------------------------------------------
+    def view(
+        self, samples: Optional[int] = None, end: Optional[int] = None
+    ) -> np.ndarray:
+        """The last `samples` written, a view of the shared memory.
+
+        The hub moves `written` at any moment, see `RingBuffer.view` for
+        `end`.
+        """
+        if samples is None or samples > self.length:
+            samples = self.length
+        self._check()
+        if end is not None:
+            end -= self._base
+        return self.ring._view(self._array, samples, end)
+
+    # ----------------------------------------------------------------------
+    def mirror(self, pattern: np.ndarray) -> np.ndarray:
+        """Same as `RingBuffer.mirror`."""
+        return pattern[..., self.cursor : self.cursor + self.length]
+
+    # ----------------------------------------------------------------------
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        """"""
+        if dtype is None:
+            return self.view()
+        return self.view().astype(dtype)
+
+    # ----------------------------------------------------------------------
+    def __getitem__(self, index) -> np.ndarray:
+        """"""
+        return self.view()[index]
+
+    # ----------------------------------------------------------------------
+    def __len__(self) -> int:
+        """"""
+        return self.length
+
+
+# ----------------------------------------------------------------------
+def attach_buffer(
+    topic: str, channels: int, length: int
+) -> Optional[Tuple[SharedRingView, SharedRingView]]:
+    """Data and timestamps buffers of a topic served by the hub.
+
+    `None` if the hub is not running or the ring does not match the
+    requested shape.
+    """
+    ring = SharedRing.attach(topic)
+    if ring is None:
+        return None
+    if ring.channels != channels or ring.length < length:
+        ring.close()
+        return None
+    return (
+        SharedRingView(ring, length),
+        SharedRingView(ring, length, timestamp=True),
+    )
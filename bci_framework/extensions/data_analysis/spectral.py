@@ -0,0 +1,348 @@
+"""
+========
+Spectral
+========
+
+Spectral estimation for the streaming extensions.
+
+`StreamingWelch` keeps the periodograms of the segments of a `RingBuffer`,
+aligned with the samples written in it, so after each package only the new
+segments are transformed and the Welch estimate is the mean of the cached
+ones. The frequency axes, the windows and the band masks are cached by
+configuration, and `band_power` calculates all the bands of all the
+channels with a single product.
+
+.. code-block:: python
+
+    welch = StreamingWelch(ring, fs=250, nperseg=250)
+    freqs, psd = welch.psd(segments=8)
+    alpha, beta = band_power(psd, 250, 250, [(8, 12), (12, 30)]).T
+"""
+
+import warnings
+from functools import lru_cache
+from typing import Optional, Sequence, Tuple, Union, Literal
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import get_window
+
+from .ring_buffer import RingBuffer
+
+Bands = Union[Sequence[Tuple[float, float]], dict]
+
+
+# ----------------------------------------------------------------------
+def _readonly(x: np.ndarray) -> np.ndarray:
+    """"""
+    x.setflags(write=False)
+    return x
+
+
+# ----------------------------------------------------------------------
+@lru_cache(maxsize=64)
+def frequencies(n: int, fs: float) -> np.ndarray:
+    """Frequency axis of the `rfft` of `n` samples, cached."""
+    return _readonly(np.fft.rfftfreq(n, 1 / fs))
+
+
+# ----------------------------------------------------------------------
+@lru_cache(maxsize=64)
+def window_function(window: str, n: int) -> np.ndarray:
+    """Window of `n` samples, cached."""
+    return _readonly(get_window(window, n))
+
+
+# ----------------------------------------------------------------------
+@lru_cache(maxsize=64)
+def _band_matrix(n: int, fs: float, bands: tuple) -> np.ndarray:
+    """"""
+    freqs = frequencies(n, fs)
+    masks = np.array(
+        [(freqs >= low) & (freqs <= high) for low, high in bands], dtype=float
+    )
+    return _readonly(masks)
+
+
+# ----------------------------------------------------------------------
+def band_masks(n: int, fs: float, bands: Bands) -> np.ndarray:
+    """Masks of the bands over the frequency axis of `n` samples.
+
+    Parameters
+    ----------
+    n
+        Number of samples of the transform.
+    fs
+        Sample rate.
+    bands
+        Sequence of `(low, high)` limits in Hz, both included, or a
+        dictionary with them as values.
+
+    Returns
+    -------
+    array
+        Array of shape (`bands, frequencies`), with ones in the bins of each
+        band, cached for each configuration.
+    """
+    if isinstance(bands, dict):
+        bands = bands.values()
+    bands = tuple((float(low), float(high)) for low, high in bands)
+    return _band_matrix(int(n), float(fs), bands)
+
+
+# ----------------------------------------------------------------------
+def band_power(
+    psd: np.ndarray,
+    n: int,
+    fs: float,
+    bands: Bands,
+    reduce: Literal['sum', 'mean'] = 'sum',
+) -> np.ndarray:
+    """Power of several bands for all the channels.
+
+    Parameters
+    ----------
+    psd
+        Array of shape (`..., frequencies`).
+    n
+        Number of samples of the transform that produced `psd`.
+    fs
+        Sample rate.
+    bands
+        The bands, as in `band_masks`.
+    reduce
+        `sum` or `mean` of the bins of each band.
+
+    Returns
+    -------
+    array
+        Array of shape (`..., bands`).
+    """
+    masks = band_masks(n, fs, bands)
+    power = psd @ masks.T
+    if reduce == 'mean':
+        power = power / masks.sum(axis=1)
+    return power
+
+
+# ----------------------------------------------------------------------
+def _segment_size(x: np.ndarray, nperseg: int) -> int:
+    """The segment size for a window, as `scipy.signal.welch` does."""
+    nperseg = int(nperseg)
+    if nperseg > x.shape[-1]:
+        warnings.warn(
+            f'nperseg = {nperseg} is greater than input length = '
+            f'{x.shape[-1]}, using nperseg = {x.shape[-1]}'
+        )
+        nperseg = x.shape[-1]
+    return nperseg
+
+
+# ----------------------------------------------------------------------
+def periodograms(
+    x: np.ndarray,
+    fs: float,
+    nperseg: int,
+    step: int,
+    window: Optional[str] = 'hann',
+    scaling: Literal['density', 'spectrum'] = 'density',
+) -> np.ndarray:
+    """One-sided periodograms of the segments of a window.
+
+    The segments start in the first sample and are `step` samples apart,
+    the mean is removed from each one, as in `scipy.signal.welch`.
+
+    Parameters
+    ----------
+    x
+        Array of shape (`channels, time`).
+    nperseg
+        Size of the segments, reduced to the size of the window if it is
+        shorter.
+
+    Returns
+    -------
+    array
+        Array of shape (`channels, segments, frequencies`).
+    """
+    nperseg = _segment_size(x, nperseg)
+    win = window_function(window, nperseg)
+    segments = sliding_window_view(x, nperseg, axis=-1)[..., ::step, :]
+    segments = segments - segments.mean(axis=-1, keepdims=True)
+    spectrum = np.fft.rfft(segments * win, axis=-1)
+    power = spectrum.real**2 + spectrum.imag**2
+
+    if scaling == 'density':
+        power *= 1 / (fs * (win**2).sum())
+    else:
+        power *= 1 / win.sum() ** 2
+
+    # One-sided, the Nyquist bin is not doubled
+    if nperseg % 2:
+        power[..., 1:] *= 2
+    else:
+        power[..., 1:-1] *= 2
+    return power
+
+
+# ----------------------------------------------------------------------
+def welch(
+    x: np.ndarray,
+    fs: float,
+    nperseg: int,
+    noverlap: Optional[int] = None,
+    window: Optional[str] = 'hann',
+    scaling: Literal['density', 'spectrum'] = 'density',
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Welch estimate of a whole window, with the cached windows.
+
+    Parameters
+    ----------
+    x
+        Array of shape (`channels, time`).
+    nperseg
+        Size of the segments, reduced to the size of the window if it is
+        shorter.
+    noverlap
+        Samples shared by consecutive segments, by default `nperseg // 2`.
+
+    Returns
+    -------
+    freqs, psd
+        The frequency axis and an array of shape (`channels, frequencies`).
+    """
+    nperseg = _segment_size(x, nperseg)
+    if noverlap is None:
+        noverlap = nperseg // 2
+    power = periodograms(x, fs, nperseg, nperseg - noverlap, window, scaling)
+    return frequencies(nperseg, fs), power.mean(axis=-2)
+
+
+########################################################################
+class StreamingWelch:
+    """Welch estimate of a `RingBuffer`, updated with the new segments.
+
+    The segments end in the positions multiple of `nperseg - noverlap`,
+    counted with the samples written in the source, so a segment never
+    changes once it is complete. Each `update` transforms only the segments
+    completed since the previous one and keeps their periodograms, and the
+    estimate is the mean of the last of them. If the source is written
+    completely (or it is a new source) the periodograms are calculated again
+    from the whole source.
+
+    Parameters
+    ----------
+    ring
+        The source buffer, of shape (`channels, time`).
+    fs
+        Sample rate.
+    nperseg
+        Length of each segment.
+    noverlap
+        Samples shared by consecutive segments, by default `nperseg // 2`.
+    window
+        Name of the window for `scipy.signal.get_window`.
+    scaling
+        `density` for V**2/Hz, or `spectrum` for V**2.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(
+        self,
+        ring: RingBuffer,
+        fs: float,
+        nperseg: int,
+        noverlap: Optional[int] = None,
+        window: Optional[str] = 'hann',
+        scaling: Literal['density', 'spectrum'] = 'density',
+    ):
+        """"""
+        self.ring = ring
+        self.fs = fs
+        self.nperseg = int(nperseg)
+        if noverlap is None:
+            noverlap = self.nperseg // 2
+        self.step = self.nperseg - int(noverlap)
+        self.window = window
+        self.scaling = scaling
+        self.freqs = frequencies(self.nperseg, fs)
+
+        self.channels = ring.shape[0]
+        self.length = (ring.length - self.nperseg) // self.step + 1
+        self._periodograms = RingBuffer(
+            self.channels * self.freqs.size, self.length
+        )
+        self._next = None
+        self._processed = None
+
+    # ----------------------------------------------------------------------
+    def segments(self, samples: Optional[int] = None) -> int:
+        """Number of complete segments in a window of `samples`."""
+        if samples is None:
+            return self.length
+        return max((int(samples) - self.nperseg) // self.step + 1, 1)
+
+    # ----------------------------------------------------------------------
+    def _reset(self, written: int) -> None:
+        """Start again with the whole source."""
+        first = written - self.ring.length + self.nperseg
+        self._next = -(-first // self.step) * self.step
+        self._periodograms = RingBuffer(
+            self.channels * self.freqs.size, self.length
+        )
+
+    # ----------------------------------------------------------------------
+    def update(self) -> None:
+        """Transform the segments completed since the previous update."""
+        written = self.ring.written
+        if (
+            self._next is None
+            or written < self._processed
+            or self._next - self.nperseg < written - self.ring.length
+        ):
+            # The next segment is not in the source anymore
+            self._reset(written)
+        self._processed = written
+
+        count = (written - self._next) // self.step + 1
+        if count <= 0:
+            return
+
+        start = self._next - self.nperseg
+        x = self.ring.view(written - start, written)
+        x = x[..., : (count - 1) * self.step + self.nperseg]
+        power = periodograms(
+            x, self.fs, self.nperseg, self.step, self.window, self.scaling
+        )
+        # Rows of (`channel, frequency`) and the segments along the ring
+        self._periodograms.write(
+            power.transpose(0, 2, 1).reshape(-1, power.shape[1])
+        )
+        self._next += count * self.step
+
+    # ----------------------------------------------------------------------
+    def psd(
+        self, segments: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Mean of the periodograms of the last segments.
+
+        Parameters
+        ----------
+        segments
+            Number of segments averaged, by default all the segments in the
+            source, see `segments` to get them from a window length.
+
+        Returns
+        -------
+        freqs, psd
+            The frequency axis and an array of shape (`channels,
+            frequencies`).
+        """
+        self.update()
+        available = min(
+            self._periodograms.written, self._periodograms.length
+        )
+        segments = min(segments or self.length, max(available, 1))
+        power = self._periodograms.view(segments)
+        power = power.reshape(self.channels, self.freqs.size, segments)
+        return self.freqs, power.mean(axis=-1)
@@ -14,13 +14,15 @@ import random
 from datetime import datetime, timedelta
 from multiprocessing import Process
 from threading import Thread
-from typing import Callable
+from queue import Queue, Empty
+from typing import Callable, Iterator
 import re
 
 import numpy as np
-from openbci_stream.acquisition import OpenBCIConsumer
-
 from ...extensions import properties as prop
+from ...extensions.serializers import consumer
+from .ring_buffer import PackageAggregator, TimestampIndex, take_windows
+from .shared_stream import SharedRing
 
 
 class data:
@@ -29,10 +31,6 @@ class data:
     }
 
 
-data_tmp_aux_ = None
-data_tmp_eeg_ = None
-
-
 # ----------------------------------------------------------------------
 def subprocess_this(fn: Callable) -> Callable:
     """Decorator to move methods to subprocessing."""
@@ -70,41 +68,174 @@ def timeit(fn: Callable) -> Callable:
 
 
 # ----------------------------------------------------------------------
-def loop_consumer(*topics, package_size=None) -> Callable:
+def _poll_topic(topics: list, queue: Queue) -> None:
+    """Consume the topics and put the messages in a shared queue.
+
+    If the consumer fails the exception is put in the queue, to be raised
+    by the consuming loop instead of waiting forever for new messages.
+    """
+    try:
+        with consumer(topics) as stream:
+            for message in stream:
+                queue.put(message)
+    except Exception as e:
+        logging.error(f'Consumer for `{topics}` stopped: {e}')
+        queue.put(e)
+
+
+# ----------------------------------------------------------------------
+def _poll_shared(ring: SharedRing, queue: Queue) -> None:
+    """Put the packages of a shared ring in a queue.
+
+    When the hub is stopped the ring is attached again as soon as the hub
+    is restarted.
+    """
+    topic = ring.topic
+    while True:
+        for message in ring.messages():
+            queue.put(message)
+
+        while (ring := SharedRing.attach(topic)) is None:
+            time.sleep(1)
+
+
+# ----------------------------------------------------------------------
+def _get(queue: Queue, block: bool = True):
+    """Next message of the queue, raise the errors of the pollers."""
+    message = queue.get(block)
+    if isinstance(message, Exception):
+        raise message
+    return message
+
+
+# ----------------------------------------------------------------------
+def _stream_batches(
+    topics: list, threaded: bool, shared: bool = False
+) -> Iterator[list]:
+    """Iterate over lists of Kafka messages.
+
+    In threaded mode every topic is polled on its own thread and each list
+    contains all the messages arrived since the previous iteration, otherwise
+    lists contain a single message.
+
+    With `shared` the `eeg` and `aux` topics are read from the rings of the
+    stream hub, if it is running, instead of Kafka.
+    """
+    rings = []
+    if shared:
+        rings = [
+            ring
+            for topic in topics
+            if topic in ['eeg', 'aux'] and (ring := SharedRing.attach(topic))
+        ]
+        topics = [t for t in topics if t not in [r.topic for r in rings]]
+
+    if not threaded and not rings:
+        with consumer(topics) as stream:
+            for message in stream:
+                yield [message]
+        return
+
+    queue = Queue()
+    for ring in rings:
+        Thread(target=_poll_shared, args=(ring, queue), daemon=True).start()
+
+    if threaded:
+        for topic in topics:
+            Thread(
+                target=_poll_topic, args=([topic], queue), daemon=True
+            ).start()
+    elif topics:
+        Thread(target=_poll_topic, args=(topics, queue), daemon=True).start()
+
+    if not threaded:
+        while True:
+            yield [_get(queue)]
+
+    while True:
+        batch = [_get(queue)]
+        while True:
+            try:
+                batch.append(_get(queue, block=False))
+            except Empty:
+                break
+        yield batch
+
+
+# ----------------------------------------------------------------------
+def _latency(message) -> float:
+    """Latency in milliseconds of a Kafka message.
+
+    For `eeg` and `aux` is calculated with `timestamp.binary`, for the other
+    topics with the Kafka timestamp.
+    """
+    if message.topic in ['eeg', 'aux']:
+        timestamp = (
+            min(message.value['context']['timestamp.binary']) - prop.OFFSET
+        )
+    else:
+        timestamp = message.timestamp / 1000
+    return (
+        datetime.now() - datetime.fromtimestamp(timestamp)
+    ).total_seconds() * 1000
+
+
+# ----------------------------------------------------------------------
+def loop_consumer(
+    *topics, package_size=None, threaded=False, shared=False
+) -> Callable:
     """Decorator to iterate methods with new streamming data.
 
     This decorator will call a method on every new data streamming input.
-    """
-    global data_tmp_eeg_, data_tmp_aux_, package_size_
 
+    With `threaded=True` each topic is polled on its own thread, buffers are
+    updated with every package, but the method is called once with all the
+    `eeg` (or `aux`) data arrived since the previous call, so a slow analysis
+    skip stale frames instead of accumulating latency. The arguments
+    `backlog` (number of packages merged in the call) and `lag` (age in
+    milliseconds of the oldest merged package) are available to measure it.
+    Other topics are delivered one message at a time.
+
+    With `package_size` the `eeg` and `aux` data is delivered in chunks of
+    exactly this number of samples, the size can be changed on runtime with
+    `DataAnalysis.set_package_size`.
+
+    With `shared=True` the `eeg` and `aux` packages are read from the stream
+    hub started by the framework, if it is running, so the data is not
+    fetched and deserialized again by each extension. The `data` is then a
+    view of the shared memory, valid until the hub ring wraps around, copy
+    it to keep it longer. The buffers read by the method can be written by
+    the hub at any moment, see `RingBuffer.view` to read them consistently.
+
+    With a frame rate set with `DataAnalysis.set_frame_rate` the method is
+    called for the `eeg` and `aux` data only when a new frame is due, the
+    buffers are still updated with every package.
+    """
     topics = list(topics)
 
     if json.loads(os.getenv('BCISTREAM_RASPAD')):
-        package_size_ = 1000
-    else:
-        package_size_ = package_size
+        package_size = 1000
 
     def wrap_wrap(fn: Callable) -> Callable:
-        global data_tmp_eeg_, data_tmp_aux_, package_size_
 
         arguments = fn.__code__.co_varnames[1 : fn.__code__.co_argcount]
 
         def wrap(cls):
-            global data_tmp_eeg_, data_tmp_aux_, package_size_
 
             if cls._feedback:
                 topics.append('feedback')
 
-            # if cls._package_size:
-            # package_size_ = cls._package_size
-
-            with OpenBCIConsumer(host=prop.HOST, topics=topics) as stream:
-                frame = 0
+            package_size_ = package_size
+            aggregators = {}
+            frame = 0
+            for batch in _stream_batches(topics, threaded, shared):
 
-                for data in stream:
+                if cls._package_size:
+                    package_size_ = cls._package_size
 
-                    if cls._package_size:
-                        package_size_ = cls._package_size
+                streams = {}
+                messages = []
+                for data in batch:
 
                     if data.topic == 'feedback':
                         feedback = data.value
@@ -113,106 +244,111 @@ def loop_consumer(*topics, package_size=None) -> Callable:
                             and feedback['mode'] == 'stimuli2analysis'
                         ):
                             cls._feedback._on_feedback(**feedback)
-
                         continue
 
-                    if data.topic == 'eeg':
-                        frame += 1
-                        if hasattr(cls, 'buffer_eeg_'):
-                            cls.update_buffer(
-                                eeg=data.value['data'],
-                                timestamp=min(
-                                    data.value['context']['timestamp.binary']
-                                )
-                                - prop.OFFSET,
-                            )
-                        data_ = data.value['data']
-                    elif data.topic == 'aux':
-                        frame += 1
-                        if hasattr(cls, 'buffer_aux_'):
+                    if data.topic in ['eeg', 'aux']:
+                        if hasattr(cls, f'buffer_{data.topic}_'):
                             cls.update_buffer(
-                                aux=data.value['data'],
-                                timestamp=min(
-                                    data.value['context']['timestamp.binary']
-                                )
-                                - prop.OFFSET,
+                                **{
+                                    data.topic: data.value['data'],
+                                    'timestamp': min(
+                                        data.value['context'][
+                                            'timestamp.binary'
+                                        ]
+                                    )
+                                    - prop.OFFSET,
+                                    'sample_ids': data.value['context'].get(
+                                        'sample_ids', None
+                                    ),
+                                }
                             )
-                        data_ = data.value['data']
+                        streams.setdefault(data.topic, []).append(data)
                     else:
-                        data_ = data.value
+                        messages.append([data])
+
+                # Markers and commands are not delayed by the streams
+                for stream in messages + list(streams.values()):
+                    data = stream[-1]
 
-                    # latency calculated with `timestamp.binary`
                     if data.topic in ['eeg', 'aux']:
-                        latency = (
-                            datetime.now()
-                            - datetime.fromtimestamp(
-                                min(
-                                    data.value['context']['timestamp.binary']
-                                )
-                                - prop.OFFSET
+                        frame += 1
+                        if len(stream) > 1:
+                            data_ = np.concatenate(
+                                [m.value['data'] for m in stream], axis=1
+                            )
+                            # Along the samples, as the data
+                            samples = [
+                                m.value['context'].get('sample_ids', None)
+                                for m in stream
+                            ]
+                            if any(ids is None for ids in samples):
+                                samples = None
+                            else:
+                                samples = np.concatenate(samples, axis=-1)
+                        else:
+                            data_ = data.value['data']
+                            samples = data.value['context'].get(
+                                'sample_ids', None
                             )
-                        ).total_seconds() * 1000
-
-                        samples = data.value['context']['sample_ids']
-
                     else:
-                        # latency calculated with kafka timestamp
-                        latency = (
-                            datetime.now()
-                            - datetime.fromtimestamp(data.timestamp / 1000)
-                        ).total_seconds() * 1000
-
+                        data_ = data.value
                         samples = None
 
-                    if package_size_ and (data.topic in ['eeg', 'aux']):
+                    latency = _latency(data)
+                    lag = _latency(stream[0]) if len(stream) > 1 else latency
 
-                        if data.topic == 'eeg':
-                            if data_tmp_eeg_ is None:
-                                data_tmp_eeg_ = np.zeros((data_.shape[0], 0))
-                            data_tmp_eeg_ = np.concatenate(
-                                [data_tmp_eeg_, data_], axis=1
-                            )
-                            d = data_tmp_eeg_
-                        elif data.topic == 'aux':
-                            if data_tmp_aux_ is None:
-                                data_tmp_aux_ = np.zeros((data_.shape[0], 0))
-                            data_tmp_aux_ = np.concatenate(
-                                [data_tmp_aux_, data_], axis=1
-                            )
-                            d = data_tmp_aux_
+                    kwargs = {
+                        'data': data_,
+                        'kafka_stream': data,
+                        'topic': data.topic,
+                        'frame': frame,
+                        'latency': latency,
+                        'samples': samples,
+                        'backlog': len(stream),
+                        'lag': lag,
+                    }
 
-                        kwargs = {
-                            'data': d,
-                            'kafka_stream': data,
-                            'topic': data.topic,
-                            'frame': frame,
-                            'latency': latency,
-                            'samples': samples,
-                        }
-                        n = package_size_ // prop.STREAMING_PACKAGE_SIZE
-                        if frame % n == 0:
-                            fn(*[cls] + [kwargs[v] for v in arguments])
-                            # else:
-                            if data.topic == 'eeg':
-                                data_tmp_eeg_ = np.zeros((data_.shape[0], 0))
-                            elif data.topic == 'aux':
-                                data_tmp_aux_ = np.zeros((data_.shape[0], 0))
+                    if package_size_ and (data.topic in ['eeg', 'aux']):
+                        if data.topic not in aggregators:
+                            aggregators[data.topic] = PackageAggregator(
+                                package_size_
+                            )
+                        aggregator = aggregators[data.topic]
+                        aggregator.set_package_size(package_size_)
+
+                        chunks = aggregator.push(data_)
+                        if threaded:
+                            chunks = chunks[-1:]
+                        for chunk in chunks:
+                            kwargs['data'] = chunk
+                            _governed_call(fn, cls, arguments, kwargs)
                     else:
-                        kwargs = {
-                            'data': data_,
-                            'kafka_stream': data,
-                            'topic': data.topic,
-                            'frame': frame,
-                            'latency': latency,
-                            'samples': samples,
-                        }
-                        fn(*[cls] + [kwargs[v] for v in arguments])
+                        _governed_call(fn, cls, arguments, kwargs)
 
         return wrap
 
     return wrap_wrap
 
 
+# ----------------------------------------------------------------------
+def _governed_call(
+    fn: Callable, cls, arguments: tuple, kwargs: dict
+) -> None:
+    """Call the decorated method, unless its frame is dropped.
+
+    Only the `eeg` and `aux` frames are governed, the other topics are
+    always delivered.
+    """
+    governor = getattr(cls, '_governor', None)
+    if governor is None or kwargs['topic'] not in ['eeg', 'aux']:
+        fn(*[cls] + [kwargs[v] for v in arguments])
+        return
+
+    if governor.ready(kwargs['lag'], kwargs['backlog']):
+        with governor.frame():
+            fn(*[cls] + [kwargs[v] for v in arguments])
+
+
 # ----------------------------------------------------------------------
 def fake_loop_consumer(*topics, package_size=None) -> Callable:
     """Decorator to iterate methods with new streamming data.
@@ -331,92 +467,148 @@ def fake_loop_consumer(*topics, package_size=None) -> Callable:
 
 
 # ----------------------------------------------------------------------
-def marker_slicing(markers, t0, t1):
-    """"""
+def marker_slicing(markers, t0, t1=None, duration=None, batch=False):
+    """Decorator to call a method with the data around the markers.
+
+    The markers are located in the buffers with a `TimestampIndex`, and the
+    method is called as soon as the whole window of a marker is available,
+    for every marker, without wait for the next ones.
+
+    Parameters
+    ----------
+    markers
+        A pattern, or a list of them, matched against the start of the
+        markers.
+    t0
+        Start of the window, in seconds, relative to the marker.
+    t1
+        End of the window, in seconds, relative to the marker.
+    duration
+        Size of the window in seconds, alternative to `t1`.
+    batch
+        Call the method once with all the windows completed since the
+        previous call, `eeg` of shape (`epochs, channels, time`), `aux` of
+        shape (`epochs, aux, time`), `timestamp` of shape (`epochs, time`),
+        and `marker` and `marker_datetime` as lists.
+    """
     if isinstance(markers, str):
         markers = [markers]
+    if t1 is None:
+        t1 = t0 + duration
+    pattern = re.compile('|'.join(f'(?:{marker})' for marker in markers))
 
     def wrap_wrap(fn):
 
         arguments = fn.__code__.co_varnames[1 : fn.__code__.co_argcount]
 
         def wrap(cls):
-            cls._target_marker = []
-
-            @loop_consumer('aux', 'marker')
-            def marker_slicing_(cls, topic, data, kafka_stream, latency):
+            pending = []
+            rings = {
+                'eeg': (cls._ring_eeg, cls._ring_timestamp),
+                'aux': (cls._ring_aux, cls._ring_aux_timestamp),
+            }
+            sample_rate = {
+                topic: prop.SAMPLE_RATE * ring.length / cls._ring_eeg.length
+                for topic, (ring, _) in rings.items()
+            }
+            indexes = {
+                topic: TimestampIndex(timestamp, sample_rate[topic])
+                for topic, (_, timestamp) in rings.items()
+            }
+            # Rounded, since `t0 + duration` is not exact
+            windows = {
+                topic: (round(rate * t0), round(rate * t1))
+                for topic, rate in sample_rate.items()
+            }
+
+            @loop_consumer('eeg', 'aux', 'marker', threaded=True)
+            def marker_slicing_(cls, topic, data, latency):
 
                 if topic == 'marker':
-                    # if data['marker'] in markers:
-                    # cls._target_marker.append(
-                    # [data['marker'], kafka_stream.value['datetime']])
-
-                    if any(
-                        [
-                            bool(re.match(mkr, data['marker']))
-                            for mkr in markers
-                        ]
-                    ):
-                        cls._target_marker.append(
-                            [data['marker'], kafka_stream.value['datetime']]
-                        )
+                    if pattern.match(data['marker']):
+                        pending.append([data['marker'], data['datetime']])
+                elif topic in indexes:
+                    indexes[topic].update()
 
-                if len(cls._target_marker) < 3:
+                if not pending:
                     return
 
-                if target := getattr(cls, '_target_marker', False):
-
-                    # marker, target = target
-
-                    last_buffer_timestamp = (
-                        cls.buffer_aux_timestamp[-1] - prop.OFFSET
-                    )
-                    last_target_timestamp = (
-                        datetime.fromtimestamp(target[0][1])
-                        + timedelta(seconds=t1)
-                    ).timestamp()
-
-                    if last_buffer_timestamp > last_target_timestamp:
-                        # if True:
-
-                        _marker, _target = target.pop(0)
-
-                        argmin = np.abs(
-                            cls.buffer_aux_timestamp - _target
-                        ).argmin()
-
-                        start = int((prop.SAMPLE_RATE) * t0)
-                        stop = int((prop.SAMPLE_RATE) * t1)
-
-                        t = cls.buffer_aux_timestamp[
-                            argmin + start : argmin + stop
-                        ]
-                        eeg = cls.buffer_eeg_[
-                            :, argmin + start : argmin + stop
-                        ]
-                        aux = cls.buffer_aux_[
-                            :, argmin + start : argmin + stop
-                        ]
-
-                        kwargs = {
-                            'eeg': eeg,
-                            'aux': aux,
-                            'timestamp': t,
-                            'marker_datetime': _target,
-                            'marker': _marker,
-                            'latency': latency,
-                            # 'samples': samples,
-                        }
-
-                        fn(*[cls] + [kwargs[v] for v in arguments])
+                # All the pending markers are located at once, the ones
+                # without anchors yet are `nan` and keep waiting. The AUX is
+                # only required if it is being streamed.
+                targets = np.array([target for _, target in pending])
+                starts = {}
+                complete = np.ones(len(pending), dtype=bool)
+                expired = np.zeros(len(pending), dtype=bool)
+                for topic, index in indexes.items():
+                    if topic == 'aux' and not index.written:
+                        continue
+                    ring = rings[topic][0]
+                    start, stop = windows[topic]
+                    position = np.round(index.locate(targets))
+                    starts[topic] = position + start
+                    complete &= position + stop <= index.written
+                    expired |= position + start < index.written - ring.length
+
+                if expired.any():
+                    logging.warning('Date too old to synchronize')
+
+                ready = np.flatnonzero(complete & ~expired)
+                done = np.flatnonzero(complete | expired)
+                if not ready.size:
+                    for i in done[::-1]:
+                        pending.pop(i)
+                    return
 
+                epochs = {}
+                for topic, (ring, _) in rings.items():
+                    start, stop = windows[topic]
+                    if topic in starts:
+                        # Same samples used to locate the markers
+                        epochs[topic] = take_windows(
+                            ring,
+                            starts[topic][ready],
+                            stop - start,
+                            indexes[topic].written,
+                        )
                     else:
-                        logging.warning('Date too old to synchronize')
-                        logging.warning(f'Offset: {prop.OFFSET}')
-                        logging.warning(
-                            f'{datetime.fromtimestamp(last_buffer_timestamp), datetime.fromtimestamp(last_target_timestamp)}'
+                        epochs[topic] = np.empty(
+                            (ready.size, ring.shape[0], 0)
                         )
 
+                reference = 'aux' if 'aux' in starts else 'eeg'
+                start, stop = windows[reference]
+                timestamp = indexes[reference].timestamp(
+                    starts[reference][ready, None] + np.arange(stop - start)
+                )
+                marker = [pending[i][0] for i in ready]
+                marker_datetime = [pending[i][1] for i in ready]
+                for i in done[::-1]:
+                    pending.pop(i)
+
+                kwargs = {
+                    'eeg': epochs['eeg'],
+                    'aux': epochs['aux'],
+                    'timestamp': timestamp,
+                    'marker_datetime': marker_datetime,
+                    'marker': marker,
+                    'latency': latency,
+                }
+                if batch:
+                    fn(*[cls] + [kwargs[v] for v in arguments])
+                    return
+
+                for i in range(ready.size):
+                    kwargs_ = {
+                        'eeg': epochs['eeg'][i],
+                        'aux': epochs['aux'][i],
+                        'timestamp': timestamp[i],
+                        'marker_datetime': marker_datetime[i],
+                        'marker': marker[i],
+                        'latency': latency,
+                    }
+                    fn(*[cls] + [kwargs_[v] for v in arguments])
+
             marker_slicing_(cls)
 
         return wrap
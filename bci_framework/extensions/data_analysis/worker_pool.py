@@ -0,0 +1,204 @@
+"""
+===========
+Worker pool
+===========
+
+Long-lived processes for the analyses computed over each window.
+
+`WorkerPool` starts its processes once, with the extension, and shares the
+window with them through a shared memory block, so each task only sends the
+name of the block and its own arguments instead of pickling the data again
+for every item. `LatestWindow` computes the windows in a background thread
+and keeps only the newest one pending, the windows that arrive while the
+previous one is computed are dropped, so the feedback latency is bounded by
+the computation time instead of growing with the queue.
+
+.. code-block:: python
+
+    pool = WorkerPool()
+    results = pool.map(function, eeg, channel_pairs, fs)
+
+    scheduler = LatestWindow(process)
+    scheduler.submit(window)
+"""
+
+import os
+import time
+import logging
+from threading import Thread, Condition
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory, resource_tracker
+from typing import Callable, Optional, Iterable
+
+import numpy as np
+
+# Block attached in each worker process
+_attached = {}
+
+
+# ----------------------------------------------------------------------
+def _attach(name: str, shape: tuple, dtype: str) -> np.ndarray:
+    """The shared window, attached once in each worker."""
+    if _attached.get('name') != name:
+        if shm := _attached.get('shm'):
+            _attached.clear()
+            shm.close()
+        shm = shared_memory.SharedMemory(name)
+        # Only the pool can unlink the block
+        try:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+        _attached.update({'name': name, 'shm': shm})
+
+    return np.ndarray(shape, dtype=dtype, buffer=_attached['shm'].buf)
+
+
+# ----------------------------------------------------------------------
+def _task(fn: Callable, block: tuple, item, args: tuple):
+    """Call `fn(data, item, *args)` with the shared window."""
+    return fn(_attach(*block), item, *args)
+
+
+########################################################################
+class WorkerPool:
+    """Persistent process pool with the data shared in memory.
+
+    The processes are started with the pool and reused for every window.
+    The functions must be importable by the workers, like the functions of
+    a module, since they are sent by reference.
+
+    Parameters
+    ----------
+    processes
+        Number of workers, by default the number of CPUs.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(self, processes: Optional[int] = None):
+        """"""
+        self.processes = processes or os.cpu_count()
+        self._pool = ProcessPoolExecutor(self.processes)
+        self._shm = None
+
+        # Start all the workers now instead of with the first window
+        list(self._pool.map(time.sleep, [0.01] * self.processes))
+
+    # ----------------------------------------------------------------------
+    def share(self, data: np.ndarray) -> tuple:
+        """Copy the data into the shared block.
+
+        The block is created again only if the data does not fit.
+
+        Returns
+        -------
+        block
+            The name, shape and dtype of the shared array.
+        """
+        data = np.asarray(data)
+        if self._shm is None or self._shm.size < data.nbytes:
+            self._unlink()
+            self._shm = shared_memory.SharedMemory(
+                create=True, size=max(data.nbytes, 1)
+            )
+
+        np.copyto(
+            np.ndarray(data.shape, dtype=data.dtype, buffer=self._shm.buf),
+            data,
+        )
+        return self._shm.name, data.shape, data.dtype.str
+
+    # ----------------------------------------------------------------------
+    def map(
+        self, fn: Callable, data: np.ndarray, items: Iterable, *args
+    ) -> list:
+        """Call `fn(data, item, *args)` for each item in the workers.
+
+        Parameters
+        ----------
+        fn
+            A module level function.
+        data
+            Array shared with the workers, without copies per item.
+        items
+            The values that change between the calls, like channel pairs.
+        args
+            Arguments for all the calls.
+
+        Returns
+        -------
+        list
+            The results, in the order of `items`.
+        """
+        block = self.share(data)
+        futures = [
+            self._pool.submit(_task, fn, block, item, args) for item in items
+        ]
+        # The block is not written again until all the tasks finish
+        return [future.result() for future in futures]
+
+    # ----------------------------------------------------------------------
+    def _unlink(self) -> None:
+        """"""
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    # ----------------------------------------------------------------------
+    def close(self) -> None:
+        """Stop the workers and remove the shared block."""
+        self._pool.shutdown()
+        self._unlink()
+
+
+########################################################################
+class LatestWindow:
+    """Compute only the newest window, in a background thread.
+
+    A window submitted while the previous one is computed replaces the
+    pending one, the replaced windows are counted as dropped.
+
+    Parameters
+    ----------
+    fn
+        Called with each window computed.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(self, fn: Callable):
+        """"""
+        self.fn = fn
+        self.computed = 0
+        self.dropped = 0
+        self.compute_time = 0
+
+        self._pending = None
+        self._condition = Condition()
+        Thread(target=self._run, daemon=True).start()
+
+    # ----------------------------------------------------------------------
+    def submit(self, window: np.ndarray) -> None:
+        """Schedule a window, it is copied since buffers change."""
+        with self._condition:
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = np.array(window)
+            self._condition.notify()
+
+    # ----------------------------------------------------------------------
+    def _run(self) -> None:
+        """"""
+        while True:
+            with self._condition:
+                while self._pending is None:
+                    self._condition.wait()
+                window, self._pending = self._pending, None
+
+            start = time.monotonic()
+            try:
+                self.fn(window)
+            except Exception:
+                logging.exception('Error computing the window')
+            self.compute_time = (time.monotonic() - start) * 1000
+            self.computed += 1
@@ -0,0 +1,18 @@
+"""
+=======
+Records
+=======
+
+Access to the records saved by the framework, as single HDF5 files or as
+directories of segments.
+"""
+
+from .segments import (
+    is_segmented,
+    read_manifest,
+    is_recording,
+    consolidate,
+    open_record,
+)
+from .reader import RecordReader, LazyArray
+from .catalogue import RecordCatalogue
@@ -0,0 +1,285 @@
+"""
+=========
+Catalogue
+=========
+
+Persistent index with the metadata of the records.
+
+The header, duration, markers and annotations of each record are stored in
+an SQLite database inside the records directory, so the records can be
+listed, sorted and filtered without open the HDF5 files. An entry is valid
+while the modification time and size of the record does not change, and the
+recorder updates the entry of the new record when it is closed.
+
+>>> catalogue = RecordCatalogue(records_dir)
+>>> catalogue.refresh()
+>>> catalogue.records(montage='standard_1020', marker='Right')
+"""
+
+import os
+import json
+import sqlite3
+import logging
+from typing import Optional, List, Tuple
+
+import numpy as np
+
+from .segments import MANIFEST, is_segmented, is_recording, read_manifest
+from .reader import RecordReader
+
+DATABASE = '.catalogue.sqlite'
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    name TEXT PRIMARY KEY,
+    mtime REAL,
+    size INTEGER,
+    recording INTEGER,
+    datetime REAL,
+    duration REAL,
+    sample_rate REAL,
+    montage TEXT,
+    channels_count INTEGER,
+    channels TEXT,
+    marker_names TEXT,
+    markers TEXT,
+    annotations TEXT
+)
+"""
+COLUMNS = [
+    'name',
+    'mtime',
+    'size',
+    'recording',
+    'datetime',
+    'duration',
+    'sample_rate',
+    'montage',
+    'channels_count',
+    'channels',
+    'marker_names',
+    'markers',
+    'annotations',
+]
+JSON_COLUMNS = ['channels', 'marker_names', 'markers', 'annotations']
+
+
+########################################################################
+class RecordCatalogue:
+    """Metadata index of a records directory.
+
+    Parameters
+    ----------
+    records_dir
+        Directory with the records, single HDF5 files or segmented.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(self, records_dir: str):
+        """"""
+        self.records_dir = records_dir
+        self.connection = sqlite3.connect(
+            os.path.join(records_dir, DATABASE), timeout=10
+        )
+        self.connection.execute(SCHEMA)
+        self.connection.commit()
+
+    # ----------------------------------------------------------------------
+    def path(self, name: str) -> str:
+        """Path of a record, a segments directory or an HDF5 file."""
+        path = os.path.join(self.records_dir, name)
+        if is_segmented(path):
+            return path
+        return f'{path}.h5'
+
+    # ----------------------------------------------------------------------
+    def stat(self, name: str) -> Tuple[float, int]:
+        """Modification time and size used to validate an entry."""
+        path = self.path(name)
+        if os.path.isdir(path):
+            stat = os.stat(os.path.join(path, MANIFEST))
+        else:
+            stat = os.stat(path)
+        return stat.st_mtime, stat.st_size
+
+    # ----------------------------------------------------------------------
+    def names(self) -> List[str]:
+        """Records in the directory."""
+        names = []
+        for filename in os.listdir(self.records_dir):
+            if filename.endswith('.h5'):
+                names.append(filename[:-3])
+            elif is_segmented(os.path.join(self.records_dir, filename)):
+                names.append(filename)
+        return names
+
+    # ----------------------------------------------------------------------
+    def refresh(self) -> None:
+        """Index the new and modified records and remove the missing ones."""
+        indexed = {
+            name: (mtime, size)
+            for name, mtime, size in self.connection.execute(
+                'SELECT name, mtime, size FROM records'
+            )
+        }
+        names = self.names()
+
+        for name in names:
+            try:
+                if indexed.get(name) != self.stat(name):
+                    self.update(name)
+            except Exception as e:
+                logging.warning(f'Record {name} can not be indexed: {e}')
+
+        missing = [(name,) for name in set(indexed) - set(names)]
+        self.connection.executemany(
+            'DELETE FROM records WHERE name = ?', missing
+        )
+        self.connection.commit()
+
+    # ----------------------------------------------------------------------
+    def update(self, name: str) -> None:
+        """Read the metadata of a record and replace its entry."""
+        mtime, size = self.stat(name)
+        path = self.path(name)
+        recording = os.path.isdir(path) and is_recording(read_manifest(path))
+
+        with RecordReader(path) as reader:
+            header = reader.header
+            markers, annotations = self._events(reader)
+            entry = {
+                'name': name,
+                'mtime': mtime,
+                'size': size,
+                'recording': recording,
+                'datetime': header['datetime'],
+                'duration': reader.duration,
+                'sample_rate': reader.sample_rate,
+                'montage': header.get('montage', ''),
+                'channels_count': len(header.get('channels', {})),
+                'channels': header.get('channels', {}),
+                'marker_names': sorted(markers),
+                'markers': markers,
+                'annotations': annotations,
+            }
+
+        for column in JSON_COLUMNS:
+            entry[column] = json.dumps(entry[column])
+
+        placeholders = ', '.join('?' * len(COLUMNS))
+        self.connection.execute(
+            f'INSERT OR REPLACE INTO records VALUES ({placeholders})',
+            [entry[column] for column in COLUMNS],
+        )
+        self.connection.commit()
+
+    # ----------------------------------------------------------------------
+    @staticmethod
+    def _events(reader: RecordReader) -> Tuple[dict, list]:
+        """Markers and annotations in the same format of `HDF5Reader`.
+
+        Markers are the indexes of the nearest samples and annotations are
+        relative to the start of the record, in seconds.
+        """
+        markers = {}
+        annotations = []
+        if not reader.eeg.shape[1]:
+            return markers, annotations
+
+        # The timestamps are not always monotonic, so the nearest sample is
+        # searched over the sorted timestamps
+        timestamp = reader.timestamp[:]
+        order = np.argsort(timestamp, kind='stable')
+        sorted_ = timestamp[order]
+        last = len(sorted_) - 1
+        for t, marker in reader.events('markers'):
+            index = min(sorted_.searchsorted(t), last)
+            if index and abs(sorted_[index - 1] - t) <= abs(
+                sorted_[index] - t
+            ):
+                index -= 1
+            markers.setdefault(marker, []).append(int(order[index]))
+
+        for onset, duration, description in reader.events('annotations'):
+            annotations.append([onset - timestamp[0], duration, description])
+
+        return markers, annotations
+
+    # ----------------------------------------------------------------------
+    def _entry(self, row: tuple) -> dict:
+        """"""
+        entry = dict(zip(COLUMNS, row))
+        for column in JSON_COLUMNS:
+            entry[column] = json.loads(entry[column])
+        entry['channels'] = {int(k): v for k, v in entry['channels'].items()}
+        entry['recording'] = bool(entry['recording'])
+        return entry
+
+    # ----------------------------------------------------------------------
+    def get(self, name: str) -> dict:
+        """The entry of a record, indexing it if needed."""
+        row = self.connection.execute(
+            'SELECT mtime, size FROM records WHERE name = ?', (name,)
+        ).fetchone()
+        if row is None or tuple(row) != self.stat(name):
+            self.update(name)
+
+        row = self.connection.execute(
+            'SELECT * FROM records WHERE name = ?', (name,)
+        ).fetchone()
+        return self._entry(row)
+
+    # ----------------------------------------------------------------------
+    def records(
+        self,
+        order_by: Optional[str] = 'datetime',
+        descending: Optional[bool] = False,
+        montage: Optional[str] = None,
+        channels: Optional[int] = None,
+        marker: Optional[str] = None,
+    ) -> List[dict]:
+        """List the indexed records.
+
+        Parameters
+        ----------
+        order_by
+            Column used to sort the records.
+        descending
+            Sort order.
+        montage
+            Only records with this montage.
+        channels
+            Only records with this number of channels.
+        marker
+            Only records that contain this marker.
+        """
+        if order_by not in COLUMNS:
+            raise ValueError(f"Invalid column '{order_by}'")
+
+        conditions = []
+        values = []
+        if montage is not None:
+            conditions.append('montage = ?')
+            values.append(montage)
+        if channels is not None:
+            conditions.append('channels_count = ?')
+            values.append(channels)
+        if marker is not None:
+            conditions.append(
+                'EXISTS (SELECT 1 FROM json_each(marker_names) '
+                'WHERE json_each.value = ?)'
+            )
+            values.append(marker)
+
+        query = 'SELECT * FROM records'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += f' ORDER BY {order_by} {"DESC" if descending else "ASC"}'
+
+        return [
+            self._entry(row) for row in self.connection.execute(query, values)
+        ]
+
+    # ----------------------------------------------------------------------
+    def close(self) -> None:
+        """"""
+        self.connection.close()
@@ -0,0 +1,341 @@
+"""
+======
+Reader
+======
+
+Random access to records without loading them in memory.
+
+`HDF5Reader` reads the whole EEG and AUX arrays the first time they are
+used, `RecordReader` instead exposes them as `LazyArray` objects that only
+read from disk the requested slices, so a long record can be opened and
+sought in milliseconds. Segmented records are read directly from the
+segments, without consolidation.
+
+>>> with RecordReader(filename) as reader:
+...     eeg, timestamp = reader.slice(60, 65)
+"""
+
+import os
+import json
+import bisect
+from datetime import datetime
+from typing import Optional, Tuple, List
+
+import tables
+import numpy as np
+
+from .segments import is_segmented, read_manifest, readable_segments
+
+# Samples used to find the offsets between boards
+OFFSETS_WINDOW = 4096
+
+
+########################################################################
+class LazyArray:
+    """A 2D array stored in one or more HDF5 files.
+
+    Only the requested slices are read, using the chunk cache of PyTables.
+    Each row can have its own offset, used to align the boards of a
+    multi-board record in the same way as `HDF5Reader`.
+
+    Parameters
+    ----------
+    nodes
+        The HDF5 arrays, one per segment, of shape (`rows, time`).
+    offsets
+        Offset of each row, by default `0`.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(
+        self, nodes: List[tables.EArray], offsets: Optional[list] = None
+    ):
+        """"""
+        self.nodes = nodes
+        self.rows = int(nodes[0].shape[0]) if nodes else 0
+
+        if offsets is None:
+            offsets = [0] * self.rows
+        self.offsets = np.asarray(offsets, dtype=int)
+
+        self._starts = [0]
+        for node in nodes:
+            self._starts.append(self._starts[-1] + int(node.shape[1]))
+        self._samples = self._starts[-1] - (
+            int(self.offsets.max()) if self.rows else 0
+        )
+
+    # ----------------------------------------------------------------------
+    @property
+    def shape(self) -> Tuple[int, int]:
+        """"""
+        return (self.rows, self._samples)
+
+    # ----------------------------------------------------------------------
+    def __len__(self) -> int:
+        """"""
+        return self.rows
+
+    # ----------------------------------------------------------------------
+    def _read(self, start: int, stop: int, rows: slice) -> np.ndarray:
+        """Read the raw samples `[start, stop)` across the segments."""
+        first = bisect.bisect_right(self._starts, start) - 1
+        data = []
+        for i in range(max(first, 0), len(self.nodes)):
+            if self._starts[i] >= stop:
+                break
+            a = max(start - self._starts[i], 0)
+            b = min(stop, self._starts[i + 1]) - self._starts[i]
+            data.append(self.nodes[i][rows, a:b])
+
+        if len(data) == 1:
+            return data[0]
+        if not data:
+            return np.empty((len(range(self.rows)[rows]), 0))
+        return np.concatenate(data, axis=1)
+
+    # ----------------------------------------------------------------------
+    def __getitem__(self, index) -> np.ndarray:
+        """Read a slice, the time index must be a slice with step 1."""
+        if not isinstance(index, tuple):
+            index = (index, slice(None))
+        rows, time = index
+
+        if isinstance(rows, (int, np.integer)):
+            return self[rows : rows + 1 or None, time][0]
+        if isinstance(time, (int, np.integer)):
+            time = slice(time, time + 1 or None)
+            return self[rows, time][:, 0]
+
+        start, stop, step = time.indices(self._samples)
+        stop = max(start, stop)
+        row_indexes = np.arange(self.rows)[rows]
+
+        out = np.empty((row_indexes.size, stop - start))
+        for offset in np.unique(self.offsets[row_indexes]):
+            group = np.flatnonzero(self.offsets[row_indexes] == offset)
+            selected = row_indexes[group]
+            raw = self._read(
+                start + offset,
+                stop + offset,
+                slice(selected.min(), selected.max() + 1),
+            )
+            out[group] = raw[selected - selected.min()]
+
+        return out[:, ::step]
+
+    # ----------------------------------------------------------------------
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        """Read the whole array."""
+        if dtype is None:
+            return self[:, :]
+        return self[:, :].astype(dtype)
+
+
+########################################################################
+class _MeanTimestamp:
+    """Timestamps averaged between boards, read on demand."""
+
+    # ----------------------------------------------------------------------
+    def __init__(self, array: LazyArray):
+        """"""
+        self.array = array
+
+    # ----------------------------------------------------------------------
+    @property
+    def shape(self) -> Tuple[int]:
+        """"""
+        return (self.array.shape[1],)
+
+    # ----------------------------------------------------------------------
+    def __len__(self) -> int:
+        """"""
+        return self.array.shape[1]
+
+    # ----------------------------------------------------------------------
+    def __getitem__(self, index) -> np.ndarray:
+        """"""
+        return self.array[:, index].mean(axis=0)
+
+    # ----------------------------------------------------------------------
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        """"""
+        if dtype is None:
+            return self[:]
+        return self[:].astype(dtype)
+
+
+########################################################################
+class RecordReader:
+    """Lazy reader for records, single HDF5 files or segmented ones.
+
+    The EEG and AUX data are exposed as `LazyArray`, with the same shape and
+    alignment of `HDF5Reader.eeg` and `HDF5Reader.aux`. Timestamps are also
+    lazy and in seconds.
+
+    Parameters
+    ----------
+    path
+        An HDF5 file or a directory with segments.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(self, path: str):
+        """"""
+        self.path = path
+
+        if is_segmented(path):
+            manifest = read_manifest(path)
+            self.header = dict(manifest['header'])
+            filenames = [
+                os.path.join(path, filename)
+                for filename in readable_segments(path, manifest)
+            ]
+        else:
+            filenames = [path]
+            self.header = None
+
+        self.files = [tables.open_file(f, 'r') for f in filenames]
+        if self.header is None:
+            self.header = json.loads(self.files[0].root.header[0])
+
+        if 'channels' in self.header:
+            self.header['channels'] = {
+                int(k): v for k, v in self.header['channels'].items()
+            }
+        self.sample_rate = self.header['sample_rate']
+
+        self.timestamp, self.eeg = self._arrays(
+            'timestamp', 'eeg_data', self.header['channels_by_board']
+        )
+        self.aux_timestamp, self.aux = self._arrays(
+            'aux_timestamp', 'aux_data'
+        )
+
+        sample_id = self._nodes('sample_id')
+        offsets = self.timestamp.array.offsets
+        if sample_id and sample_id[0].shape[0] != offsets.size:
+            offsets = None
+        self.sample_id = LazyArray(sample_id, offsets)
+
+    # ----------------------------------------------------------------------
+    def _nodes(self, name: str) -> List[tables.EArray]:
+        """"""
+        return [
+            getattr(file.root, name)
+            for file in self.files
+            if hasattr(file.root, name)
+        ]
+
+    # ----------------------------------------------------------------------
+    def _arrays(
+        self,
+        timestamp_name: str,
+        data_name: str,
+        channels_by_board: Optional[list] = None,
+    ) -> Tuple[LazyArray, LazyArray]:
+        """Create the lazy arrays aligning the boards with the timestamps.
+
+        The offsets are calculated only with the first samples.
+        """
+        timestamp = self._nodes(timestamp_name)
+        data = self._nodes(data_name)
+        if not timestamp or not data:
+            return _MeanTimestamp(LazyArray([])), LazyArray([])
+
+        boards = timestamp[0].shape[0]
+        if boards > 1:
+            first = timestamp[0][:, :OFFSETS_WINDOW]
+            target = first[:, 0].max()
+            offsets = np.abs(first - target).argmin(axis=1)
+        else:
+            offsets = np.array([0])
+
+        rows = data[0].shape[0]
+        if channels_by_board is None:
+            channels_by_board = [rows // boards] * boards
+        row_offsets = np.repeat(offsets, channels_by_board)[:rows]
+        row_offsets = np.pad(
+            row_offsets, (0, rows - row_offsets.size), mode='edge'
+        )
+
+        return (
+            _MeanTimestamp(LazyArray(timestamp, offsets)),
+            LazyArray(data, row_offsets),
+        )
+
+    # ----------------------------------------------------------------------
+    def events(self, name: str) -> list:
+        """The `markers` or `annotations` as they were written.
+
+        Markers are `[timestamp, marker]` and annotations are
+        `[onset, duration, description]`, sorted by time.
+        """
+        events = []
+        for node in self._nodes(name):
+            for row in node:
+                event = json.loads(row)
+                if isinstance(event[0], str):
+                    event[0] = datetime.strptime(
+                        event[0], '%Y-%m-%d %H:%M:%S.%f'
+                    ).timestamp()
+                events.append(event)
+        return sorted(events, key=lambda event: event[0])
+
+    # ----------------------------------------------------------------------
+    @property
+    def duration(self) -> float:
+        """Duration of the record in seconds."""
+        return self.eeg.shape[1] / self.sample_rate
+
+    # ----------------------------------------------------------------------
+    def index(self, t: float) -> int:
+        """Sample index for a time in seconds from the start of the record."""
+        return int(np.clip(round(t * self.sample_rate), 0, self.eeg.shape[1]))
+
+    # ----------------------------------------------------------------------
+    def slice(
+        self, t0: float, t1: float, aux: Optional[bool] = False
+    ) -> Tuple[np.ndarray, ...]:
+        """Read the data between two times.
+
+        Parameters
+        ----------
+        t0, t1
+            Seconds from the start of the record.
+        aux
+            Also return the AUX data of the same range.
+
+        Returns
+        -------
+        tuple
+            EEG and timestamp, and AUX and AUX timestamp if `aux` is set.
+        """
+        start, stop = self.index(t0), self.index(t1)
+        data = (self.eeg[:, start:stop], self.timestamp[start:stop])
+        if not aux:
+            return data
+
+        # The AUX can have a different sample rate
+        ratio = self.aux.shape[1] / max(self.eeg.shape[1], 1)
+        start, stop = int(start * ratio), int(stop * ratio)
+        return data + (
+            self.aux[:, start:stop],
+            self.aux_timestamp[start:stop],
+        )
+
+    # ----------------------------------------------------------------------
+    def close(self) -> None:
+        """"""
+        for file in self.files:
+            file.close()
+
+    # ----------------------------------------------------------------------
+    def __enter__(self) -> 'RecordReader':
+        """"""
+        return self
+
+    # ----------------------------------------------------------------------
+    def __exit__(self, *args) -> None:
+        """"""
+        self.close()
@@ -0,0 +1,193 @@
+"""
+========
+Segments
+========
+
+Long sessions are recorded as a directory with fixed-duration HDF5 segments
+and a `manifest.json`. Each segment is closed before the next one is opened,
+so if the recorder is killed only the last segment can be lost.
+
+The manifest looks like:
+
+```
+{
+  "version": 1,
+  "pid": 1234,
+  "closed": false,
+  "header": {...},
+  "segments": [
+    {"filename": "segment-0000.h5", "samples": 60000, "start": 1.6e9,
+     "end": 1.6e9, "closed": true},
+    ...
+  ]
+}
+```
+
+The segments are read directly with `RecordReader`, also while the record
+is still running. The tools that need a single HDF5 file, like the exports
+of `HDF5Reader`, consolidate the record once it is closed, the segments are
+replaced by the file `<record>.h5`, so the data is never stored twice.
+"""
+
+import os
+import json
+import shutil
+import logging
+from typing import Optional, List
+
+import psutil
+import tables
+from openbci_stream.utils import HDF5Reader, HDF5Writer
+
+MANIFEST = 'manifest.json'
+
+
+# ----------------------------------------------------------------------
+def is_segmented(path: str) -> bool:
+    """Check if the path is a segmented record."""
+    return os.path.isfile(os.path.join(path, MANIFEST))
+
+
+# ----------------------------------------------------------------------
+def read_manifest(path: str) -> dict:
+    """Load the manifest of a segmented record."""
+    with open(os.path.join(path, MANIFEST), 'r') as file:
+        return json.load(file)
+
+
+# ----------------------------------------------------------------------
+def write_manifest(path: str, manifest: dict) -> None:
+    """Replace the manifest atomically."""
+    tmp = os.path.join(path, f'.{MANIFEST}.tmp')
+    with open(tmp, 'w') as file:
+        json.dump(manifest, file)
+    os.replace(tmp, os.path.join(path, MANIFEST))
+
+
+# ----------------------------------------------------------------------
+def is_recording(manifest: dict) -> bool:
+    """Check if the recorder that owns the manifest is still alive."""
+    return not manifest['closed'] and psutil.pid_exists(manifest['pid'])
+
+
+# ----------------------------------------------------------------------
+def readable_segments(path: str, manifest: Optional[dict] = None) -> List[str]:
+    """The segments that can be read.
+
+    The segment that is being written is excluded, and the last segment of
+    an interrupted record is only included if HDF5 can still open it.
+    """
+    if manifest is None:
+        manifest = read_manifest(path)
+    recording = is_recording(manifest)
+
+    segments = []
+    for segment in manifest['segments']:
+        if not segment['closed'] and recording:
+            continue
+
+        filename = os.path.join(path, segment['filename'])
+        if not segment['closed']:
+            try:
+                with tables.open_file(filename, 'r') as file:
+                    file.root.eeg_data.shape
+            except Exception:
+                logging.warning(f'Segment lost: {filename}')
+                continue
+        segments.append(segment['filename'])
+    return segments
+
+
+# ----------------------------------------------------------------------
+def _append_segment(writer: HDF5Writer, filename: str) -> None:
+    """Copy the content of a segment to a writer."""
+    with tables.open_file(filename, 'r') as file:
+        root = file.root
+
+        if hasattr(root, 'eeg_data') and hasattr(root, 'timestamp'):
+            n = min(root.eeg_data.shape[1], root.timestamp.shape[1])
+            if n:
+                writer.add_eeg(root.eeg_data[:, :n], root.timestamp[:, :n])
+            if hasattr(root, 'sample_id') and root.sample_id.shape[1]:
+                writer.add_sampleid(root.sample_id[:, :n])
+
+        if hasattr(root, 'aux_data') and hasattr(root, 'aux_timestamp'):
+            n = min(root.aux_data.shape[1], root.aux_timestamp.shape[1])
+            if n:
+                writer.add_aux(
+                    root.aux_data[:, :n], root.aux_timestamp[:, :n]
+                )
+
+        for row in root.markers:
+            timestamp, marker = json.loads(row)
+            writer.add_marker(marker, timestamp)
+
+        for row in root.annotations:
+            onset, duration, description = json.loads(row)
+            writer.add_annotation(onset, duration, description)
+
+
+# ----------------------------------------------------------------------
+def consolidate(path: str) -> str:
+    """Replace the segments of a closed record by a single HDF5 file.
+
+    The file `<path>.h5` is written next to the directory, and the directory
+    is removed once the file is complete, so the record is consolidated only
+    once and is listed as a regular record since then.
+
+    Parameters
+    ----------
+    path
+        Directory of the segmented record.
+
+    Returns
+    -------
+    str
+        The filename of the consolidated record.
+
+    Raises
+    ------
+    RuntimeError
+        If the record is still being written, use `RecordReader` to read
+        it meanwhile.
+    """
+    path = os.path.normpath(path)
+    filename = f'{path}.h5'
+    manifest = read_manifest(path)
+    if is_recording(manifest):
+        raise RuntimeError(f'{path} is still being recorded')
+
+    if os.path.exists(filename):
+        if not manifest.get('consolidated'):
+            raise FileExistsError(f'{filename} is another record')
+        # Interrupted after the file was complete
+        shutil.rmtree(path, ignore_errors=True)
+        return filename
+
+    tmp = f'{path}.tmp.h5'
+    writer = HDF5Writer(tmp)
+    writer.add_header(manifest['header'])
+    for segment in readable_segments(path, manifest):
+        try:
+            _append_segment(writer, os.path.join(path, segment))
+        except Exception as e:
+            logging.warning(f'Segment {segment} can not be read: {e}')
+    writer.close()
+
+    # The segments are removed only after the file is in place
+    manifest['consolidated'] = True
+    write_manifest(path, manifest)
+    os.replace(tmp, filename)
+    shutil.rmtree(path, ignore_errors=True)
+    return filename
+
+
+# ----------------------------------------------------------------------
+def open_record(path: str) -> HDF5Reader:
+    """Open a record, segmented or not, with `HDF5Reader`.
+
+    Segmented records are consolidated first, see `consolidate`.
+    """
+    if is_segmented(path):
+        path = consolidate(path)
+    return HDF5Reader(path)
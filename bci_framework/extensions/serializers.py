@@ -0,0 +1,291 @@
+"""
+===========
+Serializers
+===========
+
+Kafka values serializers.
+
+The `eeg` and `aux` packages are encoded in a framed binary format: a fixed
+header with the shape of the package, the `timestamp.binary` and the
+`sample_ids` as raw arrays, the rest of the context as JSON and the data as a
+little-endian `float32` payload that is decoded with `np.frombuffer` without
+copies. The payload can be compressed with `gzip`, `lz4` or `zstd`, or sent
+as is.
+
+Any other value is pickled, and `deserialize` recognize both formats, so
+producers that still use `pickle.dumps` (like the acquisition server) can be
+consumed too.
+"""
+
+import json
+import zlib
+import struct
+import pickle
+import logging
+from functools import partial
+from contextlib import contextmanager
+from typing import Any, Callable, Literal, Optional
+
+import numpy as np
+from kafka import KafkaConsumer
+
+from . import properties as prop
+
+try:
+    import lz4.frame as lz4
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b'BCIW'
+VERSION = 1
+COMPRESSIONS = ['none', 'gzip', 'lz4', 'zstd']
+
+# magic, version, compression, channels, samples, timestamps, sample_ids
+# items and metadata length
+HEADER = struct.Struct('<4sBBHIiII')
+
+Compression = Literal['none', 'gzip', 'lz4', 'zstd']
+
+# Compressions not available already reported
+_WARNED = set()
+
+
+# ----------------------------------------------------------------------
+def _compress(body: bytes, compression: int) -> bytes:
+    """"""
+    if compression == 1:
+        return zlib.compress(body, 1)
+    elif compression == 2:
+        return lz4.compress(body)
+    elif compression == 3:
+        return zstandard.ZstdCompressor().compress(body)
+    return body
+
+
+# ----------------------------------------------------------------------
+def _decompress(body: memoryview, compression: int) -> bytes:
+    """"""
+    if compression == 1:
+        return zlib.decompress(body)
+    elif compression == 2:
+        return lz4.decompress(body)
+    elif compression == 3:
+        return zstandard.ZstdDecompressor().decompress(body)
+    return body
+
+
+# ----------------------------------------------------------------------
+def _is_stream(value: Any) -> bool:
+    """Check if the value looks like an `eeg` or `aux` package."""
+    return (
+        isinstance(value, dict)
+        and isinstance(value.get('data', None), np.ndarray)
+        and value['data'].ndim == 2
+        and isinstance(value.get('context', None), dict)
+    )
+
+
+# ----------------------------------------------------------------------
+def encode_stream(value: dict, compression: Compression = 'none') -> bytes:
+    """Encode an `eeg` or `aux` package in the binary format.
+
+    Parameters
+    ----------
+    value
+        Dictionary with the `data` array of shape (`channels, time`) and the
+        `context`.
+    compression
+        Compression for the body of the frame.
+
+    Returns
+    -------
+    bytes
+        The frame.
+    """
+    compression = COMPRESSIONS.index(compression)
+    if (compression == 2 and lz4 is None) or (
+        compression == 3 and zstandard is None
+    ):
+        if compression not in _WARNED:
+            _WARNED.add(compression)
+            logging.warning(
+                f"'{COMPRESSIONS[compression]}' is not available, "
+                'sending without compression'
+            )
+        compression = 0
+
+    context = value['context'].copy()
+    data = value['data']
+    channels, samples = data.shape
+
+    timestamps = context.pop('timestamp.binary', None)
+    if timestamps is None:
+        timestamps = np.array([])
+        n_timestamps = -1
+    else:
+        timestamps = np.asarray(timestamps, dtype='<f8').reshape(-1)
+        n_timestamps = timestamps.size
+
+    sample_ids = context.pop('sample_ids', None)
+    if sample_ids is None:
+        sample_ids = np.array([])
+        sample_ids_shape = None
+    else:
+        sample_ids = np.asarray(sample_ids, dtype='<i8')
+        sample_ids_shape = sample_ids.shape
+
+    metadata = json.dumps(
+        {'context': context, 'sample_ids': sample_ids_shape}
+    ).encode()
+    # Keep the payload aligned to 4 bytes
+    metadata += b' ' * (-len(metadata) % 4)
+
+    body = b''.join(
+        [
+            timestamps.tobytes(),
+            sample_ids.tobytes(),
+            metadata,
+            np.ascontiguousarray(data, dtype='<f4').tobytes(),
+        ]
+    )
+    header = HEADER.pack(
+        MAGIC,
+        VERSION,
+        compression,
+        channels,
+        samples,
+        n_timestamps,
+        sample_ids.size,
+        len(metadata),
+    )
+    return header + _compress(body, compression)
+
+
+# ----------------------------------------------------------------------
+def decode_stream(value: bytes) -> dict:
+    """Decode a frame created with `encode_stream`.
+
+    The `data` array is a read-only view of the message, use `copy()` before
+    modify it in place.
+    """
+    (
+        _,
+        version,
+        compression,
+        channels,
+        samples,
+        n_timestamps,
+        n_sample_ids,
+        metadata_size,
+    ) = HEADER.unpack_from(value)
+
+    body = _decompress(memoryview(value)[HEADER.size :], compression)
+
+    offset = 0
+    if n_timestamps >= 0:
+        timestamps = np.frombuffer(body, '<f8', n_timestamps, offset)
+        offset += timestamps.nbytes
+    sample_ids = np.frombuffer(body, '<i8', n_sample_ids, offset)
+    offset += sample_ids.nbytes
+
+    metadata = json.loads(bytes(body[offset : offset + metadata_size]))
+    offset += metadata_size
+
+    data = np.frombuffer(body, '<f4', channels * samples, offset)
+
+    context = metadata['context']
+    if n_timestamps >= 0:
+        context['timestamp.binary'] = timestamps.tolist()
+    if metadata['sample_ids'] is not None:
+        context['sample_ids'] = sample_ids.reshape(metadata['sample_ids'])
+
+    return {
+        'context': context,
+        'data': data.reshape(channels, samples),
+    }
+
+
+# ----------------------------------------------------------------------
+def peek(value: bytes) -> dict:
+    """Read only the status of an `eeg` or `aux` package.
+
+    For binary frames the data payload is not decoded, only the header and
+    the timestamps. Pickled packages are loaded completely.
+
+    Returns
+    -------
+    dict
+        With the `shape` of the data and the `context`, that only contains
+        the `timestamp.binary` for binary frames.
+    """
+    if value[:4] != MAGIC:
+        value = pickle.loads(value)
+        return {'shape': value['data'].shape, 'context': value['context']}
+
+    _, _, compression, channels, samples, n_timestamps, _, _ = (
+        HEADER.unpack_from(value)
+    )
+    context = {}
+    if n_timestamps >= 0:
+        body = memoryview(value)[HEADER.size :]
+        if compression:
+            body = _decompress(body, compression)
+        context['timestamp.binary'] = np.frombuffer(
+            body, '<f8', n_timestamps
+        ).tolist()
+
+    return {'shape': (channels, samples), 'context': context}
+
+
+# ----------------------------------------------------------------------
+def serialize(value: Any, compression: Compression = 'none') -> bytes:
+    """Kafka `value_serializer`.
+
+    Streams packages use the binary format and everything else is pickled.
+    Use `serializer` to get a serializer with other compression.
+    """
+    if _is_stream(value):
+        try:
+            return encode_stream(value, compression)
+        except (TypeError, ValueError):
+            # Context not serializable with JSON
+            pass
+    return pickle.dumps(value)
+
+
+# ----------------------------------------------------------------------
+def serializer(compression: Compression = 'none') -> Callable:
+    """Create a `value_serializer` with a specific compression."""
+    return partial(serialize, compression=compression)
+
+
+# ----------------------------------------------------------------------
+def deserialize(value: bytes) -> Any:
+    """Kafka `value_deserializer` for binary frames and pickled values."""
+    if value[:4] == MAGIC:
+        return decode_stream(value)
+    return pickle.loads(value)
+
+
+# ----------------------------------------------------------------------
+@contextmanager
+def consumer(topics: list, host: Optional[str] = None) -> KafkaConsumer:
+    """Kafka consumer for an already running stream.
+
+    Same as `OpenBCIConsumer` but with `deserialize` as deserializer.
+    """
+    consumer_ = KafkaConsumer(
+        bootstrap_servers=[f'{host or prop.HOST}:9092'],
+        value_deserializer=deserialize,
+        auto_offset_reset='latest',
+    )
+    consumer_.subscribe(topics)
+    try:
+        yield consumer_
+    finally:
+        consumer_.close()
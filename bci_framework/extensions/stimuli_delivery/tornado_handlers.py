@@ -7,7 +7,6 @@ This handlers are used to configure the `Stimuli Delivery`.
 """
 
 import json
-import pickle
 import logging
 from queue import Queue
 from typing import TypeVar
@@ -21,6 +20,7 @@ from kafka import KafkaProducer, KafkaConsumer
 
 from datetime import datetime, timedelta
 from bci_framework.extensions import properties as prop
+from bci_framework.extensions.serializers import serialize, deserialize
 from bci_framework.extensions.data_analysis.utils import thread_this, subprocess_this
 
 created_consumer = [False]
@@ -40,7 +40,7 @@ def bci_consumer():
     try:
         consumer = KafkaConsumer(
             bootstrap_servers=[f'{prop.HOST}:9092'],
-            value_deserializer=pickle.loads,
+            value_deserializer=deserialize,
             auto_offset_reset='latest',
         )
     except:
@@ -91,8 +91,7 @@ class WSHandler(WebSocketHandler):
         try:
             self.kafka_producer = KafkaProducer(
                 bootstrap_servers=[f'{prop.HOST}:9092'],
-                compression_type='gzip',
-                value_serializer=pickle.dumps,
+                value_serializer=serialize,
             )
         except:
             logging.warning(
@@ -1,5 +1,7 @@
 from openbci_stream.utils.hdf5 import HDF5Reader
 
+from ..records import is_segmented, consolidate, RecordReader
+
 
 ########################################################################
 class FileHandler:
@@ -9,10 +11,40 @@ class FileHandler:
     def __init__(self, filename):
         """Constructor"""
 
+        if is_segmented(filename):
+            # Closed records are replaced once by a single file
+            filename = consolidate(filename)
+
+        self.filename = filename
         if filename.endswith('.h5'):
             self.file = HDF5Reader(filename)
             print(self.file)
 
+    # ----------------------------------------------------------------------
+    @staticmethod
+    def _read_only(array):
+        """A read-only view of the cached array, without copies.
+
+        The array cached by the reader is not modified, it can be shared
+        with other holders that write it.
+        """
+        view = array.view()
+        view.flags.writeable = False
+        return view
+
+    # ----------------------------------------------------------------------
+    @property
+    def reader(self):
+        """Lazy reader for random access without loading the record."""
+        if not hasattr(self, '_reader'):
+            self._reader = RecordReader(self.filename)
+        return self._reader
+
+    # ----------------------------------------------------------------------
+    def slice(self, t0, t1):
+        """EEG and timestamp between `t0` and `t1` seconds."""
+        return self.reader.slice(t0, t1)
+
     # ----------------------------------------------------------------------
     @property
     def eeg(self):
@@ -20,13 +52,13 @@ class FileHandler:
         if hasattr(self, '_modified_eeg'):
             return self._modified_eeg
         else:
-            return self.file.eeg.copy()
+            return self._read_only(self.file.eeg)
 
     # ----------------------------------------------------------------------
     @property
     def original_eeg(self):
         """"""
-        return self.file.eeg.copy()
+        return self._read_only(self.file.eeg)
 
     # ----------------------------------------------------------------------
     @eeg.setter
@@ -41,7 +73,7 @@ class FileHandler:
         if hasattr(self, '_modified_aux'):
             return self._modified_aux
         else:
-            return self.file.aux.copy()
+            return self._read_only(self.file.aux)
 
     # ----------------------------------------------------------------------
     @aux.setter
@@ -53,13 +85,13 @@ class FileHandler:
     @property
     def timestamp(self):
         """"""
-        return self.file.timestamp.copy()
+        return self._read_only(self.file.timestamp)
 
     # ----------------------------------------------------------------------
     @property
     def aux_timestamp(self):
         """"""
-        return self.file.aux_timestamp.copy()
+        return self._read_only(self.file.aux_timestamp)
 
     # ----------------------------------------------------------------------
     @property
@@ -105,6 +137,8 @@ class FileHandler:
     def close(self):
         """"""
         self.file.close()
+        if hasattr(self, '_reader'):
+            self._reader.close()
 
     # ----------------------------------------------------------------------
     def epochs(self, tmax, tmin, markers):
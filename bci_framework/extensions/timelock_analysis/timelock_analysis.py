@@ -25,6 +25,11 @@ from PySide6.QtWidgets import QSpacerItem, QSizePolicy
 from gcpds.filters import frequency as flt
 from gcpds.filters import frequency as flt
 from bci_framework.framework.dialogs import Dialogs
+from bci_framework.extensions.data_analysis.envelope import (
+    EnvelopePyramid,
+    pixel_edges,
+    interleave,
+)
 
 # from bci_framework.extensions.data_analysis.utils import thread_this, subprocess_this
 
@@ -563,6 +568,7 @@ class TimelockSeries(TimelockWidget):
     def move_plot(self, value):
         """"""
         self.ax1.set_xlim(value / 1000, (value / 1000 + self.window_value))
+        self.plot_envelope(self.ax1, self.lines)
         self.ax2.collections.clear()
         self.ax2.fill_between([value / 1000, (value / 1000 + self.window_value)],
                               *self.ax1.get_ylim(), color=self.fill_color, alpha=self.fill_opacity)
@@ -573,19 +579,16 @@ class TimelockSeries(TimelockWidget):
         """"""
         self.window_value = self._get_seconds_from_human(
             self.combobox.currentText())
+        if not hasattr(self, 'envelope'):
+            return
 
-        eeg = self.pipeline_output.eeg
-        timestamp = self.pipeline_output.timestamp
-
-        timestamp = np.linspace(
-            0, timestamp[0][-1], eeg.shape[1], endpoint=True) / 1000
-
-        self.scroll.setMaximum((timestamp[-1] - self.window_value) * 1000)
+        self.scroll.setMaximum((self.duration - self.window_value) * 1000)
         self.scroll.setMinimum(0)
         self.scroll.setPageStep(self.window_value * 1000)
 
         self.ax1.set_xlim(self.scroll.value() / 1000,
                           (self.scroll.value() / 1000 + self.window_value))
+        self.plot_envelope(self.ax1, self.lines)
 
         self.ax2.collections.clear()
         self.ax2.fill_between([self.scroll.value() / 1000, (self.scroll.value() + self.window_value) / 1000],
@@ -605,27 +608,73 @@ class TimelockSeries(TimelockWidget):
         return np.prod(list(map(float, value.split())))
 
     # ----------------------------------------------------------------------
-    def set_data(self, timestamp, eeg, labels, ylabel='', xlabel='', legend=True):
-        """"""
+    def set_envelope(self, duration, eeg, scale=1, offset=0):
+        """Create the envelope pyramid of the record.
+
+        The lines only draw the min/max envelope of each pixel, so the
+        visible range is plotted with the same number of points for any
+        record length.
+        """
+        self.duration = duration
+        self.envelope = EnvelopePyramid(eeg)
+        self.envelope_rate = (eeg.shape[1] - 1) / duration
+        self.envelope_scale = scale
+        self.envelope_offset = np.reshape(offset, (-1, 1))
+
+    # ----------------------------------------------------------------------
+    def plot_envelope(self, ax, lines):
+        """Update the lines with the envelope of the visible range."""
+        start, stop = ax.get_xlim()
+        start = max(0, int(start * self.envelope_rate))
+        stop = min(int(np.ceil(stop * self.envelope_rate)) + 1,
+                   self.envelope.bounds[1])
+        width = max(1, int(ax.bbox.width))
+
+        minimum, maximum = self.envelope.envelope(start, stop, width)
+        edges = pixel_edges(start, stop, width)
+        t = (edges[:-1] + edges[1:] - 1) / 2 / self.envelope_rate
+
+        t = np.repeat(t, 2)
+        y = interleave(minimum, maximum) * self.envelope_scale
+        y = y + self.envelope_offset
+        for line, y_ in zip(lines, y):
+            line.set_data(t, y_)
+
+    # ----------------------------------------------------------------------
+    def plot_lines(self, labels):
+        """Create the lines of both axes and draw the whole record."""
         self.ax1.clear()
         self.ax2.clear()
 
-        for i, ch in enumerate(eeg):
-            self.ax1.plot(timestamp, eeg[i], label=labels[i])
-            self.ax2.plot(timestamp, eeg[i], alpha=0.5)
+        self.lines = [self.ax1.plot([], [], label=label)[0]
+                      for label in labels]
+        lines = [self.ax2.plot([], [], alpha=0.5)[0] for label in labels]
+
+        self.ax2.set_xlim(0, self.duration)
+        self.plot_envelope(self.ax2, lines)
+        self.ax2.relim()
+        self.ax2.autoscale_view()
+        self.ax1.set_ylim(*self.ax2.get_ylim())
+
+        self.ax1.set_xlim(0, self.window_value)
+        self.plot_envelope(self.ax1, self.lines)
+
+    # ----------------------------------------------------------------------
+    def set_data(self, duration, eeg, labels, ylabel='', xlabel='', legend=True, scale=1):
+        """"""
+        self.set_envelope(duration, eeg, scale=scale)
+        self.plot_lines(labels)
 
         self.ax1.grid(True, axis='x')
         if legend:
             self.ax1.legend(loc='upper center', ncol=8,
                             bbox_to_anchor=(0.5, 1.4), **LEGEND_KWARGS)
-        self.ax1.set_xlim(0, self.window_value)
 
         self.ax2.grid(True, axis='x')
-        self.ax2.set_xlim(0, timestamp[-1])
         self.ax2.fill_between([0, self.window_value], *self.ax1.get_ylim(),
                               color=self.fill_color, alpha=self.fill_opacity)
 
-        self.scroll.setMaximum((timestamp[-1] - self.window_value) * 1000)
+        self.scroll.setMaximum((self.duration - self.window_value) * 1000)
         self.scroll.setMinimum(0)
 
         self.ax1.set_ylabel(ylabel)
@@ -847,22 +896,19 @@ class LoadDatabase(TimelockSeries):
 
         self.database_description.setText(datafile.description)
 
-        eeg = decimate(eeg, 15, axis=1)
-        timestamp = np.linspace(
-            0, timestamp[0][-1], eeg.shape[1], endpoint=True) / 1000
-
-        eeg = eeg / 1000
+        duration = timestamp[0][-1] / 1000
 
         options = [self._get_seconds_from_human(
             w) for w in self.window_options]
-        l = len([o for o in options if o < timestamp[-1]])
+        l = len([o for o in options if o < duration])
         self.combobox.clear()
         self.combobox.addItems(self.window_options[:l])
 
-        self.set_data(timestamp, eeg,
+        self.set_data(duration, eeg,
                       labels=list(header['channels'].values()),
                       ylabel='Millivolt [$mv$]',
-                      xlabel='Time [$s$]')
+                      xlabel='Time [$s$]',
+                      scale=1 / 1000)
 
         datafile.close()
 
@@ -1108,16 +1154,14 @@ class AddMarkers(TimelockSeries):
         eeg = datafile.eeg
         timestamp = datafile.timestamp
 
-        eeg = decimate(eeg, 15, axis=1)
-        timestamp = np.linspace(
-            0, timestamp[0][-1], eeg.shape[1], endpoint=True) / 1000
+        duration = timestamp[0][-1] / 1000
 
         # eeg = eeg / 1000
 
         self.threshold = 150
         channels = eeg.shape[0]
 
-        self.set_data(timestamp, eeg,
+        self.set_data(duration, eeg,
                       labels=list(header['channels'].values()),
                       ylabel='Millivolt [$mv$]',
                       xlabel='Time [$s$]',
@@ -1141,29 +1185,23 @@ class AddMarkers(TimelockSeries):
         self.pipeline_output = self.pipeline_input
 
     # ----------------------------------------------------------------------
-    def set_data(self, timestamp, eeg, labels, ylabel='', xlabel='', legend=True):
+    def set_data(self, duration, eeg, labels, ylabel='', xlabel='', legend=True):
         """"""
-        self.ax1.clear()
-        self.ax2.clear()
-
-        for i, ch in enumerate(eeg):
-            self.ax1.plot(timestamp, ch + self.threshold *
-                          i, label=labels[i])
-            self.ax2.plot(timestamp, ch + self.threshold * i, alpha=0.5)
+        offset = self.threshold * np.arange(eeg.shape[0])
+        self.set_envelope(duration, eeg, offset=offset)
+        self.plot_lines(labels)
 
         self.ax1.grid(True, axis='x')
         if legend:
             self.ax1.legend(loc='upper center', ncol=8,
                             bbox_to_anchor=(0.5, 1.4), **LEGEND_KWARGS)
-        self.ax1.set_xlim(0, self.window_value)
 
         self.ax2.grid(True, axis='x')
-        self.ax2.set_xlim(0, timestamp[-1])
 
         self.ax2.fill_between([0, self.window_value], *self.ax1.get_ylim(),
                               color=self.fill_color, alpha=self.fill_opacity, label='AREA')
 
-        self.scroll.setMaximum((timestamp[-1] - self.window_value) * 1000)
+        self.scroll.setMaximum((self.duration - self.window_value) * 1000)
         self.scroll.setMinimum(0)
 
         self.ax1.set_ylabel(ylabel)
@@ -1173,6 +1211,7 @@ class AddMarkers(TimelockSeries):
     def move_plot(self, value):
         """"""
         self.ax1.set_xlim(value / 1000, (value / 1000 + self.window_value))
+        self.plot_envelope(self.ax1, self.lines)
 
         for area in [i for i, c in enumerate(self.ax2.collections) if c.get_label() == 'AREA'][::-1]:
             self.ax2.collections.pop(area)
@@ -1192,19 +1231,16 @@ class AddMarkers(TimelockSeries):
         """"""
         self.window_value = self._get_seconds_from_human(
             self.combobox.currentText())
+        if not hasattr(self, 'envelope'):
+            return
 
-        eeg = self.pipeline_output.eeg
-        timestamp = self.pipeline_output.timestamp
-
-        timestamp = np.linspace(
-            0, timestamp[0][-1], eeg.shape[1], endpoint=True) / 1000
-
-        self.scroll.setMaximum((timestamp[-1] - self.window_value) * 1000)
+        self.scroll.setMaximum((self.duration - self.window_value) * 1000)
         self.scroll.setMinimum(0)
         self.scroll.setPageStep(self.window_value * 1000)
 
         self.ax1.set_xlim(self.scroll.value() / 1000,
                           (self.scroll.value() / 1000 + self.window_value))
+        self.plot_envelope(self.ax1, self.lines)
 
         self.draw()
 
@@ -14,18 +14,28 @@ import json
 import pickle
 import logging
 import time
+from io import BytesIO
+from queue import Queue, Full, Empty
+from threading import Thread
+from contextlib import suppress
 
 import mne
 import numpy as np
 import matplotlib
 from matplotlib import pyplot
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from cycler import cycler
+from PIL import Image
 from kafka import KafkaProducer
-from figurestream import FigureStream
+from figurestream import FigureStream, StreamEvent
+from flask import Response, request
 from typing import Optional, Tuple, Literal, Callable
 
 from ...extensions import properties as prop
 from ...extensions.data_analysis import DataAnalysis
+from ...extensions.data_analysis.frame_governor import FrameGovernor
+from .series_stream import SeriesServer
 
 # Consigure matplotlib
 if ('light' in sys.argv) or (
@@ -105,12 +115,57 @@ class EEGStream(FigureStream, DataAnalysis, MNEObjects):
     """
 
     # ----------------------------------------------------------------------
-    def __init__(self, enable_produser=False, *args, **kwargs):
-        """"""
+    def __init__(
+        self,
+        enable_produser=False,
+        *args,
+        backend: Literal['image', 'series'] = 'image',
+        **kwargs,
+    ):
+        """
+        Parameters
+        ----------
+        backend
+            `image` streams the figure rendered as JPEG, `series` streams
+            only the data of the lines through a WebSocket, drawn by the
+            browser, see `series_stream`.
+
+            With `series` the Flask server of `FigureStream` is not
+            started, so there is no `app` attribute nor the
+            `/figure.jpeg`, `/mode` and `/feed` endpoints, and no JPEG
+            frames are rendered or queued by `feed`.
+        """
+        # The frames are queued here and served by `_video_feed`, the
+        # server can request them as soon as it is started
+        self._frames = Queue(maxsize=60)
+        self._frame = None
+        self._frame_event = StreamEvent()
+        self._frame_thread = None
+
         port = 5000
-        super().__init__(
-            host='0.0.0.0', port=port, endpoint='', *args, **kwargs
-        )
+        if backend == 'series':
+            # The Flask server of `FigureStream` is not started, so the
+            # public attributes are set here with the same defaults
+            Figure.__init__(self, *args, **kwargs)
+            self.boundary = False
+            self.subsample = None
+            self.size = 'auto'
+            self.set_dpi(100)
+            self._series = SeriesServer(
+                self, sys.argv[1] if len(sys.argv) > 1 else port
+            )
+        else:
+            super().__init__(
+                host='0.0.0.0', port=port, endpoint='', *args, **kwargs
+            )
+            self._series = None
+        FigureCanvasAgg(self)
+
+        self._blit = False
+        self._background = None
+        self._background_key = None
+        self._last_frame = None
+        self._output = BytesIO()
 
         # self._pivot = None
         if enable_produser:
@@ -118,6 +173,8 @@ class EEGStream(FigureStream, DataAnalysis, MNEObjects):
 
         self._feedback = False
         self._package_size = None
+        # Measure all the frames, without limit until `set_frame_rate`
+        self._governor = FrameGovernor()
 
         self.transformers_ = {}
         self.transformers_aux_ = {}
@@ -133,6 +190,7 @@ class EEGStream(FigureStream, DataAnalysis, MNEObjects):
         cmap: Optional[str] = 'cool',
         fill: Optional[np.ndarray] = np.nan,
         subplot: Optional[list] = [1, 1, 1],
+        envelope: Optional[bool] = False,
     ) -> Tuple[matplotlib.axes.Axes, np.ndarray, list[matplotlib.lines]]:
         """Create plot automatically.
 
@@ -152,6 +210,10 @@ class EEGStream(FigureStream, DataAnalysis, MNEObjects):
             Start signals array with this value.
         subplot
             The matplolib subplot.
+        envelope
+            Create the lines with two points for each one of the `window`,
+            to draw the min/max envelopes of `buffer_eeg_envelope` with
+            `interleave`.
 
         Returns
         -------
@@ -205,7 +267,7 @@ class EEGStream(FigureStream, DataAnalysis, MNEObjects):
         # self._create_resampled_buffer(
         # prop.SAMPLE_RATE * np.abs(time), n=1000)
 
-        a = np.empty(window)
+        a = np.empty(window * 2 if envelope else window)
         a.fill(fill)
 
         lines = [
@@ -227,6 +289,8 @@ class EEGStream(FigureStream, DataAnalysis, MNEObjects):
         else:
             axis.set_xlim(time, 0)
             time = np.linspace(time, 0, window)
+        if envelope:
+            time = np.repeat(time, 2)
         axis.set_ylim(*ylim)
 
         # if mode != 'eeg':
@@ -271,10 +335,155 @@ class EEGStream(FigureStream, DataAnalysis, MNEObjects):
     # else:
     # logging.warning('No "boundary" to plot')
 
-    # # ----------------------------------------------------------------------
-    # def feed(self):
-    # """"""
-    # super().feed()
+    # ----------------------------------------------------------------------
+    def enable_blit(
+        self, artists: Optional[list] = (), fps: Optional[float] = None
+    ) -> None:
+        """Redraw only the artists that change on each frame.
+
+        The figure without the animated artists is rendered once and
+        restored on each `feed`, then only the animated artists are drawn
+        over it. The background is rendered again when the size of the
+        figure or the limits of the axes change, call `refresh_background`
+        after other changes in the static content, like titles or ticks.
+
+        Parameters
+        ----------
+        artists
+            The artists updated on each frame, like the `lines` of
+            `create_lines`. The artists created later with `animated=True`
+            are redrawn too.
+        fps
+            Maximum frames per second, see `set_frame_rate`.
+        """
+        for artist in np.ravel(artists):
+            artist.set_animated(True)
+        self._blit = True
+        if fps:
+            self.set_frame_rate(fps)
+        self.refresh_background()
+
+    # ----------------------------------------------------------------------
+    def refresh_background(self) -> None:
+        """Render the static content again in the next frame."""
+        self._background = None
+
+    # ----------------------------------------------------------------------
+    def _render(self) -> None:
+        """Draw the figure, or only the animated artists over the
+        background."""
+        if not self._blit:
+            self.canvas.draw()
+            return
+
+        key = (
+            self.canvas.get_width_height(),
+            self.dpi,
+            [(ax.get_xlim(), ax.get_ylim()) for ax in self.axes],
+        )
+        if self._background is None or key != self._background_key:
+            # The animated artists are excluded from the draw
+            self.canvas.draw()
+            self._background = self.canvas.copy_from_bbox(self.bbox)
+            self._background_key = key
+        else:
+            self.canvas.restore_region(self._background)
+
+        for ax in self.axes:
+            artists = [a for a in ax.get_children() if a.get_animated()]
+            for artist in sorted(artists, key=lambda a: a.get_zorder()):
+                ax.draw_artist(artist)
+
+    # ----------------------------------------------------------------------
+    def feed(self) -> None:
+        """Render the figure and push the frame to the clients.
+
+        The frame is not encoded nor pushed if the image did not change
+        since the last frame. With the `series` backend only the data of
+        the lines is pushed.
+        """
+        if self._series is not None:
+            self._series.push()
+            return
+
+        self._render()
+        frame = np.asarray(self.canvas.buffer_rgba())
+        if self._last_frame is not None and np.array_equal(
+            frame, self._last_frame
+        ):
+            return
+        self._last_frame = frame.copy()
+
+        self._output.seek(0)
+        self._output.truncate(0)
+        Image.fromarray(frame).convert('RGB').save(
+            self._output, format='jpeg'
+        )
+        self._push(self._output.getvalue())
+
+    # ----------------------------------------------------------------------
+    def _push(self, frame: bytes) -> None:
+        """Queue a frame for the clients, without blocking.
+
+        Without clients nobody takes the frames, so the oldest ones are
+        discarded instead of waiting for space in the queue.
+        """
+        while True:
+            try:
+                return self._frames.put_nowait(frame)
+            except Full:
+                with suppress(Empty):
+                    self._frames.get_nowait()
+
+    # ----------------------------------------------------------------------
+    def _thread(self) -> None:
+        """Take the queued frames and signal the clients."""
+        while True:
+            self._frame = self._frames.get()
+            self._frame_event.set()
+
+    # ----------------------------------------------------------------------
+    def _get_frames(self):
+        """Yield the frames for a client as a multipart stream."""
+        while True:
+            self._frame_event.wait()
+            self._frame_event.clear()
+            yield (
+                b'--frame\r\n'
+                b'Content-Type: image/jpeg\r\n\r\n' + self._frame + b'\r\n'
+            )
+
+    # ----------------------------------------------------------------------
+    def _video_feed(self) -> Response:
+        """Endpoint `/figure.jpeg`, stream the frames of this figure.
+
+        Replaces the one of `FigureStream`, that serves the frames of its
+        own queue, which is not used here.
+        """
+        self.proccess_interact(request.values)
+
+        if self.size == 'auto':
+            width = request.values.get('width', '')
+            height = request.values.get('height', '')
+            if (
+                width.replace('.', '').isdigit()
+                and height.replace('.', '').isdigit()
+            ):
+                self.set_size_inches(
+                    float(width) / self.get_dpi(),
+                    float(height) / self.get_dpi(),
+                )
+        else:
+            self.set_size_inches(*self.size)
+
+        if self._frame_thread is None:
+            self._frame_thread = Thread(target=self._thread, daemon=True)
+            self._frame_thread.start()
+
+        return Response(
+            self._get_frames(),
+            mimetype='multipart/x-mixed-replace; boundary=frame',
+        )
 
     # ----------------------------------------------------------------------
     def wait_for_interact(self):
@@ -0,0 +1,247 @@
+"""
+=============
+Series Stream
+=============
+
+WebSocket backend for `EEGStream`, the lines of the figure are streamed as
+typed arrays and drawn in the browser, instead of rendering an image for
+each frame.
+
+The page served in the root of the visualization draws a canvas that fills
+the view, so resizing it does not need to reload the page, and the widgets
+are sent through the same socket. Two kinds of messages are sent:
+
+  * The layout, a JSON text with the position, limits, ticks and labels of
+    each axes and the style of its lines. It is only sent when it changes.
+  * The series, a binary message with the number of lines as `uint32`, and
+    for each line the number of points as `uint32` followed by the `x` and
+    `y` values as `float32`, all little-endian.
+
+Only the `Line2D` of the axes are streamed, other artists like
+`fill_between` are not drawn by this backend.
+"""
+
+import os
+import json
+import asyncio
+import logging
+from threading import Thread
+from typing import Optional
+
+import numpy as np
+from matplotlib.colors import to_hex
+from tornado.ioloop import IOLoop
+from tornado.web import Application, RequestHandler
+from tornado.websocket import WebSocketHandler, WebSocketClosedError
+
+PAGE = os.path.join(os.path.dirname(__file__), 'series_stream.html')
+
+
+# ----------------------------------------------------------------------
+def _ticks(axis, limits: tuple) -> list:
+    """The visible ticks of an axis and its labels."""
+    ticks = axis.get_majorticklocs()
+    low, high = sorted(limits)
+    ticks = [t for t in ticks if low <= t <= high]
+    labels = axis.get_major_formatter().format_ticks(ticks)
+    return [[float(t), str(label)] for t, label in zip(ticks, labels)]
+
+
+# ----------------------------------------------------------------------
+def _grid(axis) -> bool:
+    """"""
+    return any(line.get_visible() for line in axis.get_gridlines())
+
+
+# ----------------------------------------------------------------------
+def figure_layout(figure) -> str:
+    """The static content of the figure, as JSON."""
+    axes = []
+    for ax in figure.axes:
+        xlim, ylim = ax.get_xlim(), ax.get_ylim()
+        axes.append(
+            {
+                'position': list(ax.get_position().bounds),
+                'background': to_hex(ax.get_facecolor()),
+                'foreground': to_hex(ax.xaxis.label.get_color()),
+                'xlim': list(xlim),
+                'ylim': list(ylim),
+                'xticks': _ticks(ax.xaxis, xlim),
+                'yticks': _ticks(ax.yaxis, ylim),
+                'xgrid': _grid(ax.xaxis),
+                'ygrid': _grid(ax.yaxis),
+                'title': ax.get_title(),
+                'xlabel': ax.get_xlabel(),
+                'ylabel': ax.get_ylabel(),
+                'lines': [
+                    {
+                        'color': to_hex(line.get_color()),
+                        'alpha': line.get_alpha() or 1,
+                        'width': line.get_linewidth(),
+                        'visible': line.get_visible(),
+                    }
+                    for line in ax.lines
+                ],
+            }
+        )
+
+    return json.dumps(
+        {'background': to_hex(figure.get_facecolor()), 'axes': axes}
+    )
+
+
+# ----------------------------------------------------------------------
+def figure_series(figure) -> bytes:
+    """The data of all the lines of the figure, as a binary message."""
+    lines = [line for ax in figure.axes for line in ax.lines]
+    chunks = [np.array([len(lines)], dtype='<u4').tobytes()]
+    for line in lines:
+        x = np.asarray(line.get_xdata(), dtype='<f4').ravel()
+        y = np.asarray(line.get_ydata(), dtype='<f4').ravel()
+        n = min(x.size, y.size)
+        chunks.append(np.array([n], dtype='<u4').tobytes())
+        chunks.append(x[:n].tobytes())
+        chunks.append(y[:n].tobytes())
+    return b''.join(chunks)
+
+
+########################################################################
+class PageHandler(RequestHandler):
+    """The canvas renderer."""
+
+    # ----------------------------------------------------------------------
+    def get(self):
+        """"""
+        with open(PAGE, 'r') as file:
+            self.write(file.read())
+
+
+########################################################################
+class ModeHandler(RequestHandler):
+    """`/mode` endpoint, to load the visualization without resizer."""
+
+    # ----------------------------------------------------------------------
+    def get(self):
+        """"""
+        self.write('series')
+
+
+########################################################################
+class SeriesHandler(WebSocketHandler):
+    """Send the layout and the series to a client."""
+
+    # ----------------------------------------------------------------------
+    def initialize(self, server):
+        """"""
+        self.server = server
+        self.sending = None
+
+    # ----------------------------------------------------------------------
+    def check_origin(self, *args, **kwargs):
+        """"""
+        return True
+
+    # ----------------------------------------------------------------------
+    def open(self):
+        """Send the last layout and series to the new client."""
+        self.server.clients.add(self)
+        if self.server.layout:
+            self.write_message(self.server.layout)
+        if self.server.series:
+            self.sending = self.write_message(self.server.series, binary=True)
+
+    # ----------------------------------------------------------------------
+    def on_message(self, message: str):
+        """The values of the widgets."""
+        data = json.loads(message)
+        if 'interact' not in data:
+            return
+        # An error in a widget must not close the socket
+        try:
+            self.server.figure.proccess_interact(data['interact'])
+        except Exception:
+            logging.exception('Error processing the widgets')
+
+    # ----------------------------------------------------------------------
+    def on_close(self):
+        """"""
+        self.server.clients.discard(self)
+
+
+########################################################################
+class SeriesServer:
+    """Tornado server for the series of a figure, in its own thread.
+
+    Parameters
+    ----------
+    figure
+        The `EEGStream` streamed.
+    port
+        Port of the server.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(self, figure, port: Optional[int] = 5000):
+        """"""
+        self.figure = figure
+        self.clients = set()
+        self.layout = None
+        self.series = None
+        self.ioloop = None
+
+        Thread(target=self._run, args=(port,)).start()
+
+    # ----------------------------------------------------------------------
+    def _run(self, port: int) -> None:
+        """"""
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        app = Application(
+            [
+                (r'/', PageHandler),
+                (r'/mode', ModeHandler),
+                (r'/ws', SeriesHandler, {'server': self}),
+            ]
+        )
+        app.listen(int(port))
+        self.ioloop = IOLoop.current()
+        logging.info(f'Streaming series on port {port}')
+        self.ioloop.start()
+
+    # ----------------------------------------------------------------------
+    def push(self) -> None:
+        """Send the current state of the figure to the clients.
+
+        The layout is sent only if it changed, and the series are not sent
+        if they did not change or if a client is still receiving the
+        previous ones.
+        """
+        layout = figure_layout(self.figure)
+        series = figure_series(self.figure)
+
+        if layout != self.layout:
+            self.layout = layout
+            self._call(self._broadcast, layout, False)
+        if series != self.series:
+            self.series = series
+            self._call(self._broadcast, series, True)
+
+    # ----------------------------------------------------------------------
+    def _call(self, *args) -> None:
+        """Run in the thread of the server."""
+        if self.ioloop is not None:
+            self.ioloop.add_callback(*args)
+
+    # ----------------------------------------------------------------------
+    def _broadcast(self, message, binary: bool) -> None:
+        """"""
+        for client in list(self.clients):
+            # Drop the frames for the clients that are still busy
+            if binary and client.sending and not client.sending.done():
+                continue
+            try:
+                sending = client.write_message(message, binary=binary)
+            except WebSocketClosedError:
+                self.clients.discard(client)
+                continue
+            if binary:
+                client.sending = sending
@@ -9,7 +9,6 @@ import sys
 import time
 import json
 import psutil
-import pickle
 import platform
 import subprocess
 from datetime import datetime
@@ -45,6 +44,7 @@ from .environments import (
 from .config_manager import ConfigManager
 from .configuration import ConfigurationFrame
 from .subprocess_handler import run_subprocess
+from ..extensions.serializers import serialize, deserialize, peek
 from .raspad import Raspad
 
 KafkaMessage = TypeVar('KafkaMessage')
@@ -52,6 +52,9 @@ PathLike = TypeVar('PathLike')
 HostLike = TypeVar('HostLike')
 Millis = TypeVar('Milliseconds')
 
+# Seconds between status updates of the eeg and aux streams
+STATUS_INTERVAL = 1
+
 
 ########################################################################
 class ClockOffset(QThread):
@@ -111,7 +114,12 @@ class Kafka(QThread):
 
     # ----------------------------------------------------------------------
     def create_consumer(self) -> None:
-        """Basic consumer to check stream status and availability."""
+        """Basic consumer to check stream status and availability.
+
+        The `eeg` and `aux` packages are not deserialized, only one package
+        per second of each topic is inspected with `peek` to get the shape
+        and the timestamps.
+        """
         bootstrap_servers = [f'{self.host}:9092']
         topics = [
             'annotation',
@@ -123,29 +131,35 @@ class Kafka(QThread):
         ]
         self.consumer = KafkaConsumer(
             bootstrap_servers=bootstrap_servers,
-            value_deserializer=pickle.loads,
             auto_offset_reset='latest',
         )
 
+        last_status = {'eeg': 0, 'aux': 0}
         self.consumer.subscribe(topics)
         for message in self.consumer:
+            if not self.keep_alive:
+                return
             self.last_message = datetime.now()
-            message.value['timestamp'] = message.timestamp / 1000
 
+            if message.topic in last_status:
+                if time.time() < last_status[message.topic] + STATUS_INTERVAL:
+                    continue
+                last_status[message.topic] = time.time()
+                value = peek(message.value)
+            else:
+                value = deserialize(message.value)
+
+            value['timestamp'] = message.timestamp / 1000
             self.signal_kafka_message.emit(
-                {'topic': message.topic, 'value': message.value}
+                {'topic': message.topic, 'value': value}
             )
 
-            if not self.keep_alive:
-                return
-
     # ----------------------------------------------------------------------
     def create_produser(self) -> None:
         """The produser is used for stream annotations and markers."""
         self.produser = KafkaProducer(
             bootstrap_servers=[f'{self.host}:9092'],
-            compression_type='gzip',
-            value_serializer=pickle.dumps,
+            value_serializer=serialize,
         )
 
 
@@ -793,9 +807,9 @@ class BCIFramework(QMainWindow):
             )
             since = (message_created - binary_created).total_seconds()
             if value['topic'] == 'eeg':
-                self.eeg_size = value['value']['data'].shape
+                self.eeg_size = value['value']['shape']
             elif value['topic'] == 'aux':
-                self.aux_size = value['value']['data'].shape
+                self.aux_size = value['value']['shape']
 
             if since * 1000 > 2000:
                 color = '#ffc107'  # old data
@@ -829,12 +843,67 @@ class BCIFramework(QMainWindow):
         )
         self.thread_kafka.set_host(host)
         self.thread_kafka.start()
+        self.update_stream_hub(host)
 
         self.timer = QTimer()
         self.timer.setInterval(1000)
         self.timer.timeout.connect(self.keep_updated)
         self.timer.start()
 
+    # ----------------------------------------------------------------------
+    def update_stream_hub(self, host: HostLike) -> None:
+        """Start the stream hub for a new connection, only if it is used.
+
+        The hub is used if it is enabled with the `stream_hub` option of the
+        configuration, or if an extension asked for it with `shared=True`,
+        see `require_stream_hub`. Otherwise it is not started, since it
+        would consume and decode the streams once more.
+        """
+        self.stream_hub_host = host
+        enabled = self.config.get('framework', 'stream_hub', 'False')
+        if enabled == 'True' or getattr(self, 'stream_hub_required', False):
+            self.start_stream_hub(host)
+        else:
+            self.stop_stream_hub()
+
+    # ----------------------------------------------------------------------
+    def require_stream_hub(self) -> None:
+        """Start the stream hub for an extension that reads the shared
+        streams, if it is not running yet."""
+        self.stream_hub_required = True
+        host = getattr(self, 'stream_hub_host', None)
+        if host and not hasattr(self, 'subprocess_stream_hub'):
+            self.start_stream_hub(host)
+
+    # ----------------------------------------------------------------------
+    def start_stream_hub(self, host: HostLike) -> None:
+        """Share the streams with the local extensions.
+
+        The hub consumes `eeg` and `aux` once and the extensions read them
+        from shared memory, see `kafka_scripts/stream_hub.py`.
+        """
+        self.stop_stream_hub()
+        if '--local' in sys.argv:
+            root = os.environ['BCISTREAM_ROOT']
+        else:
+            root = os.environ['BCISTREAM_HOME']
+
+        self.subprocess_stream_hub = run_subprocess(
+            [
+                sys.executable,
+                os.path.join(root, 'kafka_scripts', 'stream_hub.py'),
+                '--host',
+                host,
+            ]
+        )
+
+    # ----------------------------------------------------------------------
+    def stop_stream_hub(self) -> None:
+        """"""
+        if hasattr(self, 'subprocess_stream_hub'):
+            self.subprocess_stream_hub.terminate()
+            del self.subprocess_stream_hub
+
     # ----------------------------------------------------------------------
     def calculate_offset(self) -> None:
         """"""
@@ -856,6 +925,7 @@ class BCIFramework(QMainWindow):
     def stop_kafka(self) -> None:
         """Stop kafka."""
         self.streaming = False
+        self.stop_stream_hub()
         if hasattr(self, 'thread_kafka'):
             self.thread_kafka.stop()
             self.status_bar(right_message=('No streaming', False))
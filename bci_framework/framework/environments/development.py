@@ -16,6 +16,7 @@ from PySide6.QtGui import QTextCursor, QKeySequence, QShortcut
 from ..extensions_handler import ExtensionWidget
 from ..editor import Autocompleter
 from ..widgets import projects
+from ..nbstreamreader import LEVELS
 
 # LINE_DELIVERY = 'bci_framework.extensions.stimuli_delivery'
 # LINE_VISUALIZATION = 'bci_framework.extensions.visualizations'
@@ -23,6 +24,7 @@ from ..widgets import projects
 # LINE_LOCKTIME = 'bci_framework.extensions.timelock_analysis'
 
 PATH = TypeVar('Path')
+MAX_LOG_LINES = 5000
 
 
 ########################################################################
@@ -47,7 +49,9 @@ class Development:
 
         self.log_timer = QTimer()
         self.log_timer.timeout.connect(self.update_log)
-        self.log_timer.setInterval(10)
+        self.log_timer.setInterval(100)
+        self.parent_frame.plainTextEdit_preview_log.setMaximumBlockCount(
+            MAX_LOG_LINES)
 
         self.timer_autosave = QTimer()
         self.timer_autosave.timeout.connect(self.save_all_files)
@@ -158,6 +162,7 @@ class Development:
 
         self.sub = ExtensionWidget(
             self.parent_frame.mdiArea_development, extensions_list=[], mode=self.mode)
+        self.sub.require_stream_hub = self.core.require_stream_hub
         self.parent_frame.mdiArea_development.addSubWindow(self.sub)
         self.sub.show()
         self.parent_frame.mdiArea_development.tileSubWindows()
@@ -179,98 +184,37 @@ class Development:
     def update_log(self) -> None:
         """Write logs into debugger.
 
-        Logging messages could be from Python or JavaScript (Bryhon).
+        Logging messages could be from Python or JavaScript (Bryhon). All the
+        pending records are rendered at once on each tick.
         """
 
-        # if not hasattr(self.sub, 'stream_subprocess'):
-            # # self.timer.singleShot(50, self.update_log)
-            # return
-
         if not hasattr(self.sub.stream_subprocess, 'stdout'):
             self.sub.stream_subprocess.start_debug()
-            # return
 
         loglevel = self.parent_frame.comboBox_log_level.currentText()
-        levels = ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
-        lines = []
+        levels = LEVELS[LEVELS.index(loglevel):]
+        records = []
 
         try:
             if hasattr(self.sub.stream_subprocess, 'subprocess_script'):
-                if line := self.sub.stream_subprocess.subprocess_script.nb_stdout.readline(timeout=0.01):
-                    if hasattr(line, 'decode'):
-                        lines.append(line.decode())
-                    else:
-                        lines.append(line)
+                records.extend(
+                    self.sub.stream_subprocess.subprocess_script.nb_stdout.drain()
+                )
 
             if self.mode == 'stimuli':
-                if line := self.sub.stream_subprocess.stdout.readline(timeout=0.01):
-                    if hasattr(line, 'decode'):
-                        lines.append(line.decode())
-                    else:
-                        lines.append(line)
+                records.extend(self.sub.stream_subprocess.stdout.drain())
         except:
             pass
 
-        # if hasattr(self.sub.stream_subprocess, 'subprocess_script'):
-            # if line := self.sub.stream_subprocess.stdout.readline(timeout=0.01):
-                # if hasattr(line, 'decode'):
-                    # lines.append(line.decode())
-                # else:
-                    # lines.append(line)
-
-        filter_ = [
-            'using indexedDB',
-            'Synchronous XMLHttpRequest',
-            'Error 404 means',
-            'The AudioContext',
-            'WARNING:tornado.access:404',
-            'INFO:tornado.access:200',
-            'upgrade needed',
-            'INFO:werkzeug',
-            '* Serving',
-            '* Environment:',
-            '* Debug mode:',
-            'This is a development server',
-            'selenium',
-        ]
-
-        for line in lines:
-            if not line.strip():
-                continue
-
-            trace = 'Traceback (most recent call last):'
-            if trace in line:
-                line = line[line.find(trace):]
-
-            c = False
-            for f in filter_:
-                if f in line:
-                    c = True
-                    break
-            if c:
-                continue
-
+        text = ''.join(
+            record.line if record.line.endswith('\n') else f'{record.line}\n'
+            for record in records
+            if record.level is None or record.level in levels
+        )
+        if text:
             self.parent_frame.plainTextEdit_preview_log.moveCursor(
                 QTextCursor.End)
-
-            if line[:line.find(':')] in levels:
-                s = [level == loglevel for level in levels]
-                if line[:line.find(':')] in levels[s.index(True):]:
-                    self.parent_frame.plainTextEdit_preview_log.insertPlainText(
-                        line)
-            else:
-                self.parent_frame.plainTextEdit_preview_log.insertPlainText(
-                    line)
-
-            if not line.endswith('\n'):
-                self.parent_frame.plainTextEdit_preview_log.insertPlainText(
-                    '\n')
-
-        # if lines:
-            # self.log_timer.setInterval(5)
-        # else:
-            # self.log_timer.setInterval(500)
-        # self.log_timer.setInterval(5)
+            self.parent_frame.plainTextEdit_preview_log.insertPlainText(text)
 
     # ----------------------------------------------------------------------
     def save_all_files(self) -> None:
@@ -68,6 +68,7 @@ class StimuliDelivery:
         sub.update_ip = self.update_ip
         sub.update_menu_bar()
         sub.loaded = self.widgets_set_enabled
+        sub.require_stream_hub = self.core.require_stream_hub
 
         QTimer().singleShot(100, self.widgets_set_enabled)
 
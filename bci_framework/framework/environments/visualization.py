@@ -103,6 +103,7 @@ class Visualization:
         self.parent_frame.mdiArea.tileSubWindows()
         sub.update_menu_bar()
         sub.loaded = self.widgets_set_enabled
+        sub.require_stream_hub = self.core.require_stream_hub
 
         sub.destroyed.connect(self.widgets_set_enabled)
         # sub..connect(self.resize_menubars)
@@ -127,6 +127,10 @@ class ExtensionWidget(QMdiSubWindow):
         """Load project."""
         self.current_viz = extension
         module = os.path.join(self.projects_dir, extension, 'main.py')
+        with open(module, 'r') as file:
+            # The hub must be running before the extension attach to it
+            if 'shared=True' in file.read():
+                self.require_stream_hub()
         self.stream_subprocess = LoadSubprocess(
             self.main, module, use_webview=not self.is_analysis, debugger=debugger)
 
@@ -152,6 +156,11 @@ class ExtensionWidget(QMdiSubWindow):
         """Method to connect events."""
         # keep this
 
+    # ----------------------------------------------------------------------
+    def require_stream_hub(self, *args, **kwargs) -> None:
+        """Method to connect events."""
+        # keep this
+
     # ----------------------------------------------------------------------
     def update_ip(self, *args, **kwargs) -> None:
         """Method to connect events."""
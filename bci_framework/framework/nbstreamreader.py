@@ -2,51 +2,155 @@
 ==========================
 Non blocking stream reader
 ==========================
-"""
 
-import time
-from typing import Optional, TypeVar, Union
-from threading import Thread
-from queue import Queue, Empty
+The output of the subprocesses is drained as soon as it is available, in
+bulk, so a chatty extension never blocks writing to a full pipe. The lines
+are parsed into `LogRecord` and stored in a bounded ring, when the ring is
+full the oldest records are dropped.
+"""
 
+import os
+import selectors
+from threading import Thread, Lock
+from collections import deque
+from typing import Optional, TypeVar, Union, List, NamedTuple, Iterable
 
 Stdout = TypeVar('Stdout')
 Seconds = TypeVar('Seconds')
 
+LEVELS = ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
+TRACEBACK = 'Traceback (most recent call last):'
+FILTERS = [
+    'using indexedDB',
+    'Synchronous XMLHttpRequest',
+    'Error 404 means',
+    'The AudioContext',
+    'WARNING:tornado.access:404',
+    'INFO:tornado.access:200',
+    'upgrade needed',
+    'INFO:werkzeug',
+    '* Serving',
+    '* Environment:',
+    '* Debug mode:',
+    'This is a development server',
+    'selenium',
+]
+
+
+########################################################################
+class LogRecord(NamedTuple):
+    """A line of log, `level` is `None` for lines without level."""
+
+    level: Optional[str]
+    line: str
+
+
+# ----------------------------------------------------------------------
+def parse_lines(
+    lines: Iterable[str], filters: Optional[List[str]] = FILTERS
+) -> List[LogRecord]:
+    """Create the records for a set of lines.
+
+    Empty lines and lines that contain any of the `filters` are discarded,
+    and tracebacks are trimmed to its start.
+    """
+    records = []
+    for line in lines:
+        if not line.strip():
+            continue
+        if any(f in line for f in filters):
+            continue
+
+        if (start := line.find(TRACEBACK)) > 0:
+            line = line[start:]
+
+        level = line[: line.find(':')]
+        records.append(LogRecord(level if level in LEVELS else None, line))
+    return records
+
 
 ########################################################################
 class NonBlockingStreamReader:
-    """Artificial `timeout` for blocking process."""
+    """Drain a stream in a background thread.
+
+    Parameters
+    ----------
+    stream
+        The `stdout` of a subprocess.
+    maxlen
+        Maximum number of records retained.
+    filters
+        Lines that contain any of these strings are discarded.
+    """
 
     # ----------------------------------------------------------------------
-    def __init__(self, stream: Stdout):
+    def __init__(
+        self,
+        stream: Stdout,
+        maxlen: Optional[int] = 10000,
+        filters: Optional[List[str]] = FILTERS,
+    ):
         """"""
         self.stream_stdout = stream
-        self.queue_messages = Queue()
+        self.filters = filters
+        self.records = deque(maxlen=maxlen)
+        self.dropped = 0
         self.kepp_alive = True
+        self._lock = Lock()
+
+        self.thread_collector = Thread(target=self._collect, daemon=True)
+        self.thread_collector.start()  # start collecting lines from the stream
 
-        def _populateQueue(stream, queue):
-            """Collect lines from 'stream' and put them in 'quque'."""
+    # ----------------------------------------------------------------------
+    def _collect(self) -> None:
+        """Read all the available bytes each time the stream is ready."""
+        fd = self.stream_stdout.fileno()
+        selector = selectors.DefaultSelector()
+        selector.register(fd, selectors.EVENT_READ)
 
-            while self.kepp_alive:
-                line = stream.readline()
-                if line:
-                    queue.put(line)
-                time.sleep(0.1)
+        partial = b''
+        while self.kepp_alive:
+            if not selector.select(timeout=0.5):
+                continue
+            chunk = os.read(fd, 2**16)
+            if not chunk:  # EOF
+                break
 
-        self.thread_collector = Thread(target=_populateQueue,
-                                       args=(self.stream_stdout,
-                                             self.queue_messages))
-        self.thread_collector.daemon = True
-        self.thread_collector.start()  # start collecting lines from the stream
+            *lines, partial = (partial + chunk).split(b'\n')
+            self._append(lines)
+
+        if partial:
+            self._append([partial])
+        selector.close()
+
+    # ----------------------------------------------------------------------
+    def _append(self, lines: List[bytes]) -> None:
+        """"""
+        records = parse_lines(
+            [line.decode(errors='replace') + '\n' for line in lines],
+            self.filters,
+        )
+        with self._lock:
+            overflow = len(self.records) + len(records) - self.records.maxlen
+            if overflow > 0:
+                self.dropped += overflow
+            self.records.extend(records)
+
+    # ----------------------------------------------------------------------
+    def drain(self) -> List[LogRecord]:
+        """Get and remove all the pending records."""
+        with self._lock:
+            records = list(self.records)
+            self.records.clear()
+        return records
 
     # ----------------------------------------------------------------------
     def readline(self, timeout: Optional[Seconds] = 0.1) -> Union[str, None]:
-        """Read lines from queue object."""
-        try:
-            return self.queue_messages.get(block=timeout is not None, timeout=timeout)
-        except Empty:
-            return None
+        """Get and remove the oldest pending line, without wait."""
+        with self._lock:
+            if self.records:
+                return self.records.popleft().line
+        return None
 
     # ----------------------------------------------------------------------
     def stop(self) -> None:
@@ -6,6 +6,7 @@ Subprocess handler
 
 import os
 import sys
+import json
 import socket
 import logging
 import subprocess
@@ -21,7 +22,7 @@ from PySide6.QtWebEngineWidgets import QWebEngineView
 from PySide6.QtWebEngineCore import QWebEnginePage
 
 from ..extensions import properties as prop
-from .nbstreamreader import NonBlockingStreamReader as NBSR
+from .nbstreamreader import NonBlockingStreamReader as NBSR, parse_lines
 
 PathLike = TypeVar('PathLike')
 HostLike = TypeVar('HostLike')
@@ -65,6 +66,14 @@ class BrythonLogging:
         """Concatenae messages."""
         self.message.put(message)
 
+    # ----------------------------------------------------------------------
+    def drain(self) -> list:
+        """Get all the pending messages as log records."""
+        lines = []
+        while not self.message.empty():
+            lines.append(self.message.get_nowait())
+        return parse_lines(lines)
+
     # ----------------------------------------------------------------------
     def readline(self, timeout: Optional[int] = None) -> str:
         """Get mesage from JavaScriptConsole."""
@@ -90,8 +99,14 @@ class VisualizationSubprocess:
         try:
             size = self.main.web_engine.size()
 
+            if self.series and self.plot_dpi:
+                # The page resizes itself, only the widgets are sent
+                if self.input_interact():
+                    self.main.web_engine.page().runJavaScript(
+                        f'interact({json.dumps(self.update_interact())})')
+
             # reload if changes
-            if self.plot_size != size or self.plot_dpi != self.main.DPI or self.input_interact():
+            elif self.plot_size != size or self.plot_dpi != self.main.DPI or self.input_interact():
                 if 'light' in os.environ.get('QTMATERIAL_THEME'):
                     background = 'ffffff'
                 else:
@@ -192,6 +207,7 @@ class LoadSubprocess(VisualizationSubprocess, StimuliSubprocess):
         self.web_view = self.main.gridLayout_webview
         self.plot_size = QSize(0, 0)
         self.plot_dpi = 0
+        self.series = False
         self.stopped = False
         self.debugger = debugger
 
@@ -264,7 +280,8 @@ class LoadSubprocess(VisualizationSubprocess, StimuliSubprocess):
 
         # and only when the mode is explicit...
 
-        if self.mode == 'visualization':
+        self.series = self.mode == 'series'
+        if self.mode in ['visualization', 'series']:
             self.is_visualization = True
             self.is_stimuli = False
             self.is_analysis = False
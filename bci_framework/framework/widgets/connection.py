@@ -687,6 +687,11 @@ class Connection:
         self.parent_frame.pushButton_connect.setEnabled(True)
         self.parent_frame.pushButton_connect.setChecked(True)
 
+        # The hub must be started with the environ of the new connection
+        self.core.update_stream_hub(
+            self.parent_frame.comboBox_host.currentText()
+        )
+
         if '--local' in sys.argv:
             dst_config = os.path.join(os.environ['BCISTREAM_ROOT'],
                                       'python_scripts', 'bciframework_server', 'bciframework.config')
@@ -6,11 +6,12 @@ Montage
 
 import os
 import json
+import time
 import logging
 from typing import List, TypeVar, Dict, Optional
 
 from PySide6.QtGui import QCursor
-from PySide6.QtCore import QTimer, QSize, Qt
+from PySide6.QtCore import QTimer, QSize, Qt, QThread, Signal
 from PySide6.QtWidgets import (
     QLabel,
     QComboBox,
@@ -24,6 +25,7 @@ from PySide6.QtGui import QResizeEvent
 import mne
 import numpy as np
 from scipy.spatial.distance import pdist, squareform, euclidean
+from scipy.signal import sosfilt, sosfilt_zi, tf2sos
 import matplotlib
 from matplotlib import cm, pyplot
 from matplotlib.figure import Figure
@@ -32,11 +34,11 @@ from matplotlib.backends.backend_qt5agg import (
     FigureCanvasQTAgg as FigureCanvas,
 )
 
-from openbci_stream.acquisition import OpenBCIConsumer
 from gcpds.filters import frequency as filters
 
 from ...extensions import properties as prop
-from ...extensions.data_analysis.utils import thread_this
+from ...extensions.serializers import consumer
+from ...extensions.data_analysis.ring_buffer import RingBuffer
 
 
 from mne.channels.layout import _find_topomap_coords
@@ -50,6 +52,146 @@ except:
 VOLTS = TypeVar('Volts')
 IMPEDANCE = TypeVar('Impedance')
 
+# The board is configured at 250 SPS to measure the impedances
+IMPEDANCE_SAMPLE_RATE = 250
+
+
+# ----------------------------------------------------------------------
+def rms_to_z(rms: np.ndarray) -> np.ndarray:
+    """Impedance of the RMS voltage of the lead-off test signal.
+
+    The test signal is a 6 nA current, the 2.2 kOhm resistor of the board
+    is removed.
+    """
+    z = (1e-6 * np.asarray(rms) * np.sqrt(2) / 6e-9) - 2200
+    return np.maximum(z, 0)
+
+
+########################################################################
+class ImpedanceMeter:
+    """Streaming impedance of all the channels.
+
+    The notch and the band-pass filters are applied to each package as it
+    arrives, keeping the state of the filters between packages, and the
+    impedances are calculated with the RMS of the last filtered samples.
+
+    Parameters
+    ----------
+    channels
+        Number of channels.
+    window
+        Number of samples used for the RMS.
+    fs
+        Sample rate.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(
+        self,
+        channels: int,
+        window: Optional[int] = 1000,
+        fs: Optional[int] = IMPEDANCE_SAMPLE_RATE,
+    ):
+        """"""
+        sos = [
+            tf2sos(*filters.notch60._fit(fs)),
+            tf2sos(*filters.GenericButterBand(27, 37, fs=fs)._fit(fs)),
+        ]
+        # Applied twice, the magnitude response is the same as with the
+        # `filtfilt` of the filters, so the impedances are not changed
+        self.sos = np.concatenate(sos * 2)
+        self.filtered = RingBuffer(channels, int(window))
+        self._zi = None
+
+    # ----------------------------------------------------------------------
+    def push(self, v: VOLTS) -> None:
+        """Filter a package of shape (`channels, time`)."""
+        v = np.nan_to_num(np.asarray(v, dtype=float))
+        if self._zi is None or self._zi.shape[1] != v.shape[0]:
+            # Start the filters in steady state with the first sample
+            self._zi = sosfilt_zi(self.sos)[:, None, :] * v[None, :, 0, None]
+            self.filtered = RingBuffer(v.shape[0], self.filtered.length)
+        v, self._zi = sosfilt(self.sos, v, axis=-1, zi=self._zi)
+        self.filtered.write(v)
+
+    # ----------------------------------------------------------------------
+    @property
+    def impedances(self) -> IMPEDANCE:
+        """Impedance of each channel, in Ohms."""
+        v = self.filtered.view(self.filtered.written)
+        return rms_to_z(np.std(v, axis=-1))
+
+
+########################################################################
+class ImpedanceWorker(QThread):
+    """Configure the board and measure the impedances on a thread.
+
+    Parameters
+    ----------
+    core
+        The framework core, to access the OpenBCI connection.
+    interval
+        Seconds between impedance updates.
+    window
+        Number of samples used for the RMS.
+    """
+
+    signal_impedance = Signal(object)
+    keep_alive = True
+
+    # ----------------------------------------------------------------------
+    def __init__(
+        self,
+        core,
+        interval: Optional[float] = 1,
+        window: Optional[int] = 1000,
+    ):
+        """"""
+        super().__init__()
+        self.core = core
+        self.interval = interval
+        self.window = window
+
+    # ----------------------------------------------------------------------
+    def stop(self) -> None:
+        """Finish the measurement with the next package."""
+        self.keep_alive = False
+
+    # ----------------------------------------------------------------------
+    def run(self) -> None:
+        """Change OpenBCI configurations and read the impedances."""
+        if not hasattr(self.core.connection, 'openbci'):
+            self.core.connection.openbci_connect()
+
+        openbci = self.core.connection.openbci.openbci
+
+        response = openbci.command(openbci.SAMPLE_RATE_250SPS)
+        logging.warning(response)
+
+        response = openbci.command(openbci.DEFAULT_CHANNELS_SETTINGS)
+        logging.warning(response)
+
+        openbci.leadoff_impedance(
+            prop.CHANNELS,
+            pchan=openbci.TEST_SIGNAL_NOT_APPLIED,
+            nchan=openbci.TEST_SIGNAL_APPLIED,
+        )
+
+        meter = ImpedanceMeter(len(prop.CHANNELS), self.window)
+        last = time.monotonic()
+        with consumer(['eeg']) as stream:
+            for data in stream:
+                if not self.keep_alive:
+                    break
+
+                meter.push(data.value['data'])
+                if time.monotonic() - last >= self.interval:
+                    last = time.monotonic()
+                    # In kOhms
+                    self.signal_impedance.emit(meter.impedances / 1000)
+
+        self.core.connection.openbci.session_settings()
+
 
 ########################################################################
 class TopoplotBase(FigureCanvas):
@@ -355,12 +497,7 @@ class TopoplotImpedances(TopoplotBase):
         """Convert voltage to impedance."""
         v = filters.notch60(v, fs=250)
         v = self.band_2737(v, fs=250)
-
-        rms = np.std(v)
-        z = (1e-6 * rms * np.sqrt(2) / 6e-9) - 2200
-        if z < 0:
-            return 0
-        return z
+        return float(rms_to_z(np.std(v)))
 
     # ----------------------------------------------------------------------
     def reset_plot(self) -> None:
@@ -589,6 +726,12 @@ class Montage:
         self.parent_frame.gridLayout_impedances.addWidget(
             self.topoplot_impedance
         )
+        self.impedance_worker = ImpedanceWorker(core)
+        self._restart_impedance = False
+        self.impedance_worker.signal_impedance.connect(self.update_impedance)
+        self.impedance_worker.finished.connect(
+            self.restart_impedance_measurement
+        )
         # self.update_impedance()
 
         self.load_montage()
@@ -996,59 +1139,34 @@ class Montage:
         # bool(list(filter(lambda x: x > 8, montage.keys()))))
 
     # ----------------------------------------------------------------------
-    @thread_this
     def start_impedance_measurement(self) -> None:
-        """Change OpenBCI configurations to read impedance."""
+        """Start or stop the impedance worker with the checkbox."""
         if self.parent_frame.checkBox_view_impedances.isChecked():
+            # Before `start`, so a `stop` right after it is not overwritten
+            self.impedance_worker.keep_alive = True
+            if self.impedance_worker.isRunning():
+                # Still running if it was stopped without new packages, if
+                # it already left the loop it is started again on `finished`
+                self._restart_impedance = True
+            else:
+                self.impedance_worker.start()
+        else:
+            self.impedance_worker.stop()
 
-            if not hasattr(self.core.connection, 'openbci'):
-                self.core.connection.openbci_connect()
-
-            openbci = self.core.connection.openbci.openbci
-
-            response = openbci.command(openbci.SAMPLE_RATE_250SPS)
-            logging.warning(response)
-
-            response = openbci.command(openbci.DEFAULT_CHANNELS_SETTINGS)
-            logging.warning(response)
-
-            openbci.leadoff_impedance(
-                prop.CHANNELS,
-                pchan=openbci.TEST_SIGNAL_NOT_APPLIED,
-                nchan=openbci.TEST_SIGNAL_APPLIED,
-            )
-
-            self.measuring_impedance = True
-            V = []
-            with OpenBCIConsumer(host=prop.HOST, topics=['eeg']) as stream:
-
-                n = 1000 // prop.STREAMING_PACKAGE_SIZE
-                frame = 0
-                for data in stream:
-                    frame += 1
-                    if data.topic == 'eeg':
-
-                        v = data.value['data']
-                        V.append(v)
-
-                        if len(V) > 10:
-                            V.pop(0)
-
-                        if frame % n == 0:
-                            z = np.array(
-                                [
-                                    self.topoplot_impedance.raw_to_z(v)
-                                    for v in np.concatenate(V, axis=1)
-                                ]
-                            )
-                            self.update_impedance(z / 1000)
-
-                        if not self.measuring_impedance:
-                            self.core.connection.openbci.session_settings()
-                            break
+    # ----------------------------------------------------------------------
+    def restart_impedance_measurement(self) -> None:
+        """Start the worker again if the checkbox was checked while it was
+        leaving the measurement loop."""
+        restart, self._restart_impedance = self._restart_impedance, False
+        if restart and self.parent_frame.checkBox_view_impedances.isChecked():
+            # `finished` is emitted right before the thread ends
+            self.impedance_worker.wait()
+            self.impedance_worker.start()
 
-        else:
-            self.measuring_impedance = False
+    # ----------------------------------------------------------------------
+    def set_impedance_interval(self, interval: float) -> None:
+        """Seconds between impedance updates."""
+        self.impedance_worker.interval = interval
 
 
 ########################################################################
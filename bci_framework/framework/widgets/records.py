@@ -13,8 +13,11 @@ from PySide6.QtWidgets import QTableWidgetItem, QApplication, QMenu
 from PySide6.QtCore import Qt, QTimer
 from PySide6.QtGui import QCursor, QIcon, QCursor, QAction
 
-from openbci_stream.utils import HDF5Reader
-
+from ...extensions.records import (
+    RecordCatalogue,
+    consolidate,
+    open_record,
+)
 from ..subprocess_handler import run_subprocess
 from ..dialogs import Dialogs
 
@@ -35,6 +38,7 @@ class Records:
             os.getenv('BCISTREAM_HOME'), 'records'
         )
         os.makedirs(self.records_dir, exist_ok=True)
+        self.catalogue = RecordCatalogue(self.records_dir)
 
         self.connect()
 
@@ -59,6 +63,9 @@ class Records:
         self.parent_frame.horizontalSlider_record.valueChanged.connect(
             self.update_record_time
         )
+        self.parent_frame.horizontalSlider_record.sliderReleased.connect(
+            self.seek_record
+        )
         self.parent_frame.pushButton_play_signal.clicked.connect(
             self.stream_record
         )
@@ -74,6 +81,11 @@ class Records:
             self.remove_record
         )
 
+    # ----------------------------------------------------------------------
+    def record_path(self, name: str) -> str:
+        """Path of a record, a segments directory or an HDF5 file."""
+        return self.catalogue.path(name)
+
     # ----------------------------------------------------------------------
     def remove_record(self) -> None:
         """Remove file from records directory."""
@@ -85,11 +97,11 @@ class Records:
         ).previous_name
 
         if Dialogs.remove_file_warning(self.parent_frame, filename):
-            os.remove(
-                os.path.join(
-                    self.records_dir, f'{filename.replace(":", "_")}.h5'
-                )
-            )
+            path = self.record_path(filename.replace(":", "_"))
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
             self.load_records()
 
     # ----------------------------------------------------------------------
@@ -102,10 +114,12 @@ class Records:
         new_name = item.text()
 
         if old_name != new_name:
-            shutil.move(
-                os.path.join(self.records_dir, f'{old_name}.h5'),
-                os.path.join(self.records_dir, f'{new_name}.h5'),
-            )
+            path = self.record_path(old_name)
+            if os.path.isdir(path):
+                new_path = os.path.join(self.records_dir, new_name)
+            else:
+                new_path = os.path.join(self.records_dir, f'{new_name}.h5')
+            shutil.move(path, new_path)
             self.load_records()
 
     # ----------------------------------------------------------------------
@@ -117,16 +131,11 @@ class Records:
         self.parent_frame.tableWidget_records.setHorizontalHeaderLabels(
             ['Duration', 'Datetime', 'Name']
         )
-        records = filter(
-            lambda s: s.endswith('h5'), os.listdir(self.records_dir)
-        )
+        self.catalogue.refresh()
 
         i = 0
-        for filename in records:
-            try:
-                metadata = self.get_metadata(filename)[:3]
-            except:
-                continue
+        for entry in self.catalogue.records():
+            metadata = self.get_metadata(entry)[:3]
 
             self.parent_frame.tableWidget_records.insertRow(i)
             for j, value in enumerate(metadata):
@@ -154,45 +163,30 @@ class Records:
         )
 
     # ----------------------------------------------------------------------
-    def get_metadata(self, filename: str, light: bool = True) -> None:
-        """Read the record file and load the header."""
-        file = None
-        for _ in range(10):
-            try:
-                file = HDF5Reader(os.path.join(self.records_dir, filename))
-                break
-            except:
-                continue
-
-        if file is None:
-            return False
-
-        montage = file.header['montage']
-        channels = file.header['channels']
-        filename = filename.replace('.h5', '')
-        created = datetime.fromtimestamp(file.header['datetime']).strftime(
+    def get_metadata(self, entry) -> list:
+        """Metadata of a record from the catalogue.
+
+        Parameters
+        ----------
+        entry
+            The name of the record or its entry in the catalogue.
+        """
+        if isinstance(entry, str):
+            entry = self.catalogue.get(entry)
+
+        created = datetime.fromtimestamp(entry['datetime']).strftime(
             "%x %X"
         )
-        _, samples = file.header['shape']
-        sample_rate = file.header['sample_rate']
-        duration = str(timedelta(seconds=int(samples / sample_rate)))
-
-        if not light:
-            annotations = file.annotations
-            markers = file.markers
-        else:
-            annotations = []
-            markers = []
+        duration = str(timedelta(seconds=int(entry['duration'])))
 
-        file.close()
         return [
             duration,
             created,
-            filename,
-            montage,
-            channels,
-            annotations,
-            markers,
+            entry['name'],
+            entry['montage'],
+            entry['channels'],
+            entry['annotations'],
+            entry['markers'],
         ]
 
     # ----------------------------------------------------------------------
@@ -213,7 +207,7 @@ class Records:
             electrodes,
             annotations,
             markers,
-        ) = self.get_metadata(f"{name}.h5", light=False)
+        ) = self.get_metadata(name)
 
         electrodes = list(electrodes.values())
         electrodes = '\n'.join(
@@ -296,24 +290,37 @@ class Records:
             str(offset - timedelta(microseconds=offset.microseconds))
         )
 
+    # ----------------------------------------------------------------------
+    def kafka_script(self, name: str) -> str:
+        """Path of a script from `kafka_scripts`."""
+        if '--local' in sys.argv:
+            root = os.environ['BCISTREAM_ROOT']
+        else:
+            root = os.environ['BCISTREAM_HOME']
+        return os.path.join(root, 'kafka_scripts', name)
+
     # ----------------------------------------------------------------------
     def stream_record(self, toggled) -> None:
-        """Start the stream."""
+        """Start the stream.
+
+        The record is published by `kafka_scripts/playback.py` in its own
+        process, with the cadence and schema of the live streaming.
+        """
         self.parent_frame.tableWidget_records.selectRow(self.current_signal)
 
         if toggled:
-            QApplication.setOverrideCursor(QCursor(Qt.WaitCursor))
-            self.record_reader = HDF5Reader(
-                os.path.join(
-                    self.records_dir,
-                    f'{self.parent_frame.label_record_name.text()}.h5',
-                )
+            self.subprocess_playback = run_subprocess(
+                [
+                    sys.executable,
+                    self.kafka_script('playback.py'),
+                    self.record_path(
+                        self.parent_frame.label_record_name.text()
+                    ),
+                    '--start',
+                    str(self.get_offset()),
+                ]
             )
-            self.record_reader.eeg  # cached
-            self.record_reader.aux  # cached
-            QApplication.restoreOverrideCursor()
 
-            self.start_streaming = 0
             self.start_play = datetime.now()
             self.timer = QTimer()
             self.timer.setInterval(1000 / 4)
@@ -324,15 +331,25 @@ class Records:
             )
 
         else:
-            self.record_reader.close()
+            self.subprocess_playback.terminate()
             self.timer.stop()
             self.parent_frame.pushButton_play_signal.setIcon(
                 QIcon.fromTheme('media-playback-start')
             )
 
+    # ----------------------------------------------------------------------
+    def seek_record(self) -> None:
+        """Move the playback to the position of the slider."""
+        if not self.parent_frame.pushButton_play_signal.isChecked():
+            return
+        if produser := getattr(self.core.thread_kafka, 'produser', False):
+            produser.send(
+                'playback', {'action': 'seek', 'position': self.get_offset()}
+            )
+
     # ----------------------------------------------------------------------
     def update_timer(self) -> None:
-        """Stream data into kafka."""
+        """Move the slider with the playback."""
         now = datetime.now()
         delta = now - self.start_play + timedelta(seconds=self.get_offset())
 
@@ -346,45 +363,6 @@ class Records:
         )
         self.parent_frame.horizontalSlider_record.setValue(int(value))
 
-        end_streaming = int(
-            (
-                self.record_reader.eeg.shape[1]
-                * self.parent_frame.horizontalSlider_record.value()
-            )
-            / self.parent_frame.horizontalSlider_record.maximum()
-        )
-
-        if samples := end_streaming - self.start_streaming:
-            if samples < 0:
-                samples = 4 * self.record_reader.eeg.shape[1] / 1000
-
-            # print(samples, [max([end_streaming - samples, 0]), end_streaming])
-            samples = int(samples)
-
-            context = {
-                'timestamp.binary': datetime.now().timestamp(),
-                'created': datetime.now().timestamp(),
-                'samples': samples,
-            }
-
-            data_ = {
-                'context': context,
-                'data': (
-                    self.record_reader.eeg[
-                        :, max([end_streaming - samples, 0]) : end_streaming
-                    ],
-                    self.record_reader.aux[
-                        :, max([end_streaming - samples, 0]) : end_streaming
-                    ],
-                ),
-            }
-            self.start_streaming = end_streaming
-
-            if produser := getattr(
-                self.core.thread_kafka, 'produser', False
-            ):
-                produser.send('eeg', data_)
-
     # ----------------------------------------------------------------------
     def update_timer_record(self) -> None:
         """Update the timer to indicate that the records is active."""
@@ -407,28 +385,9 @@ class Records:
             self.timer.timeout.connect(self.update_timer_record)
             self.timer.start()
 
-            if '--local' in sys.argv:
-                self.subprocess_script = run_subprocess(
-                    [
-                        sys.executable,
-                        os.path.join(
-                            os.environ['BCISTREAM_ROOT'],
-                            'kafka_scripts',
-                            'record.py',
-                        ),
-                    ]
-                )
-            else:
-                self.subprocess_script = run_subprocess(
-                    [
-                        sys.executable,
-                        os.path.join(
-                            os.environ['BCISTREAM_HOME'],
-                            'kafka_scripts',
-                            'record.py',
-                        ),
-                    ]
-                )
+            self.subprocess_script = run_subprocess(
+                [sys.executable, self.kafka_script('record.py')]
+            )
         else:
             self.recording_status = None
             self.timer.stop()
@@ -475,9 +434,10 @@ class Records:
         """"""
         QApplication.setOverrideCursor(QCursor(Qt.WaitCursor))
         try:
-            h5 = os.path.join(self.records_dir, f'{filename}.h5')
-            with HDF5Reader(h5) as reader:
-                reader.to_edf(h5.replace('.h5', '.edf'))
+            with open_record(self.record_path(filename)) as reader:
+                reader.to_edf(
+                    os.path.join(self.records_dir, f'{filename}.edf')
+                )
         finally:
             QApplication.restoreOverrideCursor()
 
@@ -486,16 +446,17 @@ class Records:
         """"""
         QApplication.setOverrideCursor(QCursor(Qt.WaitCursor))
         try:
-            h5 = os.path.join(self.records_dir, f'{filename}.h5')
-            with HDF5Reader(h5) as reader:
-                reader.to_npy(h5.replace('.h5', ''))
+            with open_record(self.record_path(filename)) as reader:
+                reader.to_npy(os.path.join(self.records_dir, filename))
         finally:
             QApplication.restoreOverrideCursor()
 
     # ----------------------------------------------------------------------
     def open_with_jupyter(self, filename):
         """"""
-        h5 = os.path.join(self.records_dir, f'{filename}.h5')
+        h5 = self.record_path(filename)
+        if os.path.isdir(h5):
+            h5 = consolidate(h5)
         notebook = os.path.join(
             os.environ['BCISTREAM_ROOT'], 'assets', 'jupyter.ipynb'
         )
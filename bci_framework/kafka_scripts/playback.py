@@ -0,0 +1,320 @@
+"""
+========
+Playback
+========
+
+Stream a record into Kafka with the same schema of the acquisition server.
+
+The `eeg` and `aux` packages are published with the original package size
+and cadence, including the `sample_ids` and the `timestamp.binary` of each
+board, and the markers and annotations are published when the playback
+reach them, so any data analysis or visualization can consume a record as
+if it were a live streaming.
+
+The timestamps are rebased to the moment the playback starts, use
+`--original-timestamps` to publish them unchanged. With a speed factor the
+packages are published faster (or slower) but the timestamps keep the
+original spacing.
+
+The playback can be controlled while running with messages on the
+`playback` topic: `{'action': 'seek', 'position': seconds}`,
+`{'action': 'speed', 'speed': factor}`, `{'action': 'pause'}`,
+`{'action': 'resume'}` and `{'action': 'stop'}`.
+
+.. code-block:: bash
+
+    $ python playback.py records/record-01_01_21-12_00_00 --speed 4 --loop
+"""
+
+import sys
+import time
+import bisect
+import signal
+import logging
+import argparse
+from datetime import datetime
+from threading import Thread, Event
+from typing import Optional
+
+import numpy as np
+from kafka import KafkaProducer, KafkaConsumer
+
+from bci_framework.extensions import properties as prop
+from bci_framework.extensions.records import RecordReader
+from bci_framework.extensions.serializers import serializer, deserialize
+
+MIN_SPEED = 0.5
+MAX_SPEED = 20
+
+
+########################################################################
+class RecordPlayback:
+    """Publish a record on the original package cadence.
+
+    Parameters
+    ----------
+    path
+        An HDF5 record or a directory with segments.
+    host
+        Kafka host.
+    speed
+        Speed factor, between `0.5` and `20`.
+    start
+        Initial position in seconds.
+    loop
+        Start again when the record ends.
+    package_size
+        Samples per package, by default the one used during the record.
+    rebase
+        Move the timestamps to the moment the playback starts.
+    compression
+        Compression for the binary packages.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(
+        self,
+        path: str,
+        host: Optional[str] = 'localhost',
+        speed: Optional[float] = 1,
+        start: Optional[float] = 0,
+        loop: Optional[bool] = False,
+        package_size: Optional[int] = None,
+        rebase: Optional[bool] = True,
+        compression: Optional[str] = 'none',
+    ):
+        """"""
+        self.reader = RecordReader(path)
+        self.host = host
+        self.loop = loop
+        self.rebase = rebase
+        self.speed = self._clip_speed(speed)
+        self.package_size = int(
+            package_size or self.reader.header['streaming_sample_rate']
+        )
+
+        self.markers = self.reader.events('markers')
+        self.annotations = self.reader.events('annotations')
+        self.markers_times = [event[0] for event in self.markers]
+        self.annotations_times = [event[0] for event in self.annotations]
+        self.aux_ratio = self.reader.aux.shape[1] / max(
+            self.reader.eeg.shape[1], 1
+        )
+
+        self.producer = KafkaProducer(
+            bootstrap_servers=[f'{host}:9092'],
+            value_serializer=serializer(compression),
+        )
+
+        self.running = Event()
+        self.running.set()
+        self.closed = False
+        self.seek(start)
+
+    # ----------------------------------------------------------------------
+    @staticmethod
+    def _clip_speed(speed: float) -> float:
+        """"""
+        if not MIN_SPEED <= speed <= MAX_SPEED:
+            logging.warning(
+                f'Speed must be between {MIN_SPEED} and {MAX_SPEED}'
+            )
+        return float(np.clip(speed, MIN_SPEED, MAX_SPEED))
+
+    # ----------------------------------------------------------------------
+    def seek(self, position: float) -> None:
+        """Move the playback to a position in seconds."""
+        self.position = self.reader.index(position)
+        self._restart_clock()
+
+    # ----------------------------------------------------------------------
+    def set_speed(self, speed: float) -> None:
+        """Change the speed factor keeping the current position."""
+        self.speed = self._clip_speed(speed)
+        self._restart_clock()
+
+    # ----------------------------------------------------------------------
+    def _restart_clock(self) -> None:
+        """Reference for the cadence and the timestamps."""
+        self.clock_position = self.position
+        self.clock_start = time.monotonic()
+
+        if self.position < self.reader.eeg.shape[1]:
+            first = self.reader.timestamp[self.position]
+        else:
+            first = self.reader.timestamp[-1]
+        self.offset = datetime.now().timestamp() - first if self.rebase else 0
+        self.last_event = first
+
+    # ----------------------------------------------------------------------
+    def _wait(self) -> None:
+        """Sleep until the moment the next package must be published."""
+        elapsed = (
+            (self.position - self.clock_position)
+            / self.reader.sample_rate
+            / self.speed
+        )
+        delay = self.clock_start + elapsed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    # ----------------------------------------------------------------------
+    def publish(self, start: int, stop: int) -> None:
+        """Publish the packages for the samples `[start, stop)`."""
+        eeg = self.reader.eeg[:, start:stop]
+        timestamp = self.reader.timestamp.array[:, stop - 1] + self.offset
+
+        context = {
+            'timestamp.binary': timestamp.tolist(),
+            'samples': [stop - start],
+            'playback': True,
+        }
+        sample_ids = None
+        if self.reader.sample_id.rows:
+            sample_ids = self.reader.sample_id[:, start:stop].astype(int)
+            context['sample_ids'] = sample_ids
+
+        self.producer.send('eeg', {'context': context, 'data': eeg})
+
+        if self.reader.aux.rows:
+            aux_start = int(start * self.aux_ratio)
+            aux_stop = int(stop * self.aux_ratio)
+            aux = self.reader.aux[:, aux_start:aux_stop]
+            context = context.copy()
+            if sample_ids is not None:
+                # The ids of the eeg samples at the aux samples
+                index = np.arange(aux_start, aux_stop) / self.aux_ratio
+                index = np.clip(index.astype(int) - start, 0, stop - start - 1)
+                context['sample_ids'] = sample_ids[:, index]
+            self.producer.send('aux', {'context': context, 'data': aux})
+
+        self.publish_events(self.reader.timestamp[stop - 1])
+
+    # ----------------------------------------------------------------------
+    def publish_events(self, until: float) -> None:
+        """Publish the markers and annotations until a timestamp."""
+        for t, marker in self._between(
+            self.markers, self.markers_times, until
+        ):
+            self.producer.send(
+                'marker',
+                {'marker': marker, 'datetime': float(t + self.offset)},
+            )
+
+        for onset, duration, description in self._between(
+            self.annotations, self.annotations_times, until
+        ):
+            self.producer.send(
+                'annotation',
+                {
+                    'onset': datetime.fromtimestamp(onset + self.offset),
+                    'duration': duration,
+                    'description': description,
+                },
+            )
+        self.last_event = until
+
+    # ----------------------------------------------------------------------
+    def _between(self, events: list, times: list, until: float) -> list:
+        """The events after the last published one and before `until`."""
+        start = bisect.bisect_right(times, self.last_event)
+        return events[start : bisect.bisect_right(times, until)]
+
+    # ----------------------------------------------------------------------
+    def run(self) -> None:
+        """Publish the record until the end, or forever with `loop`."""
+        samples = self.reader.eeg.shape[1]
+        while not self.closed:
+            self.running.wait()
+
+            if self.position + self.package_size > samples:
+                if not self.loop:
+                    break
+                self.seek(0)
+                continue
+
+            self._wait()
+            start = self.position
+            self.position += self.package_size
+            self.publish(start, self.position)
+
+        self.close()
+
+    # ----------------------------------------------------------------------
+    def control(self, message: dict) -> None:
+        """Handle a message from the `playback` topic."""
+        action = message.get('action', None)
+        if action == 'seek':
+            self.seek(message['position'])
+        elif action == 'speed':
+            self.set_speed(message['speed'])
+        elif action == 'pause':
+            self.running.clear()
+        elif action == 'resume':
+            self._restart_clock()
+            self.running.set()
+        elif action == 'stop':
+            self.stop()
+
+    # ----------------------------------------------------------------------
+    def listen(self) -> None:
+        """Consume the `playback` topic in a background thread."""
+
+        def target():
+            consumer = KafkaConsumer(
+                bootstrap_servers=[f'{self.host}:9092'],
+                value_deserializer=deserialize,
+                auto_offset_reset='latest',
+            )
+            consumer.subscribe(['playback'])
+            for message in consumer:
+                self.control(message.value)
+                if self.closed:
+                    break
+            consumer.close()
+
+        Thread(target=target, daemon=True).start()
+
+    # ----------------------------------------------------------------------
+    def stop(self, *args, **kwargs) -> None:
+        """Finish the playback after the current package."""
+        self.closed = True
+        self.running.set()
+
+    # ----------------------------------------------------------------------
+    def close(self) -> None:
+        """"""
+        self.closed = True
+        self.producer.flush()
+        self.reader.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Record playback')
+    parser.add_argument('path', help='HDF5 record or segments directory')
+    parser.add_argument('--host', default=None)
+    parser.add_argument('--speed', type=float, default=1)
+    parser.add_argument('--start', type=float, default=0)
+    parser.add_argument('--loop', action='store_true')
+    parser.add_argument('--package-size', type=int, default=None)
+    parser.add_argument('--original-timestamps', action='store_true')
+    parser.add_argument(
+        '--compression', default='none', choices=['none', 'lz4', 'zstd']
+    )
+    args = parser.parse_args()
+
+    playback = RecordPlayback(
+        args.path,
+        host=args.host or prop.HOST or 'localhost',
+        speed=args.speed,
+        start=args.start,
+        loop=args.loop,
+        package_size=args.package_size,
+        rebase=not args.original_timestamps,
+        compression=args.compression,
+    )
+    signal.signal(signal.SIGINT, playback.stop)
+    signal.signal(signal.SIGTERM, playback.stop)
+    playback.listen()
+    playback.run()
+    sys.exit(0)
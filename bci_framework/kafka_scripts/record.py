@@ -12,29 +12,396 @@ import signal
 import atexit
 import os
 import sys
-from typing import TypeVar
+import time
+import logging
+from queue import Queue, Full
+from threading import Thread
+from typing import TypeVar, Optional, Literal
 
 if home := os.getenv('BCISTREAM_HOME'):
     sys.stderr = open(os.path.join(home, 'records', 'log.stderr'), 'w')
     sys.stdout = open(os.path.join(home, 'records', 'log.stdout'), 'w')
 
-from datetime import datetime, timedelta
+from datetime import datetime
 from openbci_stream.utils import HDF5Writer
 from openbci_stream.utils.pid_admin import autokill_process
 import numpy as np
+import tables
 
 from bci_framework.extensions.data_analysis import DataAnalysis
 from bci_framework.extensions import properties as prop
 from bci_framework.extensions.data_analysis.utils import loop_consumer
+from bci_framework.extensions.records.segments import write_manifest
+from bci_framework.extensions.records.catalogue import RecordCatalogue
 
 KafkaStream = TypeVar('kafka-stream')
 
 autokill_process(name=f'bci-framework_records')
 
 
+########################################################################
+class ChunkedHDF5Writer(HDF5Writer):
+    """`HDF5Writer` with chunked and compressed arrays.
+
+    The arrays are created before the first append with a chunk shape that
+    fits the blocks written by `RecordWriter`.
+
+    Parameters
+    ----------
+    filename
+        Path where the file will be created.
+    chunk_size
+        Samples per chunk.
+    complevel
+        Compression level, `0` to disable compression.
+    complib
+        Compression library.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(
+        self,
+        filename: str,
+        chunk_size: Optional[int] = 4096,
+        complevel: Optional[int] = 1,
+        complib: Optional[str] = 'blosc:lz4',
+    ) -> None:
+        """"""
+        self.chunk_size = chunk_size
+        if complevel:
+            self.filters = tables.Filters(complevel=complevel, complib=complib)
+        else:
+            self.filters = None
+        super().__init__(filename)
+
+    # ----------------------------------------------------------------------
+    def _create_earray(self, name: str, rows: int, title: str):
+        """"""
+        return self.f.create_earray(
+            self.f.root,
+            name,
+            tables.Float64Atom(),
+            shape=(rows, 0),
+            title=title,
+            filters=self.filters,
+            chunkshape=(rows, self.chunk_size),
+        )
+
+    # ----------------------------------------------------------------------
+    def add_eeg(self, eeg_data: np.ndarray, timestamp: np.ndarray) -> None:
+        """"""
+        if self.array_eeg is None:
+            self.channels = eeg_data.shape[0]
+            self.array_eeg = self._create_earray(
+                'eeg_data', self.channels, 'EEG time series'
+            )
+        if self.array_dtm is None:
+            self.array_dtm = self._create_earray(
+                'timestamp', timestamp.shape[0], 'EEG timestamp'
+            )
+        super().add_eeg(eeg_data, timestamp)
+
+    # ----------------------------------------------------------------------
+    def add_aux(self, aux_data: np.ndarray, timestamp: np.ndarray) -> None:
+        """"""
+        if self.array_aux is None:
+            self.array_aux = self._create_earray(
+                'aux_data', aux_data.shape[0], 'Auxiliar data'
+            )
+        if self.array_aux_dtm is None:
+            self.array_aux_dtm = self._create_earray(
+                'aux_timestamp', timestamp.shape[0], 'AUX timestamp'
+            )
+        super().add_aux(aux_data, timestamp)
+
+    # ----------------------------------------------------------------------
+    def add_sampleid(self, sample_id: np.ndarray) -> None:
+        """"""
+        if self.sample_id is None:
+            self.sample_id = self._create_earray(
+                'sample_id', sample_id.shape[0], 'Sample ID'
+            )
+        super().add_sampleid(sample_id)
+
+
+########################################################################
+class SegmentedWriter:
+    """Split a record in fixed-duration segments.
+
+    Each segment is a complete HDF5 file created with `ChunkedHDF5Writer`,
+    when a segment reach `segment_size` samples is closed and a new one is
+    started. The `manifest.json` of the directory is replaced after each
+    block, so a crash of the recorder only affects the open segment, and the
+    closed ones can be read while the record is still running.
+
+    Parameters
+    ----------
+    dirname
+        Directory for the segments, created if not exists.
+    header
+        Header for each segment.
+    segment_size
+        Samples of EEG per segment.
+    host
+        Host used by `HDF5Writer.add_header`.
+    chunk_size
+        Samples per chunk.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(
+        self,
+        dirname: str,
+        header: dict,
+        segment_size: int,
+        host: Optional[str] = None,
+        chunk_size: Optional[int] = 4096,
+    ):
+        """"""
+        os.makedirs(dirname, exist_ok=True)
+        self.dirname = dirname
+        self.header = header
+        self.segment_size = segment_size
+        self.host = host
+        self.chunk_size = chunk_size
+
+        self.manifest = {
+            'version': 1,
+            'pid': os.getpid(),
+            'closed': False,
+            'header': header,
+            'segment_size': segment_size,
+            'segments': [],
+        }
+        self._open_segment()
+
+    # ----------------------------------------------------------------------
+    @property
+    def f(self):
+        """File handler of the open segment."""
+        return self.segment.f
+
+    # ----------------------------------------------------------------------
+    @property
+    def filename(self) -> str:
+        """Filename of the open segment."""
+        return self.segment.filename
+
+    # ----------------------------------------------------------------------
+    def _open_segment(self) -> None:
+        """"""
+        index = len(self.manifest['segments'])
+        filename = f'segment-{index:04d}.h5'
+        self.segment = ChunkedHDF5Writer(
+            os.path.join(self.dirname, filename), chunk_size=self.chunk_size
+        )
+        self.segment.add_header({**self.header, 'segment': index}, self.host)
+
+        self.manifest['segments'].append(
+            {
+                'filename': filename,
+                'samples': 0,
+                'start': None,
+                'end': None,
+                'closed': False,
+            }
+        )
+        write_manifest(self.dirname, self.manifest)
+
+    # ----------------------------------------------------------------------
+    def _close_segment(self) -> None:
+        """"""
+        self.segment.close()
+        self.manifest['segments'][-1]['closed'] = True
+
+    # ----------------------------------------------------------------------
+    def add_eeg(self, eeg_data: np.ndarray, timestamp: np.ndarray) -> None:
+        """Write an EEG block, rotating the segment if it is full."""
+        current = self.manifest['segments'][-1]
+        if current['samples'] >= self.segment_size:
+            self._close_segment()
+            self._open_segment()
+            current = self.manifest['segments'][-1]
+
+        self.segment.add_eeg(eeg_data, timestamp)
+
+        current['samples'] += eeg_data.shape[1]
+        if current['start'] is None:
+            current['start'] = float(timestamp[0, 0])
+        current['end'] = float(timestamp[0, -1])
+        write_manifest(self.dirname, self.manifest)
+
+    # ----------------------------------------------------------------------
+    def add_aux(self, aux_data: np.ndarray, timestamp: np.ndarray) -> None:
+        """"""
+        self.segment.add_aux(aux_data, timestamp)
+
+    # ----------------------------------------------------------------------
+    def add_sampleid(self, sample_id: np.ndarray) -> None:
+        """"""
+        self.segment.add_sampleid(sample_id)
+
+    # ----------------------------------------------------------------------
+    def add_marker(self, marker, timestamp: float) -> None:
+        """"""
+        self.segment.add_marker(marker, timestamp)
+
+    # ----------------------------------------------------------------------
+    def add_annotation(
+        self, onset: float, duration: int = 0, description: str = ''
+    ) -> None:
+        """"""
+        self.segment.add_annotation(onset, duration, description)
+
+    # ----------------------------------------------------------------------
+    def close(self) -> None:
+        """Close the last segment and mark the record as complete."""
+        self._close_segment()
+        self.manifest['closed'] = True
+        write_manifest(self.dirname, self.manifest)
+
+
+########################################################################
+class StagingBlock:
+    """In-memory block with the packages not written yet."""
+
+    # ----------------------------------------------------------------------
+    def __init__(self):
+        """"""
+        self.clear()
+
+    # ----------------------------------------------------------------------
+    def clear(self) -> None:
+        """"""
+        self.data = []
+        self.timestamp = []
+        self.sample_ids = []
+        self.size = 0
+        self.created = None
+
+    # ----------------------------------------------------------------------
+    def add(
+        self,
+        data: np.ndarray,
+        timestamp: np.ndarray,
+        sample_ids: Optional[np.ndarray] = None,
+    ) -> None:
+        """"""
+        if self.created is None:
+            self.created = time.monotonic()
+        self.data.append(data)
+        self.timestamp.append(timestamp)
+        if sample_ids is not None:
+            self.sample_ids.append(sample_ids)
+        self.size += data.shape[1]
+
+    # ----------------------------------------------------------------------
+    def ready(self, size: int, delay: float) -> bool:
+        """Check the size and time thresholds."""
+        if not self.size:
+            return False
+        return self.size >= size or (time.monotonic() - self.created) >= delay
+
+    # ----------------------------------------------------------------------
+    def pop(self) -> tuple:
+        """Join the staged packages and clear the block."""
+        data = np.concatenate(self.data, axis=1)
+        timestamp = np.concatenate(self.timestamp, axis=1)
+        if self.sample_ids:
+            sample_ids = np.concatenate(self.sample_ids, axis=1)
+        else:
+            sample_ids = None
+        self.clear()
+        return data, timestamp, sample_ids
+
+
+########################################################################
+class RecordWriter(Thread):
+    """Dedicated thread for the disk I/O.
+
+    All the operations over the file are queued, so PyTables is only used
+    from this thread and the consumer never waits for the disk unless the
+    queue is full.
+
+    Parameters
+    ----------
+    writer
+        The HDF5 writer.
+    queue_size
+        Maximum number of pending operations.
+    fsync
+        `'none'` leaves the buffers to PyTables, `'flush'` flush the HDF5
+        buffers after each block and `'fsync'` also forces the OS to write
+        them to disk.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(
+        self,
+        writer: SegmentedWriter,
+        queue_size: Optional[int] = 120,
+        fsync: Literal['none', 'flush', 'fsync'] = 'flush',
+    ):
+        """"""
+        super().__init__(daemon=True)
+        self.writer = writer
+        self.fsync = fsync
+        self.queue = Queue(maxsize=queue_size)
+        self.start()
+
+    # ----------------------------------------------------------------------
+    def put(self, method: str, *args) -> None:
+        """Queue a call to a method of the writer."""
+        try:
+            self.queue.put_nowait((method, args))
+        except Full:
+            logging.warning('Record queue is full, waiting for the disk')
+            self.queue.put((method, args))
+
+    # ----------------------------------------------------------------------
+    def run(self) -> None:
+        """"""
+        while (item := self.queue.get()) is not None:
+            method, args = item
+            try:
+                getattr(self.writer, method)(*args)
+            except Exception as e:
+                logging.error(f'Record: {method} failed: {e}')
+                continue
+
+            if method in ['add_eeg', 'add_aux'] and self.fsync != 'none':
+                self.writer.f.flush()
+                if self.fsync == 'fsync':
+                    fd = os.open(self.writer.filename, os.O_RDONLY)
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+
+        self.writer.close()
+
+    # ----------------------------------------------------------------------
+    def close(self) -> None:
+        """Write the pending operations and close the file."""
+        self.queue.put(None)
+        self.join()
+
+
 ########################################################################
 class RecordTransformer(DataAnalysis):
-    """This consumer is basically an extension."""
+    """This consumer is basically an extension.
+
+    The packages are staged in memory and written by `RecordWriter` in blocks
+    of `block_size` samples, or each `block_time` seconds, the first that
+    happen. The record is a directory with segments of `segment_time`
+    seconds, see `SegmentedWriter`.
+    """
+
+    block_size = 4096
+    block_time = 2
+    segment_time = 60
+    queue_size = 120
+    fsync = 'flush'
 
     # ----------------------------------------------------------------------
     def __init__(self, *args, **kwargs):
@@ -51,8 +418,9 @@ class RecordTransformer(DataAnalysis):
             'records',
         )
         os.makedirs(records_dir, exist_ok=True)
-        filename = os.path.join(records_dir, f'record-{filename}.h5')
-        self.writer = HDF5Writer(filename)
+        self.records_dir = records_dir
+        self.name = f'record-{filename}'
+        dirname = os.path.join(records_dir, self.name)
 
         header = {
             'sample_rate': prop.SAMPLE_RATE,
@@ -62,7 +430,19 @@ class RecordTransformer(DataAnalysis):
             'channels': prop.CHANNELS,
             'channels_by_board': prop.CHANNELS_BY_BOARD,
         }
-        self.writer.add_header(header, prop.HOST)
+        writer = SegmentedWriter(
+            dirname,
+            header,
+            segment_size=int(prop.SAMPLE_RATE * self.segment_time),
+            host=prop.HOST,
+            chunk_size=self.block_size,
+        )
+
+        self.writer = RecordWriter(
+            writer, queue_size=self.queue_size, fsync=self.fsync
+        )
+        self.staging = {'eeg': StagingBlock(), 'aux': StagingBlock()}
+        self.closed = False
 
         signal.signal(signal.SIGINT, self.stop)
         signal.signal(signal.SIGTERM, self.stop)
@@ -72,28 +452,35 @@ class RecordTransformer(DataAnalysis):
 
     # ----------------------------------------------------------------------
     def get_timestamps(self, size, timestamps, topic):
-        """"""
-        timestamp = []
+        """Timestamps for each sample of the package.
 
-        for dt in timestamps:
+        The `timestamp.binary` of each board is the time of the last sample,
+        the previous ones are spaced with the sample rate.
+        """
+        if prop.CONNECTION == 'wifi' and prop.DAISY and topic == 'aux':
+            sample_rate = prop.SAMPLE_RATE * 2
+        else:
+            sample_rate = prop.SAMPLE_RATE
 
-            if prop.CONNECTION == 'wifi' and prop.DAISY and topic == 'aux':
-                end_dt = (
-                    datetime.fromtimestamp(dt)
-                    - timedelta(seconds=size / (prop.SAMPLE_RATE * 2))
-                ).timestamp()
-            else:
-                end_dt = (
-                    datetime.fromtimestamp(dt)
-                    - timedelta(seconds=size / prop.SAMPLE_RATE)
-                ).timestamp()
+        timestamps = np.asarray(timestamps, dtype=float).reshape(-1, 1)
+        return timestamps + (np.arange(size) - size) / sample_rate
 
-            timestamp.append(np.linspace(end_dt, dt, size, endpoint=False))
+    # ----------------------------------------------------------------------
+    def flush(self, topic: str, force: Optional[bool] = False) -> None:
+        """Send the staged block to the writer thread."""
+        block = self.staging[topic]
+        if not block.size:
+            return
+        if not (force or block.ready(self.block_size, self.block_time)):
+            return
 
-        return np.array(timestamp)
+        data, timestamp, sample_ids = block.pop()
+        self.writer.put(f'add_{topic}', data, timestamp)
+        if sample_ids is not None:
+            self.writer.put('add_sampleid', sample_ids)
 
     # ----------------------------------------------------------------------
-    @loop_consumer('eeg', 'aux', 'marker', 'annotation')
+    @loop_consumer('eeg', 'aux', 'marker', 'annotation', shared=False)
     def save_data(
         self, data, kafka_stream: KafkaStream, topic: str, **kwargs
     ) -> None:
@@ -107,7 +494,7 @@ class RecordTransformer(DataAnalysis):
             The topic of the stream.
         """
 
-        if not self.writer.f.isopen:
+        if self.closed:
             return
 
         if topic in ['eeg', 'aux']:
@@ -116,31 +503,48 @@ class RecordTransformer(DataAnalysis):
                 kafka_stream.value['context']['timestamp.binary'],
                 topic,
             )
-            getattr(self.writer, f'add_{topic}')(
-                data, timestamp - prop.OFFSET
-            )
 
             if topic == 'eeg':
-                self.writer.add_sampleid(
-                    np.array(kafka_stream.value['context']['sample_ids'])
+                sample_ids = np.atleast_2d(
+                    kafka_stream.value['context']['sample_ids']
                 )
+            else:
+                sample_ids = None
+
+            self.staging[topic].add(data, timestamp - prop.OFFSET, sample_ids)
 
         elif topic == 'marker':
             dt = kafka_stream.value['datetime']
             marker = kafka_stream.value['marker']
-            self.writer.add_marker(marker, dt)
+            self.writer.put('add_marker', marker, dt)
 
         elif topic == 'annotation':
             onset = kafka_stream.value['onset']
             duration = kafka_stream.value['duration']
             description = kafka_stream.value['description']
-            self.writer.add_annotation(onset, duration, description)
+            self.writer.put('add_annotation', onset, duration, description)
+
+        for topic in self.staging:
+            self.flush(topic)
 
     # ----------------------------------------------------------------------
     def stop(self, *args, **kwargs) -> None:
         """"""
+        if self.closed:
+            return
+        self.closed = True
+
+        for topic in self.staging:
+            self.flush(topic, force=True)
         self.writer.close()
 
+        try:
+            catalogue = RecordCatalogue(self.records_dir)
+            catalogue.update(self.name)
+            catalogue.close()
+        except Exception as e:
+            logging.warning(f'Record not indexed: {e}')
+
 
 if __name__ == '__main__':
     RecordTransformer()
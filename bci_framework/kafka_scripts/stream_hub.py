@@ -0,0 +1,157 @@
+"""
+==========
+Stream hub
+==========
+
+Consume the `eeg` and `aux` streams once and share them with the local
+extensions.
+
+Every package is deserialized a single time and written into a
+`SharedRing`, with the timestamp of each sample. The extensions started by
+the framework with `shared=True` in `loop_consumer` or
+`DataAnalysis.create_buffer` attach to the rings instead of opening their
+own Kafka consumers. The rings are created with the shape of the first
+package, and created again if the shape changes, for example after a new
+connection with other montage.
+
+The framework only starts the hub if it is enabled with the `stream_hub`
+option of the configuration, or if an extension uses `shared=True`.
+
+.. code-block:: bash
+
+    $ python stream_hub.py --host localhost --seconds 60
+"""
+
+import sys
+import signal
+import logging
+import argparse
+from typing import Optional
+
+import numpy as np
+
+from bci_framework.extensions import properties as prop
+from bci_framework.extensions.serializers import consumer
+from bci_framework.extensions.data_analysis.shared_stream import SharedRing
+from bci_framework.extensions.data_analysis.ring_buffer import (
+    TimestampInterpolator,
+)
+
+TOPICS = ['eeg', 'aux']
+
+
+########################################################################
+class StreamHub:
+    """Write the streamed packages into shared memory.
+
+    Parameters
+    ----------
+    host
+        Kafka host.
+    seconds
+        Length of the rings, must cover the largest buffer of the
+        extensions.
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(
+        self, host: Optional[str] = 'localhost', seconds: Optional[int] = 60
+    ):
+        """"""
+        self.host = host
+        self.seconds = seconds
+        self.rings = {}
+        self.interpolators = {}
+
+    # ----------------------------------------------------------------------
+    def ring(self, topic: str, data: np.ndarray, context: dict) -> SharedRing:
+        """The ring for a package, created if the shape does not match."""
+        ring = self.rings.get(topic, None)
+        if ring is not None and ring.channels == data.shape[0]:
+            return ring
+
+        if ring is not None:
+            ring.close()
+
+        sample_rate = prop.SAMPLE_RATE
+        if topic == 'aux' and prop.CONNECTION == 'wifi' and prop.DAISY:
+            sample_rate = sample_rate * 2
+
+        sample_ids = context.get('sample_ids', None)
+        if sample_ids is None:
+            sample_rows = 0
+        else:
+            sample_rows = np.atleast_2d(sample_ids).shape[0]
+
+        self.interpolators[topic] = TimestampInterpolator(sample_rate)
+        self.rings[topic] = SharedRing.create(
+            topic,
+            channels=data.shape[0],
+            length=int(sample_rate * self.seconds),
+            sample_rows=sample_rows,
+            sample_ndim=max(np.ndim(sample_ids), 1),
+        )
+        logging.info(
+            f'Sharing `{topic}` with {data.shape[0]} channels '
+            f'and {self.seconds} seconds'
+        )
+        return self.rings[topic]
+
+    # ----------------------------------------------------------------------
+    def run(self) -> None:
+        """Consume the streams until `stop`."""
+        try:
+            with consumer(TOPICS, self.host) as stream:
+                for message in stream:
+                    self.write(message)
+        finally:
+            self.close()
+
+    # ----------------------------------------------------------------------
+    def write(self, message) -> None:
+        """Write a package in the ring of its topic.
+
+        The timestamps are corrected with the clock offset, in the same way
+        as `loop_consumer` does with the local buffers.
+        """
+        data = np.asarray(message.value['data'])
+        context = message.value['context']
+        sample_ids = context.get('sample_ids', None)
+
+        ring = self.ring(message.topic, data, context)
+        timestamps = self.interpolators[message.topic](
+            data.shape[1],
+            min(context['timestamp.binary']) - prop.OFFSET,
+            sample_ids,
+        )
+        ring.write(
+            data,
+            timestamps,
+            context['timestamp.binary'],
+            message.timestamp,
+            sample_ids,
+        )
+
+    # ----------------------------------------------------------------------
+    def stop(self, *args, **kwargs) -> None:
+        """Interrupt the consumer, the rings are removed on exit."""
+        sys.exit(0)
+
+    # ----------------------------------------------------------------------
+    def close(self) -> None:
+        """Remove the rings, the attached extensions detach from them."""
+        for ring in self.rings.values():
+            ring.close()
+        self.rings = {}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stream hub')
+    parser.add_argument('--host', default=None)
+    parser.add_argument('--seconds', type=int, default=60)
+    args = parser.parse_args()
+
+    hub = StreamHub(host=args.host or prop.HOST, seconds=args.seconds)
+    signal.signal(signal.SIGINT, hub.stop)
+    signal.signal(signal.SIGTERM, hub.stop)
+    hub.run()
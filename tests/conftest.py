@@ -0,0 +1,23 @@
+"""
+The properties of the extensions are read from the environ, set by the
+framework when an extension is started. These are the values used by the
+tests, unless they are already defined.
+"""
+
+import os
+import json
+
+ENVIRON = {
+    'CHANNELS': {'1': 'Fp1', '2': 'Fp2', '3': 'C3', '4': 'C4'},
+    'SAMPLE_RATE': 1000,
+    'STREAMING_PACKAGE_SIZE': 100,
+    'BOARDMODE': 'default',
+    'CONNECTION': 'wifi',
+    'DAISY': False,
+    'OFFSET': 0,
+    'RASPAD': False,
+    'HOST': 'localhost',
+}
+
+for key, value in ENVIRON.items():
+    os.environ.setdefault(f'BCISTREAM_{key}', json.dumps(value))
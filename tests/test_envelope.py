@@ -0,0 +1,128 @@
+"""
+========
+Envelope
+========
+"""
+
+import numpy as np
+import pytest
+
+from bci_framework.extensions.data_analysis.ring_buffer import RingBuffer
+from bci_framework.extensions.data_analysis.envelope import (
+    EnvelopePyramid,
+    envelope,
+    interleave,
+    pixel_edges,
+)
+
+
+# ----------------------------------------------------------------------
+def naive(x, start, stop, width):
+    """Reduce every sample of each pixel."""
+    edges = pixel_edges(start, stop, width)
+    pixels = [x[..., a:b] for a, b in zip(edges[:-1], edges[1:])]
+    minimum = [pixel.min(axis=-1) for pixel in pixels]
+    maximum = [pixel.max(axis=-1) for pixel in pixels]
+    return np.stack(minimum, axis=-1), np.stack(maximum, axis=-1)
+
+
+# ----------------------------------------------------------------------
+def test_pixel_edges():
+    np.testing.assert_array_equal(
+        pixel_edges(10, 20, 5), [10, 12, 14, 16, 18, 20]
+    )
+    # Never more pixels than samples
+    np.testing.assert_array_equal(pixel_edges(0, 3, 10), [0, 1, 2, 3])
+
+
+# ----------------------------------------------------------------------
+def test_envelope_of_a_window():
+    x = np.random.default_rng(0).standard_normal((3, 1000))
+    for width in [1, 7, 333, 1000, 5000]:
+        minimum, maximum = envelope(x, width)
+        expected = naive(x, 0, 1000, width)
+        np.testing.assert_array_equal(minimum, expected[0])
+        np.testing.assert_array_equal(maximum, expected[1])
+
+
+# ----------------------------------------------------------------------
+def test_interleave():
+    minimum, maximum = np.zeros((2, 3)), np.ones((2, 3))
+    np.testing.assert_array_equal(
+        interleave(minimum, maximum)[0], [0, 1] * 3
+    )
+
+
+# ----------------------------------------------------------------------
+@pytest.mark.parametrize('factor', [2, 4, 7])
+def test_pyramid_of_a_record(factor):
+    rng = np.random.default_rng(1)
+    x = rng.standard_normal((2, 10000))
+    pyramid = EnvelopePyramid(x, factor)
+
+    ranges = [(0, 10000, 800), (13, 9001, 640), (5000, 5003, 100)]
+    ranges += [
+        (a, a + n, w)
+        for a, n, w in zip(
+            rng.integers(0, 5000, 20),
+            rng.integers(1, 5000, 20),
+            rng.integers(1, 1000, 20),
+        )
+    ]
+    for start, stop, width in ranges:
+        minimum, maximum = pyramid.envelope(start, stop, width)
+        expected = naive(x, start, stop, width)
+        np.testing.assert_array_equal(minimum, expected[0])
+        np.testing.assert_array_equal(maximum, expected[1])
+
+
+# ----------------------------------------------------------------------
+def test_pyramid_range_out_of_the_record():
+    x = np.arange(100.0)
+    pyramid = EnvelopePyramid(x)
+
+    minimum, maximum = pyramid.envelope(-50, 50, 10)
+    np.testing.assert_array_equal(minimum, np.arange(0, 50, 5))
+    np.testing.assert_array_equal(maximum, np.arange(4, 50, 5))
+
+    minimum, maximum = pyramid.envelope(200, 300, 10)
+    assert minimum.shape == maximum.shape == (0,)
+
+
+# ----------------------------------------------------------------------
+@pytest.mark.parametrize(
+    'sizes',
+    [
+        [100] * 40,
+        [7, 333, 1, 64, 999, 250, 3] * 4,
+        [1500, 3000, 20, 20],
+    ],
+)
+def test_pyramid_of_a_buffer(sizes):
+    rng = np.random.default_rng(2)
+    ring = RingBuffer(3, 1000)
+    pyramid = EnvelopePyramid(ring)
+    history = np.empty((3, 0))
+
+    for size in sizes:
+        data = rng.standard_normal((3, size))
+        ring.write(data)
+        history = np.concatenate([history, data], axis=-1)
+
+        minimum, maximum = pyramid.last(1000, 300)
+        first, end = pyramid.bounds
+        assert end == ring.written
+        assert first == end - ring.length
+
+        # The fill of the buffer is the oldest part of the view
+        x = np.concatenate([np.zeros((3, 1000)), history], axis=-1)
+        expected = naive(x, end, end + 1000, 300)
+        np.testing.assert_array_equal(minimum, expected[0])
+        np.testing.assert_array_equal(maximum, expected[1])
+
+        start = end - int(rng.integers(1, 1000))
+        stop = min(end, start + int(rng.integers(1, 1000)))
+        minimum, maximum = pyramid.envelope(start, stop, 64)
+        expected = naive(x, start + 1000, stop + 1000, 64)
+        np.testing.assert_array_equal(minimum, expected[0])
+        np.testing.assert_array_equal(maximum, expected[1])
@@ -0,0 +1,172 @@
+"""
+==============
+Marker Slicing
+==============
+
+The Kafka stream is replaced by a list of messages, so the decorated
+methods return when all of them are consumed.
+"""
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from bci_framework.extensions.data_analysis import utils
+from bci_framework.extensions.data_analysis import DataAnalysis, marker_slicing
+
+T0 = 1.6e9
+PACKAGE = 100
+SAMPLE_RATE = 1000
+CHANNELS = 4
+
+
+# ----------------------------------------------------------------------
+def eeg_message(k):
+    """The package `k`, the samples contain their absolute positions."""
+    positions = np.arange(k * PACKAGE, (k + 1) * PACKAGE)
+    return SimpleNamespace(
+        topic='eeg',
+        timestamp=0,
+        value={
+            'data': np.tile(positions.astype(float), (CHANNELS, 1)),
+            'context': {
+                'timestamp.binary': [T0 + positions[-1] / SAMPLE_RATE],
+                'sample_ids': positions[None] % 256,
+            },
+        },
+    )
+
+
+# ----------------------------------------------------------------------
+def marker_message(marker, position):
+    """A marker at the time of a sample."""
+    return SimpleNamespace(
+        topic='marker',
+        timestamp=0,
+        value={'marker': marker, 'datetime': T0 + position / SAMPLE_RATE},
+    )
+
+
+# ----------------------------------------------------------------------
+def run(monkeypatch, messages, batch=False, **kwargs):
+    """Consume the messages and return the calls of the decorated method."""
+    monkeypatch.setattr(
+        utils,
+        '_stream_batches',
+        lambda *args: iter([message] for message in messages),
+    )
+    calls = []
+
+    class Analysis(DataAnalysis):
+        def __init__(self):
+            super().__init__()
+            self.create_buffer(2)
+            self.slicing()
+
+        @marker_slicing(['Right', 'Left'], batch=batch, **kwargs)
+        def slicing(self, eeg, aux, timestamp, marker):
+            calls.append((eeg, aux, timestamp, marker))
+
+    Analysis()
+    return calls
+
+
+# ----------------------------------------------------------------------
+def test_every_marker_is_sliced(monkeypatch):
+    messages = [eeg_message(k) for k in range(5)]
+    messages += [
+        marker_message('Right', 320),
+        marker_message('Ignored', 330),
+        marker_message('Left', 350),
+    ]
+    messages += [eeg_message(k) for k in range(5, 10)]
+    calls = run(monkeypatch, messages, t0=-0.1, duration=0.3)
+
+    assert [marker for *_, marker in calls] == ['Right', 'Left']
+    for (eeg, aux, timestamp, _), position in zip(calls, [320, 350]):
+        expected = np.arange(position - 100, position + 200)
+        assert eeg.shape == (CHANNELS, 300)
+        np.testing.assert_array_equal(eeg[0], expected)
+        np.testing.assert_allclose(
+            timestamp, T0 + expected / SAMPLE_RATE, rtol=0, atol=1e-6
+        )
+        # The AUX is not streamed
+        assert aux.shape[-1] == 0
+
+
+# ----------------------------------------------------------------------
+def test_marker_waits_for_the_whole_window(monkeypatch):
+    messages = [eeg_message(k) for k in range(5)]
+    messages += [marker_message('Right', 450)]
+    # The window ends at 650, not available until the package 6
+    messages += [eeg_message(5)]
+    assert not run(monkeypatch, messages, t0=0, t1=0.2)
+
+    messages += [eeg_message(6)]
+    calls = run(monkeypatch, messages, t0=0, t1=0.2)
+    assert len(calls) == 1
+    np.testing.assert_array_equal(calls[0][0][0], np.arange(450, 650))
+
+
+# ----------------------------------------------------------------------
+def test_batch_of_markers(monkeypatch):
+    messages = [eeg_message(k) for k in range(5)]
+    messages += [marker_message('Right', p) for p in (460, 470, 480)]
+    # All the windows are completed with the package 5
+    messages += [eeg_message(k) for k in range(5, 8)]
+    calls = run(monkeypatch, messages, batch=True, t0=-0.05, duration=0.1)
+
+    assert len(calls) == 1
+    eeg, aux, timestamp, marker = calls[0]
+    assert marker == ['Right'] * 3
+    assert eeg.shape == (3, CHANNELS, 100)
+    assert timestamp.shape == (3, 100)
+    for epoch, position in zip(eeg, (460, 470, 480)):
+        np.testing.assert_array_equal(
+            epoch[0], np.arange(position - 50, position + 50)
+        )
+
+
+# ----------------------------------------------------------------------
+def test_markers_older_than_the_buffer_are_dropped(monkeypatch, caplog):
+    messages = [eeg_message(k) for k in range(30)]
+    # The buffer retains the last 2 seconds, from the sample 1000
+    messages += [
+        marker_message('Right', 500),
+        marker_message('Left', 2500),
+    ]
+    messages += [eeg_message(k) for k in range(30, 32)]
+    calls = run(monkeypatch, messages, t0=0, duration=0.1)
+
+    assert [marker for *_, marker in calls] == ['Left']
+    assert 'Date too old to synchronize' in caplog.text
+
+
+# ----------------------------------------------------------------------
+@pytest.mark.parametrize('position, sliced', [(100, True), (99, False)])
+def test_marker_at_the_oldest_sample(monkeypatch, position, sliced):
+    # The buffer retains the samples from 100 to 2099
+    messages = [eeg_message(k) for k in range(21)]
+    messages += [marker_message('Right', position)]
+    calls = run(monkeypatch, messages, t0=0, duration=0.1)
+
+    assert len(calls) == sliced
+    if sliced:
+        np.testing.assert_array_equal(
+            calls[0][0][0], np.arange(position, position + 100)
+        )
+
+
+# ----------------------------------------------------------------------
+def test_packages_without_sample_ids(monkeypatch):
+    messages = [eeg_message(k) for k in range(5)]
+    messages += [marker_message('Right', 450)]
+    messages += [eeg_message(k) for k in range(5, 7)]
+    for message in messages:
+        if message.topic == 'eeg':
+            del message.value['context']['sample_ids']
+    calls = run(monkeypatch, messages, t0=0, duration=0.1)
+
+    assert len(calls) == 1
+    np.testing.assert_array_equal(calls[0][0][0], np.arange(450, 550))
@@ -0,0 +1,106 @@
+"""
+==========
+Resampling
+==========
+"""
+
+import numpy as np
+import pytest
+
+from bci_framework.extensions.data_analysis.ring_buffer import RingBuffer
+from bci_framework.extensions.data_analysis.resampling import (
+    Decimator,
+    decimate,
+    lowpass,
+)
+
+
+# ----------------------------------------------------------------------
+def tone(frequency, samples, sample_rate=1000):
+    """A sinusoid of unit amplitude."""
+    return np.sin(2 * np.pi * frequency * np.arange(samples) / sample_rate)
+
+
+# ----------------------------------------------------------------------
+def test_lowpass():
+    taps = lowpass(4)
+    assert taps.size == 16 * 4 + 1
+    np.testing.assert_allclose(taps, taps[::-1])
+    np.testing.assert_allclose(taps.sum(), 1)
+    np.testing.assert_array_equal(lowpass(1), [1])
+
+
+# ----------------------------------------------------------------------
+def test_decimate_keeps_the_band_and_rejects_the_aliases():
+    x = np.stack([tone(10, 4000), tone(240, 4000)])
+    y = decimate(x, 4)
+
+    # New Nyquist at 125 Hz, the 240 Hz tone would alias to 10 Hz
+    assert y.shape == (2, 1000)
+    steady = y[:, 100:]
+    assert np.abs(steady[0]).max() == pytest.approx(1, abs=0.01)
+    assert np.abs(steady[1]).max() < 0.01
+
+
+# ----------------------------------------------------------------------
+def test_decimate_is_aligned_with_the_last_sample():
+    x = np.arange(1000.0)
+    y = decimate(x, 5, width=50)
+
+    # A ramp is only delayed by the half of the filter
+    delay = (lowpass(5).size - 1) / 2
+    np.testing.assert_allclose(y[-1], 999 - delay)
+    np.testing.assert_allclose(np.diff(y[20:]), 5)
+
+
+# ----------------------------------------------------------------------
+@pytest.mark.parametrize(
+    'sizes',
+    [
+        [100] * 30,
+        [7, 33, 250, 1, 99, 400, 64, 3] * 3,
+        [2500, 100, 1200],
+    ],
+)
+def test_decimator_matches_decimate(sizes):
+    rng = np.random.default_rng(0)
+    ring = RingBuffer(3, 1000)
+    decimator = Decimator(ring, 4, 250)
+    margin = decimator.taps.size // 4 + 1
+
+    for size in sizes:
+        ring.write(rng.standard_normal((3, size)))
+        decimator.update()
+
+        # Aligned when the last output is the last sample
+        if ring.written % 4 == 0 and ring.written >= ring.length:
+            expected = decimate(ring.view(), 4, 250)
+            np.testing.assert_allclose(
+                decimator.view()[:, margin:], expected[:, margin:]
+            )
+
+
+# ----------------------------------------------------------------------
+def test_decimator_updates_without_new_samples():
+    ring = RingBuffer(None, 400)
+    decimator = Decimator(ring, 2, 200)
+    ring.write(np.arange(400.0))
+
+    first = decimator.view().copy()
+    np.testing.assert_array_equal(decimator.view(), first)
+    assert decimator.output.written == 200
+
+
+# ----------------------------------------------------------------------
+def test_decimated_timestamps_are_delayed():
+    ring = RingBuffer(None, 1000)
+    decimator = Decimator(ring, 10, 100)
+    delay = (decimator.taps.size - 1) / 2
+
+    for k in range(25):
+        ring.write(np.arange(k * 100, (k + 1) * 100, dtype=float))
+        decimator.update()
+
+    # The outputs are the positions 9, 19, ..., 2499
+    positions = np.arange(2409, 2500, 10)
+    np.testing.assert_allclose(decimator.view()[-10:], positions - delay)
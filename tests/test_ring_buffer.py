@@ -0,0 +1,221 @@
+"""
+===========
+Ring Buffer
+===========
+"""
+
+import numpy as np
+import pytest
+
+from bci_framework.extensions.data_analysis.ring_buffer import (
+    RingBuffer,
+    PackageAggregator,
+    TimestampIndex,
+    take_windows,
+    tile_pattern,
+)
+
+
+# ----------------------------------------------------------------------
+def write_packages(ring, sizes, channels=3, seed=0):
+    """Write random packages and return all the samples written."""
+    rng = np.random.default_rng(seed)
+    shape = () if channels is None else (channels,)
+    history = [np.empty(shape + (0,))]
+    for size in sizes:
+        data = rng.standard_normal(shape + (size,))
+        ring.write(data)
+        history.append(data)
+    return np.concatenate(history, axis=-1)
+
+
+# ----------------------------------------------------------------------
+@pytest.mark.parametrize(
+    'sizes',
+    [
+        [10] * 25,
+        [7, 13, 29, 1, 50, 3],
+        [99, 100, 101],
+        [250],
+        [30, 70, 0, 100, 31],
+    ],
+)
+def test_view_returns_the_last_samples(sizes):
+    ring = RingBuffer(3, 100)
+    history = write_packages(ring, sizes)
+
+    assert ring.written == history.shape[-1]
+    assert ring.cursor == ring.written % ring.length
+    assert ring.view().shape == (3, 100)
+    tail = history[..., -100:]
+    np.testing.assert_array_equal(ring.view()[..., -tail.shape[-1] :], tail)
+    np.testing.assert_array_equal(ring.view(40), history[..., -40:])
+    np.testing.assert_array_equal(np.asarray(ring)[..., -1], history[..., -1])
+
+
+# ----------------------------------------------------------------------
+def test_view_before_the_buffer_is_full():
+    ring = RingBuffer(2, 50, fill=np.nan)
+    history = write_packages(ring, [20], channels=2)
+
+    view = ring.view()
+    assert np.isnan(view[..., :30]).all()
+    np.testing.assert_array_equal(view[..., 30:], history)
+
+
+# ----------------------------------------------------------------------
+def test_view_with_end_does_not_move():
+    ring = RingBuffer(3, 100)
+    history = write_packages(ring, [60, 60])
+    written = ring.written
+
+    # Samples written after the position was read
+    history = np.concatenate(
+        [history, write_packages(ring, [30], seed=1)], axis=-1
+    )
+
+    np.testing.assert_array_equal(
+        ring.view(20, written), history[..., written - 20 : written]
+    )
+    np.testing.assert_array_equal(
+        ring.view(end=ring.written), ring.view()
+    )
+    # The oldest window still retained
+    np.testing.assert_array_equal(
+        ring.view(70, written), history[..., written - 70 : written]
+    )
+
+
+# ----------------------------------------------------------------------
+def test_view_is_updated_in_place():
+    ring = RingBuffer(None, 10)
+    write_packages(ring, [10], channels=None)
+    view = ring.view()
+    snapshot = view.copy()
+
+    ring.write(np.arange(3.0))
+    # The views share the memory of the buffer
+    assert np.shares_memory(view, ring.view())
+    assert not np.array_equal(view, snapshot)
+    np.testing.assert_array_equal(ring.view()[:-3], snapshot[3:])
+    np.testing.assert_array_equal(ring.view()[-3:], [0, 1, 2])
+
+
+# ----------------------------------------------------------------------
+def test_one_dimensional_buffer():
+    ring = RingBuffer(None, 64, dtype=np.float32)
+    history = write_packages(ring, [17, 40, 33], channels=None)
+
+    assert ring.shape == (64,)
+    assert len(ring) == 64
+    assert ring.view().dtype == np.float32
+    np.testing.assert_allclose(ring.view(), history[-64:], rtol=1e-6)
+
+
+# ----------------------------------------------------------------------
+def test_mirror_follows_the_samples():
+    ring = RingBuffer(None, 8)
+    pattern = tile_pattern(np.arange(8))
+    reference = np.arange(8.0)
+    ring.write(reference)
+
+    for n in [3, 5, 8, 1, 12]:
+        data = np.arange(ring.written, ring.written + n) % 8
+        ring.write(data.astype(float))
+        np.testing.assert_array_equal(ring.mirror(pattern), ring.view())
+
+
+# ----------------------------------------------------------------------
+def test_package_aggregator():
+    aggregator = PackageAggregator(100)
+    history = np.arange(370.0)[None]
+
+    chunks = []
+    for start, stop in [(0, 30), (30, 150), (150, 370)]:
+        chunks += aggregator.push(history[..., start:stop])
+
+    assert [chunk.shape[-1] for chunk in chunks] == [100, 100, 100]
+    np.testing.assert_array_equal(
+        np.concatenate(chunks, axis=-1), history[..., :300]
+    )
+
+
+# ----------------------------------------------------------------------
+def timestamps_ring(written, length=500, sample_rate=1000, t0=100):
+    """A buffer with the timestamps of `written` samples."""
+    ring = RingBuffer(None, length)
+    ring.write(t0 + np.arange(written) / sample_rate)
+    return ring
+
+
+# ----------------------------------------------------------------------
+def test_timestamp_index_locates_the_samples():
+    ring = timestamps_ring(1200)
+    index = TimestampIndex(ring, 1000)
+    index.update()
+
+    positions = np.array([700, 950.5, 1199])
+    np.testing.assert_allclose(index.locate(100 + positions / 1000), positions)
+    np.testing.assert_allclose(
+        index.timestamp(positions), 100 + positions / 1000
+    )
+
+
+# ----------------------------------------------------------------------
+def test_timestamp_index_extrapolates_out_of_the_buffer():
+    ring = timestamps_ring(1200)
+    index = TimestampIndex(ring, 1000)
+    index.update()
+
+    # Overwritten samples and samples not written yet
+    positions = np.array([100, 699, 1200, 1500])
+    np.testing.assert_allclose(index.locate(100 + positions / 1000), positions)
+
+
+# ----------------------------------------------------------------------
+def test_timestamp_index_uses_the_samples_of_the_update():
+    ring = timestamps_ring(300)
+    index = TimestampIndex(ring, 1000)
+    assert np.isnan(index.locate([100.1])).all()
+
+    index.update()
+    assert index.written == 300
+    ring.write(np.full(50, 0.0))  # not used until the next update
+    np.testing.assert_allclose(index.locate([100.25, 100.32]), [250, 320])
+
+    index.update()
+    assert index.written == 350
+
+
+# ----------------------------------------------------------------------
+def test_timestamp_index_with_a_single_sample():
+    ring = timestamps_ring(1)
+    index = TimestampIndex(ring, 1000)
+    index.update()
+    np.testing.assert_allclose(index.locate([100, 100.01]), [0, 10])
+
+
+# ----------------------------------------------------------------------
+def test_take_windows():
+    ring = RingBuffer(2, 100)
+    history = write_packages(ring, [80, 80], channels=2)
+
+    windows = take_windows(ring, [60, 100, 140], 20)
+    assert windows.shape == (3, 2, 20)
+    for window, start in zip(windows, [60, 100, 140]):
+        np.testing.assert_array_equal(window, history[:, start : start + 20])
+
+
+# ----------------------------------------------------------------------
+def test_take_windows_at_a_fixed_position():
+    ring = RingBuffer(None, 100)
+    history = write_packages(ring, [150], channels=None)
+    written = ring.written
+    history = np.concatenate(
+        [history, write_packages(ring, [30], channels=None, seed=1)]
+    )
+
+    windows = take_windows(ring, [80, 130], 20, written)
+    assert windows.shape == (2, 20)
+    np.testing.assert_array_equal(windows[0], history[80:100])
+    np.testing.assert_array_equal(windows[1], history[130:150])
@@ -0,0 +1,179 @@
+"""
+===========
+Serializers
+===========
+"""
+
+import pickle
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from bci_framework.extensions import serializers
+from bci_framework.extensions.serializers import (
+    MAGIC,
+    encode_stream,
+    decode_stream,
+    peek,
+    serialize,
+    deserialize,
+)
+
+
+# ----------------------------------------------------------------------
+def package(channels=4, samples=100, sample_ids=True, seed=0):
+    """An `eeg` package as the acquisition server creates it."""
+    rng = np.random.default_rng(seed)
+    context = {
+        'timestamp.binary': [1.6e9 + 0.1, 1.6e9 + 0.2],
+        'daisy': False,
+        'montage': {'1': 'Fp1', '2': 'Fp2'},
+    }
+    if sample_ids:
+        context['sample_ids'] = np.arange(samples)[None] % 256
+    return {
+        'context': context,
+        'data': rng.standard_normal((channels, samples)) * 1e3,
+    }
+
+
+# ----------------------------------------------------------------------
+def compressions():
+    """The compressions available in this environment."""
+    available = ['none', 'gzip']
+    if serializers.lz4 is not None:
+        available.append('lz4')
+    if serializers.zstandard is not None:
+        available.append('zstd')
+    return available
+
+
+# ----------------------------------------------------------------------
+@pytest.mark.parametrize('compression', compressions())
+def test_roundtrip(compression):
+    value = package()
+    frame = encode_stream(value, compression)
+    decoded = decode_stream(frame)
+
+    assert frame[:4] == MAGIC
+    assert decoded['data'].shape == (4, 100)
+    np.testing.assert_array_equal(
+        decoded['data'], value['data'].astype(np.float32)
+    )
+    np.testing.assert_array_equal(
+        decoded['context']['sample_ids'], value['context']['sample_ids']
+    )
+    assert (
+        decoded['context']['timestamp.binary']
+        == value['context']['timestamp.binary']
+    )
+    assert decoded['context']['montage'] == value['context']['montage']
+    assert decoded['context']['daisy'] is False
+
+
+# ----------------------------------------------------------------------
+def test_the_input_is_not_modified():
+    value = package()
+    context = value['context'].copy()
+    encode_stream(value)
+    assert value['context'].keys() == context.keys()
+
+
+# ----------------------------------------------------------------------
+def test_decoded_data_is_read_only():
+    decoded = decode_stream(encode_stream(package()))
+    with pytest.raises(ValueError):
+        decoded['data'][0, 0] = 0
+
+
+# ----------------------------------------------------------------------
+def test_optional_context():
+    value = package(sample_ids=False)
+    del value['context']['timestamp.binary']
+    decoded = decode_stream(encode_stream(value))
+
+    assert 'sample_ids' not in decoded['context']
+    assert 'timestamp.binary' not in decoded['context']
+
+
+# ----------------------------------------------------------------------
+def test_sample_ids_keep_the_shape_of_the_boards():
+    value = package()
+    value['context']['sample_ids'] = np.arange(200).reshape(2, 100)
+    decoded = decode_stream(encode_stream(value))
+
+    assert decoded['context']['sample_ids'].shape == (2, 100)
+
+
+# ----------------------------------------------------------------------
+@pytest.mark.parametrize('shape', [(8, 0), (1, 1), (16, 2000)])
+def test_package_shapes(shape):
+    value = package(*shape)
+    decoded = decode_stream(encode_stream(value, 'gzip'))
+    assert decoded['data'].shape == shape
+
+
+# ----------------------------------------------------------------------
+@pytest.mark.parametrize('compression', compressions())
+def test_peek_reads_only_the_header(compression):
+    value = package()
+    status = peek(encode_stream(value, compression))
+
+    assert status['shape'] == (4, 100)
+    assert status['context'] == {
+        'timestamp.binary': value['context']['timestamp.binary']
+    }
+
+
+# ----------------------------------------------------------------------
+def test_peek_pickled_packages():
+    value = package()
+    status = peek(pickle.dumps(value))
+
+    assert status['shape'] == (4, 100)
+    assert status['context']['daisy'] is False
+
+
+# ----------------------------------------------------------------------
+def test_other_values_are_pickled():
+    values = [
+        {'marker': 'Right', 'datetime': 1.6e9},
+        'command',
+        {'data': np.zeros(10), 'context': {}},
+    ]
+    for value in values:
+        frame = serialize(value)
+        assert frame[:4] != MAGIC
+        assert str(deserialize(frame)) == str(value)
+
+
+# ----------------------------------------------------------------------
+def test_context_not_serializable_with_json_is_pickled():
+    value = package()
+    value['context']['created'] = datetime(2021, 1, 1)
+    frame = serialize(value)
+
+    assert frame[:4] != MAGIC
+    decoded = deserialize(frame)
+    assert decoded['context']['created'] == datetime(2021, 1, 1)
+    np.testing.assert_array_equal(decoded['data'], value['data'])
+
+
+# ----------------------------------------------------------------------
+def test_unavailable_compression_is_not_used(monkeypatch):
+    monkeypatch.setattr(serializers, 'lz4', None)
+    frame = encode_stream(package(), 'lz4')
+
+    assert frame[5] == serializers.COMPRESSIONS.index('none')
+    assert decode_stream(frame)['data'].shape == (4, 100)
+
+
+# ----------------------------------------------------------------------
+def test_unavailable_compression_is_reported_once(monkeypatch, caplog):
+    monkeypatch.setattr(serializers, 'lz4', None)
+    monkeypatch.setattr(serializers, '_WARNED', set())
+    for _ in range(3):
+        encode_stream(package(), 'lz4')
+
+    assert caplog.text.count("'lz4' is not available") == 1
@@ -0,0 +1,42 @@
+"""
+========
+Spectral
+========
+"""
+
+import numpy as np
+import pytest
+from scipy import signal
+
+from bci_framework.extensions.data_analysis.spectral import (
+    band_power,
+    welch,
+)
+
+
+# ----------------------------------------------------------------------
+@pytest.mark.parametrize('scaling', ['density', 'spectrum'])
+@pytest.mark.parametrize('nperseg', [64, 250, 255])
+def test_welch_matches_scipy(scaling, nperseg):
+    x = np.random.default_rng(0).standard_normal((3, 1000))
+    freqs, psd = welch(x, 250, nperseg, scaling=scaling)
+    expected = signal.welch(x, 250, nperseg=nperseg, scaling=scaling)
+
+    np.testing.assert_allclose(freqs, expected[0])
+    np.testing.assert_allclose(psd, expected[1], atol=1e-12)
+
+
+# ----------------------------------------------------------------------
+def test_welch_of_a_window_shorter_than_the_segments():
+    x = np.random.default_rng(1).standard_normal((2, 500))
+    with pytest.warns(UserWarning):
+        freqs, psd = welch(x, 1000, 1000, scaling='spectrum')
+    with pytest.warns(UserWarning):
+        expected = signal.welch(x, 1000, nperseg=1000, scaling='spectrum')
+
+    np.testing.assert_allclose(freqs, expected[0])
+    np.testing.assert_allclose(psd, expected[1], atol=1e-12)
+
+    # The bins of the segments actually used
+    power = band_power(psd, 500, 1000, [(8, 12), (13, 30)])
+    assert power.shape == (2, 2)